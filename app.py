@@ -1,261 +1,394 @@
+import atexit
 import os
-from cs50 import SQL
-from flask import Flask, flash, redirect, render_template, request, url_for
-from flask_session import Session
-from datetime import datetime
+import click
+import hashlib
+import io
+from datetime import date, timedelta
+from flask import Flask, abort, flash, g, has_app_context, jsonify, redirect, render_template, request, stream_with_context, url_for
+
+import archive
+import catalog
+import database
+import engagement
+import exporter
+import importer
+import instrumentation
+import migrations
+import pagination
+import precompute
+import read_models
+import rows
+import search
+import sessions
+import sharding
+from helpers import format_date_pt
 
 # Configuração do Aplicativo Flask
 app = Flask(__name__)
 
-# Configuração de Sessão
+# Inicialização do Banco de Dados
+DATABASE = os.environ.get("SALES_DB", "sales.db")
+
+# Modo particionado (SALES_SHARD_DIR, ver sharding.py): `db` encaminha cada pedido para o
+# shard do seu utilizador; as lookups e as sessões vivem no catálogo (`catalog_db`).
+SHARD_DIR = os.environ.get("SALES_SHARD_DIR") or None
+DATABASE_PATHS = sharding.paths(SHARD_DIR) if SHARD_DIR else [DATABASE]
+
+# As migrações aplicam-se com `flask migrate` (ou no arranque, com SALES_MIGRATE=1): importar
+# a app não altera a base de dados, apenas avisa se houver migrações por aplicar.
+for path in DATABASE_PATHS:
+    if os.environ.get("SALES_MIGRATE", "") not in ("", "0"):
+        migrations.migrate(path)
+        continue
+    pending = migrations.pending(path)
+    if pending:
+        app.logger.warning(f"{path}: migrações por aplicar {pending} (corra `flask migrate`)")
+db = sharding.ShardRouter(SHARD_DIR) if SHARD_DIR else database.Database(DATABASE)
+catalog_db = db.catalog if SHARD_DIR else db
+
+# Escritas das rotas agrupadas em transações partilhadas (SALES_GROUP_COMMIT=0 desliga)
+if os.environ.get("SALES_GROUP_COMMIT", "1") not in ("", "0"):
+    db.enable_group_commit()
+
+# Sessões (só para as mensagens de flash): criadas apenas quando algo é guardado (ver sessions.py)
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+sessions.init_app(app, catalog_db)
+
+
+@app.before_request
+def route_to_shard():
+    """Modo particionado: encaminha o pedido para o shard do utilizador (`user_id` no URL ou no formulário)."""
+    if SHARD_DIR is None:
+        return
+    user_id = (request.view_args or {}).get("user_id") or request.values.get("user_id")
+    if str(user_id).isdigit():
+        db.route(user_id)
+
+
+@app.errorhandler(sharding.ShardingError)
+def shard_not_routed(error):
+    """Pedido sem utilizador numa rota que lê ou escreve dados de um utilizador (modo particionado)."""
+    return str(error), 400
+
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Devolve a ligação da thread ao pool no fim de cada pedido."""
+    db.release()
 
-# Inicialização do Banco de Dados
-db = SQL("sqlite:///sales.db")
+
+# Instrumentação opcional (SALES_METRICS / SALES_SLOW_REQUEST_MS): métricas em /metrics
+instrumentation_hooks = instrumentation.init_app(app, db)
+
+# Catálogo de lookups em memória (invalidado pelo contador de versão na DB)
+lookup_catalog = catalog.LookupCatalog(catalog_db)
 
 # --- Funções Auxiliares de Consulta ---
 
 def get_all_lookups():
-    """Recupera todos os dados de lookup (produtos, marcas, etc.)."""
-    return {
-        "users": db.execute("SELECT id, name FROM users ORDER BY name"),
-        "products": db.execute("SELECT id, name FROM products ORDER BY name"),
-        "brands": db.execute("SELECT id, name FROM brands ORDER BY name"),
-        "sizes": db.execute("SELECT id, name FROM sizes ORDER BY name"),
-        "colors": db.execute("SELECT id, name FROM colors ORDER BY name"),
-    }
-
-def calculate_days_diff(start_date_str, end_date_str=None):
+    """Recupera todos os dados de lookup (produtos, marcas, etc.) a partir do catálogo em memória."""
+    return lookup_catalog.lists()
+
+# Consultas base do dashboard. `{sort_key}` recebe a coluna de ordenação na paginação
+# por keyset (ver pagination.py) e fica vazio quando se lê o histórico completo.
+ORDERS_QUERY = """
+    SELECT {sort_key}
+        orders.id AS order_id, 
+        products.name AS product_name,
+        brands.name AS brand_name,
+        colors.name AS color_name,
+        sizes.name AS size_name,
+        orders.order_date,
+        orders.delivery_date,
+        orders.price,
+        orders.deliver_tax,
+        (orders.price + orders.deliver_tax) AS total_cost,
+        sales.id AS sale_id,
+        sales.status AS status,
+        sales.post_id,
+        orders.brand_id,
+        orders.product_id,
+        orders.size_id
+    FROM orders
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    JOIN sales ON sales.order_id = orders.id
+    WHERE sales.user_id = ?
+"""
+
+# Posts - COM LIKES, VIEWS E OFFERS (PROPOSALS)
+POSTS_QUERY = """
+    SELECT {sort_key}
+        posts.id AS post_id, 
+        posts.post_date,
+        posts.first_price,
+        posts.sell_price,
+        posts.ad_tax,
+        posts.sell_date,
+        posts.likes,
+        posts.views,
+        posts.offers AS proposals, -- Renomeado para compatibilidade com HTML
+        orders.id AS order_id,
+        orders.order_date AS order_date,
+        orders.delivery_date AS delivery_date,
+        orders.price AS order_price,
+        orders.deliver_tax AS order_deliver_tax,
+        products.name AS product_name,
+        brands.name AS brand_name,
+        colors.name AS color_name,
+        sizes.name AS size_name,
+        sales.status AS status
+    FROM posts
+    JOIN orders ON orders.id = posts.order_id
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    JOIN sales ON sales.post_id = posts.id
+    WHERE sales.user_id = ?
+"""
+
+# Vendas concretizadas: posts vendidos com preço e data de venda
+SALES_QUERY = POSTS_QUERY + """
+    AND sales.status = 'sold' AND posts.sell_price IS NOT NULL AND posts.sell_date IS NOT NULL
+"""
+
+# Tabelas paginadas do dashboard: consulta, desempate (expressão, coluna) e colunas ordenáveis.
+# As expressões nunca são NULL para que a comparação do keyset seja total.
+PAGED_TABLES = {
+    "orders": {
+        "query": ORDERS_QUERY,
+        "id": ("orders.id", "order_id"),
+        "default_sort": "order_date",
+        "sorts": {
+            "order_date": "orders.order_date",
+            "status": "COALESCE(sales.status, '')",
+            "product": "products.name",
+            "price": "orders.price",
+            "deliver_tax": "COALESCE(orders.deliver_tax, 0)",
+        },
+    },
+    "posts": {
+        "query": POSTS_QUERY,
+        "id": ("posts.id", "post_id"),
+        "default_sort": "post_date",
+        "sorts": {
+            "post_date": "posts.post_date",
+            "product": "products.name",
+            "first_price": "posts.first_price",
+            "sold_price": "COALESCE(posts.sell_price, -1)",
+            "views": "COALESCE(posts.views, 0)",
+            "likes": "COALESCE(posts.likes, 0)",
+            "proposals": "COALESCE(posts.offers, 0)",
+            "status": "COALESCE(sales.status, '')",
+        },
+    },
+    "sales": {
+        "query": SALES_QUERY,
+        "id": ("posts.id", "post_id"),
+        "default_sort": "sell_date",
+        "sorts": {
+            "sell_date": "posts.sell_date",
+            "product": "products.name",
+            "gastos": "(COALESCE(orders.price, 0) + COALESCE(orders.deliver_tax, 0) + COALESCE(posts.ad_tax, 0))",
+            "sold_price": "posts.sell_price",
+            "lucro": "(posts.sell_price - COALESCE(orders.price, 0) - COALESCE(orders.deliver_tax, 0) - COALESCE(posts.ad_tax, 0))",
+            "tempo_total": "COALESCE(julianday(posts.sell_date) - julianday(orders.order_date), -1)",
+        },
+    },
+}
+
+
+def request_today():
+    """Data de hoje, fixada uma vez por pedido: todas as contagens de dias usam o mesmo 'hoje'."""
+    if not has_app_context():
+        return date.today()
+    if "today" not in g:
+        g.today = date.today()
+    return g.today
+
+
+def get_user_data(user_id, include_archive=False):
     """
-    Calcula a diferença em dias.
-    Se end_date_str for None, calcula até a data de hoje (datetime.now).
+    Recupera pedidos, posts e dados de vendas consolidados para um usuário específico
+    (todas as linhas ativas, mais as arquivadas se `include_archive`; o dashboard usa
+    get_table_page para ler uma página de cada vez). As linhas são objetos compactos de
+    rows.py, construídos diretamente a partir do cursor.
     """
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        else:
-            end_date = datetime.now() # Usa data atual se não houver data final
-            
-        return (end_date - start_date).days
-    except Exception:
-        return None
+    orders_sql = ORDERS_QUERY.format(sort_key="") + " ORDER BY orders.order_date DESC"
+    posts_sql = POSTS_QUERY.format(sort_key="") + " ORDER BY posts.post_date DESC"
+    if include_archive:
+        orders_sql = archive.full_history(orders_sql)
+        posts_sql = archive.full_history(posts_sql)
+    today = request_today()
+    orders = db.execute_as(rows.OrderRow, orders_sql, user_id, today=today)
+    posts = db.execute_as(rows.PostRow, posts_sql, user_id, today=today)
+    return orders, posts, rows.sales_from_posts(posts)
+
+
+def get_table_page(table, user_id, args):
+    """
+    Lê uma única página (keyset) de uma das tabelas do dashboard.
+    `args` são os parâmetros do pedido: `<tabela>_sort`, `<tabela>_dir`, `<tabela>_after`
+    e `<tabela>_before`, e `history=all` para incluir as vendas arquivadas.
+    Devolve {'rows', 'next_cursor', 'prev_cursor', 'sort', 'direction'}.
+    """
+    config = PAGED_TABLES[table]
+    query = config["query"]
+    if args.get("history") == "all":
+        query = archive.full_history(query)
+    sort = args.get(f"{table}_sort")
+    if sort not in config["sorts"]:
+        sort = config["default_sort"]
+    direction = "asc" if args.get(f"{table}_dir") == "asc" else "desc"
+    id_expr, id_key = config["id"]
+
+    page = pagination.fetch_page(
+        db, query, (user_id,), config["sorts"][sort], id_expr, id_key,
+        descending=(direction == "desc"),
+        after=args.get(f"{table}_after"),
+        before=args.get(f"{table}_before"),
+    )
 
-def format_date_pt(date_str):
-    """Formata a data de YYYY-MM-DD para DD/MM/YYYY. Retorna None se a entrada for None."""
-    if not date_str:
-        return None
-    try:
-        dt_obj = datetime.strptime(date_str, '%Y-%m-%d')
-        return dt_obj.strftime('%d/%m/%Y')
-    except Exception:
-        return date_str
+    today = request_today()
+    if table == "orders":
+        page["rows"] = rows.orders_from_dicts(page["rows"], today)
+    elif table == "posts":
+        page["rows"] = rows.posts_from_dicts(page["rows"], today)
+    else:
+        page["rows"] = rows.sales_from_posts(rows.posts_from_dicts(page["rows"], today))
 
+    page.update(sort=sort, direction=direction)
+    return page
 
-def get_user_data(user_id):
-    """
-    Recupera pedidos, posts e dados de vendas consolidados para um usuário específico.
-    """
-    
-    # 1. Recuperar Pedidos (Orders)
-    orders = db.execute("""
-        SELECT 
-            orders.id AS order_id, 
-            products.name AS product_name,
-            brands.name AS brand_name,
-            colors.name AS color_name,
-            sizes.name AS size_name,
-            orders.order_date,
-            orders.delivery_date,
-            orders.price,
-            orders.deliver_tax,
-            (orders.price + orders.deliver_tax) AS total_cost,
-            sales.id AS sale_id,
-            sales.status AS status,
-            sales.post_id
-        FROM orders
-        JOIN products ON products.id = orders.product_id
-        JOIN brands ON brands.id = orders.brand_id
-        JOIN colors ON colors.id = orders.color_id
-        JOIN sizes ON sizes.id = orders.size_id
-        JOIN sales ON sales.order_id = orders.id
-        WHERE sales.user_id = ?
-        ORDER BY orders.order_date DESC
-    """, user_id)
 
-    # 2. Recuperar Posts - ADICIONADO LIKES, VIEWS E OFFERS (PROPOSALS)
-    posts = db.execute("""
-        SELECT 
-            posts.id AS post_id, 
-            posts.post_date,
-            posts.first_price,
-            posts.sell_price,
-            posts.ad_tax,
-            posts.sell_date,
-            posts.likes,      -- Adicionado
-            posts.views,      -- Adicionado
-            posts.offers AS proposals, -- Adicionado e renomeado para compatibilidade com HTML
+def get_open_orders(user_id):
+    """Encomendas ainda não vendidas (para o seletor do formulário de posts)."""
+    return db.execute("""
+        SELECT
             orders.id AS order_id,
-            orders.order_date AS order_date,
-            orders.delivery_date AS delivery_date,
-            orders.price AS order_price,
-            orders.deliver_tax AS order_deliver_tax,
             products.name AS product_name,
             brands.name AS brand_name,
-            colors.name AS color_name,
-            sizes.name AS size_name,
             sales.status AS status
-        FROM posts
-        JOIN orders ON orders.id = posts.order_id
+        FROM sales
+        JOIN orders ON orders.id = sales.order_id
         JOIN products ON products.id = orders.product_id
         JOIN brands ON brands.id = orders.brand_id
-        JOIN colors ON colors.id = orders.color_id
-        JOIN sizes ON sizes.id = orders.size_id
-        JOIN sales ON sales.post_id = posts.id
-        WHERE sales.user_id = ?
-        ORDER BY posts.post_date DESC
+        WHERE sales.user_id = ? AND sales.status != 'sold'
+        ORDER BY orders.order_date DESC
     """, user_id)
 
-    # --- PROCESSAMENTO E CÁLCULOS DE TEMPO (ANTES DA FORMATAÇÃO DAS DATAS) ---
 
-    # Processar Orders para adicionar contagens de dias
-    for o in orders:
-        if o['delivery_date']:
-            # Se já chegou, calcula dias que demorou (Order -> Delivery)
-            o['days_to_delivery'] = calculate_days_diff(o['order_date'], o['delivery_date'])
-            o['days_since_order'] = None 
-        else:
-            # Se não chegou, calcula dias desde o pedido até hoje (Order -> Hoje)
-            o['days_to_delivery'] = None
-            o['days_since_order'] = calculate_days_diff(o['order_date'], None)
-
-    # Processar Posts para adicionar contagens de dias
-    for p in posts:
-        if p['status'] == 'sold' and p['sell_date']:
-             # Se vendido, calcula dias que demorou a vender (Post -> Sell)
-            p['days_to_sale'] = calculate_days_diff(p['post_date'], p['sell_date'])
-            p['days_since_post'] = None
-        else:
-             # Se ativo, calcula dias desde o post até hoje (Post -> Hoje)
-            p['days_to_sale'] = None
-            p['days_since_post'] = calculate_days_diff(p['post_date'], None)
-
-
-    # 3. Preparar a Tabela de Vendas (Sales Table) - Apenas itens com status 'sold'
-    sales_data = []
-    for p in posts:
-        if p['status'] == 'sold' and p['sell_price'] is not None and p['sell_date'] is not None:
-            
-            # Cálculo de Gastos Totais (Encomenda + Destaques)
-            total_gastos = (p['order_price'] or 0) + (p['order_deliver_tax'] or 0) + (p['ad_tax'] or 0)
-            
-            # Cálculo de Lucro
-            lucro = (p['sell_price'] or 0) - total_gastos
-            
-            # Cálculo de Tempo Total (Encomenda -> Venda)
-            # O html pede 'days_to_sale_total'
-            tempo_total = calculate_days_diff(p['order_date'], p['sell_date'])
-
-            sales_data.append({
-                'product_info': f"{p['product_name']} / {p['brand_name']}", # Simplificado para caber na tabela, mas tem acesso aos nomes individuais
-                'brand_name': p['brand_name'],
-                'size_name': p['size_name'],
-                'color_name': p['color_name'],
-                'total_gastos': total_gastos,
-                'ad_tax': p['ad_tax'] or 0,
-                'sell_price': p['sell_price'],
-                'lucro': lucro,
-                'sell_date': format_date_pt(p['sell_date']),
-                'days_to_sale_total': tempo_total, # Nome da variável atualizado para o HTML
-                'tempo_total': tempo_total, # Mantendo backup
-                'post_id': p['post_id'],
-                'post_id': p['post_id']
-            })
-
-    # --- FORMATAÇÃO FINAL DE DATAS PARA DISPLAY ---
-    # Formatar as datas para dd/mm/yyyy
-    for o in orders:
-        o['order_date'] = format_date_pt(o['order_date'])
-        o['delivery_date'] = format_date_pt(o['delivery_date'])
-        o['total_cost'] = (o['price'] or 0) + (o['deliver_tax'] or 0)
+def get_data_version(user_id):
+    """
+    Versão dos dados de um utilizador para ETags. Muda a cada escrita (user_metrics.version),
+    a cada alteração do catálogo de lookups e a cada dia (os contadores de dias usam a data de hoje).
+    """
+    query = """
+        SELECT user_metrics.version, lookup_version.version AS lookup_version
+        FROM user_metrics, lookup_version
+        WHERE user_metrics.user_id = ?
+    """
+    rows = db.execute(query, user_id)
+    if not rows:
+        get_user_metrics(user_id)
+        rows = db.execute(query, user_id)
+    return f"{user_id}.{rows[0]['version']}.{rows[0]['lookup_version']}.{request_today().isoformat()}"
 
-    for p in posts:
-        p['post_date'] = format_date_pt(p['post_date'])
-        p['sell_date'] = format_date_pt(p['sell_date'])
 
+def page_url(table, **changes):
+    """URL do dashboard com o estado de paginação de `table` alterado (mantém as outras tabelas)."""
+    args = request.args.to_dict()
+    args.pop(f"{table}_after", None)
+    args.pop(f"{table}_before", None)
+    for key, value in changes.items():
+        args[f"{table}_{key}"] = value
+    return url_for('index', **args)
 
-    return orders, posts, sales_data
 
-def calculate_user_metrics_from_data(orders, posts, sales_data):
-    """Calcula métricas financeiras e de contagem a partir das listas de dados."""
-    
-    # 1. CÁLCULOS FINANCEIROS DE VENDAS CONCRETAS
-    faturacao = sum(item['sell_price'] for item in sales_data)
-    gastos_totais = sum(item['total_gastos'] for item in sales_data)
+def calculate_user_metrics_from_data(orders, posts, sales_data, stats=None):
+    """
+    Calcula métricas financeiras e de contagem a partir das listas de dados.
+    Cada lista é percorrida uma única vez; os posts são indexados por order_id
+    para que a projeção do stock não procure o post de cada encomenda em toda a lista.
+    `stats` é o índice (marca, produto, tamanho) -> estatísticas de venda do utilizador
+    (read_models.load_sale_stats()): cada artigo em stock é projetado com o tempo de venda
+    e o ROI do seu grupo (sem `stats`, com a média e o ROI globais).
+    """
+    stats = stats or {}
+
+    # 1. CÁLCULOS FINANCEIROS DE VENDAS CONCRETAS (uma passagem por sales_data)
+    faturacao = 0
+    gastos_totais = 0
+    count_vendidas = 0
+    for item in sales_data:
+        faturacao += item['sell_price']
+        gastos_totais += item['total_gastos']
+        count_vendidas += 1
     lucro_total = faturacao - gastos_totais
 
     # Multiplicador (ROI)
     multiplicador = 0.0
     if gastos_totais > 0:
         multiplicador = lucro_total / gastos_totais
-    
-    # 2. CONTAGEM DE ENCOMENDAS
-    count_stock = sum(1 for o in orders if o['status'] == 'stock')
-    count_chegar = sum(1 for o in orders if o['status'] == 'shipping')
-    count_vendidas = len(sales_data)
-
-    # 3. CÁLCULO DE TEMPO DE STOCK (Projeção)
-    dias_fim_stock = 0
-    stock_atual = count_stock + count_chegar
 
-    if stock_atual > 0:
-        total_dias_venda = 0
-        valid_sales = 0
-        
-        # Usamos o cálculo de dias já feito no processamento anterior
-        for p in posts:
-            if p['status'] == 'sold' and p.get('days_to_sale'):
-                total_dias_venda += p['days_to_sale']
-                valid_sales += 1
-        
-        tempo_venda_medio = (total_dias_venda / valid_sales) if valid_sales > 0 else 60 
-
-        if tempo_venda_medio > 0:
-            dias_fim_stock = stock_atual * tempo_venda_medio
-        else:
-            dias_fim_stock = 365 
-
-
-    # 4. NOVAS MÉTRICAS DE STOCK E PROJEÇÃO DE LUCRO
+    # 2. ÍNDICE order_id -> post E TEMPOS DE VENDA (uma passagem pelos posts)
+    # Mantém o primeiro post de cada encomenda, tal como a antiga procura linear.
+    posts_by_order = {}
+    total_dias_venda = 0
+    valid_sales = 0
+    for p in posts:
+        posts_by_order.setdefault(p['order_id'], p)
+        if p['status'] == 'sold' and p.get('days_to_sale'):
+            total_dias_venda += p['days_to_sale']
+            valid_sales += 1
+    tempo_venda_medio = (total_dias_venda / valid_sales) if valid_sales > 0 else 60
+
+    # 3. CONTAGENS E STOCK (uma passagem pelas encomendas; estatísticas do grupo de cada artigo)
+    count_stock = 0
+    count_chegar = 0
     invested_stock_cost = 0
     estimated_stock_profit = 0
+    dias_grupos = 0         # dias previstos dos artigos com mediana do grupo
+    sem_mediana = 0         # artigos projetados com a média global
 
     for o in orders:
-        if o['status'] in ['shipping', 'stock']:
-            
-            cost_initial = (o['price'] or 0) + (o['deliver_tax'] or 0)
-            invested_stock_cost += cost_initial
-            
-            if o['status'] == 'shipping':
-                estimated_profit_item = cost_initial * multiplicador
-                estimated_stock_profit += estimated_profit_item
-            
-            elif o['status'] == 'stock':
-                # Procura o post correspondente
-                post = next((p for p in posts if p['order_id'] == o['order_id']), None)
-                
-                if post and post['first_price'] is not None:
-                    announced_price = post['first_price']
-                    ad_tax_cost = (post['ad_tax'] or 0)
-                    total_cost_with_ad = cost_initial + ad_tax_cost
-                    estimated_profit_item = announced_price - total_cost_with_ad
-                    estimated_stock_profit += estimated_profit_item
-                else:
-                    estimated_profit_item = cost_initial * multiplicador
-                    estimated_stock_profit += estimated_profit_item
+        status = o['status']
+        if status != 'shipping' and status != 'stock':
+            continue
+
+        cost_initial = (o['price'] or 0) + (o['deliver_tax'] or 0)
+        invested_stock_cost += cost_initial
+        group = stats.get((o['brand_id'], o['product_id'], o['size_id']))
+        dias_venda, roi = read_models.group_projection(group, tempo_venda_medio, multiplicador)
+        if group is not None and group['days_count'] >= read_models.MIN_SAMPLES:
+            dias_grupos += dias_venda
+        else:
+            sem_mediana += 1
+
+        if status == 'shipping':
+            count_chegar += 1
+            estimated_stock_profit += cost_initial * roi
+        else:
+            count_stock += 1
+            post = posts_by_order.get(o['order_id'])
+            if post and post['first_price'] is not None:
+                # Lucro estimado com base no preço anunciado
+                total_cost_with_ad = cost_initial + (post['ad_tax'] or 0)
+                estimated_stock_profit += post['first_price'] - total_cost_with_ad
+            else:
+                estimated_stock_profit += cost_initial * roi
+
+    # 4. CÁLCULO DE TEMPO DE STOCK (Projeção: soma dos tempos de venda previstos; os artigos
+    # sem mediana do grupo contam stock x média, como em read_models.project_stock())
+    dias_fim_stock = 0
+    stock_atual = count_stock + count_chegar
+
+    if stock_atual > 0:
+        dias_stock = dias_grupos + sem_mediana * tempo_venda_medio
+        dias_fim_stock = dias_stock if dias_stock > 0 else 365
 
     return {
         'faturacao': faturacao,
@@ -273,18 +406,135 @@ def calculate_user_metrics_from_data(orders, posts, sales_data):
 def get_post_data(post_id):
     """Busca dados de um post específico."""
     # Exemplo: return db.execute("SELECT * FROM posts WHERE id = ?", post_id)[0]
-    return db.execute("SELECT * FROM posts WHERE id = ?", (post_id,))
+    return db.execute("SELECT * FROM posts WHERE id = ?", post_id)
 
 def get_order_data(order_id):
     """Busca dados de uma encomenda específica."""
     # Exemplo: return db.execute("SELECT * FROM orders WHERE id = ?", order_id)[0]
-    return db.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
+    return db.execute("SELECT * FROM orders WHERE id = ?", order_id)
+
+def get_post_by_order_id(order_id, conn=None):
+    """Busca o post associado a uma encomenda (posts não têm product_id; ligam-se por order_id)."""
+    # Retorna o ID do post, se encontrado. Dentro de db.write() usa a base de dados recebida.
+    return (conn or db).execute("SELECT id FROM posts WHERE order_id = ?", order_id)
+
+
+def get_user_metrics(user_id):
+    """Lê as métricas materializadas do utilizador (uma linha de user_metrics)."""
+    metrics = read_models.load_metrics(db, user_id)
+    if metrics is None:
+        # Primeira leitura deste utilizador: materializar a partir do histórico.
+        with db.transaction():
+            read_models.rebuild_user(db, user_id)
+        metrics = read_models.load_metrics(db, user_id)
+    return metrics
+
+
+def get_dashboard(user_id, args):
+    """Uma página de cada tabela (segundo `args`), as encomendas em aberto e os KPIs do utilizador."""
+    return {
+        "pages": {table: get_table_page(table, user_id, args) for table in PAGED_TABLES},
+        "open_orders": get_open_orders(user_id),
+        "user_metrics": get_user_metrics(user_id),
+    }
+
+
+def get_cached_dashboard(user_id, args):
+    """
+    Dashboard do utilizador. A vista por omissão (sem ordenação nem cursores) é servida a
+    partir da cache do pré-cálculo enquanto a versão dos dados não mudar.
+    """
+    if dashboard_warmer is None or set(args) - {"user_id"}:
+        return get_dashboard(user_id, args)
+    version = get_data_version(user_id)
+    dashboard = dashboard_warmer.get(user_id, version)
+    if dashboard is None:
+        dashboard = get_dashboard(user_id, {})
+        dashboard_warmer.put(user_id, version, dashboard)
+    return dashboard
+
+
+def dashboard_changed(user_id):
+    """Pede o pré-cálculo do dashboard de um utilizador depois de uma escrita confirmada."""
+    if dashboard_warmer is not None and str(user_id).isdigit():
+        dashboard_warmer.schedule(int(user_id))
+
+
+def warm_version(user_id):
+    with sharding.use(db, user_id):
+        return get_data_version(user_id)
+
+
+def warm_dashboard(user_id):
+    with sharding.use(db, user_id):
+        return get_dashboard(user_id, {})
+
+
+# Pré-cálculo em segundo plano dos dashboards (SALES_PRECOMPUTE), ver precompute.py
+dashboard_warmer = precompute.init(db, warm_version, warm_dashboard)
+
+# Contadores de interação dos posts enviados pelo scraper, escritos em lote (ver engagement.py)
+engagement_buffer = engagement.init(db, on_flush=lambda user_ids: [dashboard_changed(uid) for uid in user_ids])
+atexit.register(engagement_buffer.close)
+
 
-def get_post_by_product_id(product_id):
-    """Busca um post associado a um product_id."""
-    # Retorna o ID do post, se encontrado.
-    # Exemplo: return db.execute("SELECT id FROM posts WHERE product_id = ?", product_id)
-    return db.execute("SELECT id FROM posts WHERE product_id = ?", (product_id,))
+# --- Fragmentos do dashboard ---
+
+# Secções do dashboard que podem ser pedidas isoladamente -> template parcial.
+# As rotas de escrita chamadas pelo JavaScript do dashboard (cabeçalho X-Fragments)
+# devolvem só as secções que a escrita alterou, em vez do redirect para a página inteira.
+FRAGMENTS = {
+    "metrics": "partials/metrics.html",
+    "open_orders": "partials/open_orders.html",
+    "orders": "partials/orders_table.html",
+    "posts": "partials/posts_table.html",
+    "sales": "partials/sales_table.html",
+}
+
+# Secções afetadas por cada tipo de escrita
+ORDER_ADDED = ("orders", "metrics", "open_orders")
+POST_CHANGED = ("posts", "sales", "orders", "metrics", "open_orders")
+ORDER_CHANGED = tuple(FRAGMENTS)
+
+# Nome da variável de cada tabela nos templates
+TABLE_ROWS = {"orders": "orders", "posts": "posts", "sales": "sales_data"}
+
+
+def render_fragment(name, user_id, args):
+    """Renderiza uma secção do dashboard, com apenas a consulta de que ela precisa."""
+    context = {"selected_user_id": user_id}
+    if name in PAGED_TABLES:
+        page = get_table_page(name, user_id, args)
+        context["pages"] = {name: page}
+        context[TABLE_ROWS[name]] = page["rows"]
+    elif name == "metrics":
+        context["user_metrics"] = get_user_metrics(user_id)
+    elif name == "open_orders":
+        context["open_orders"] = get_open_orders(user_id)
+    return render_template(FRAGMENTS[name], **context)
+
+
+def write_response(user_id, changed=()):
+    """
+    Resposta de uma rota de escrita: o redirect para o dashboard ou, para os pedidos com o
+    cabeçalho X-Fragments, JSON com o HTML das secções `changed` e das mensagens de flash.
+    O estado de ordenação/paginação das tabelas vem na query string do pedido.
+    """
+    if not request.headers.get("X-Fragments") or not str(user_id).isdigit():
+        return redirect(url_for('index', user_id=user_id))
+    fragments = {name: render_fragment(name, int(user_id), request.args) for name in changed}
+    # Renderizar as mensagens consome-as, pelo que não ficam para o próximo pedido.
+    fragments["messages"] = render_template("partials/messages.html")
+    return jsonify(fragments=fragments)
+
+
+@app.route("/fragments/<name>", methods=["GET"])
+def fragment(name):
+    """Uma única secção do dashboard (`user_id` e o estado das tabelas na query string)."""
+    user_id = request.args.get("user_id", type=int)
+    if name not in FRAGMENTS or user_id is None:
+        abort(404)
+    return render_fragment(name, user_id, request.args)
 
 
 # --- Rotas Principais ---
@@ -298,32 +548,35 @@ def index():
     selected_user_id = None
     selected_user_name = None 
     
-    orders = [] 
-    posts = []
-    sales_data = []
+    pages = {}
+    open_orders = []
     user_metrics = None 
     
     if selected_user_id_str and selected_user_id_str.isdigit():
         try:
             selected_user_id = int(selected_user_id_str)
             
-            user_result = db.execute("SELECT name FROM users WHERE id = ?", selected_user_id)
-            if user_result:
-                selected_user_name = user_result[0]['name']
+            selected_user_name = lookup_catalog.name("users", selected_user_id)
 
-            orders, posts, sales_data = get_user_data(selected_user_id)
-            user_metrics = calculate_user_metrics_from_data(orders, posts, sales_data)
+            # Apenas uma página de cada tabela; os KPIs vêm de user_metrics (histórico completo)
+            dashboard = get_cached_dashboard(selected_user_id, request.args)
+            pages = dashboard["pages"]
+            open_orders = dashboard["open_orders"]
+            user_metrics = dashboard["user_metrics"]
             
         except Exception as e:
             flash(f"Erro ao carregar dados. Verifique a estrutura do DB. Detalhes: {e}", "danger")
             selected_user_id = None
+            pages = {}
 
     return render_template("index.html",
                             selected_user_id=selected_user_id,
                             selected_user_name=selected_user_name,
-                            orders=orders,
-                            posts=posts,
-                            sales_data=sales_data,
+                            pages=pages,
+                            orders=pages["orders"]["rows"] if pages else [],
+                            posts=pages["posts"]["rows"] if pages else [],
+                            sales_data=pages["sales"]["rows"] if pages else [],
+                            open_orders=open_orders,
                             user_metrics=user_metrics,
                             **lookups)
 
@@ -343,28 +596,33 @@ def add_order():
 
     if not all([user_id, product_id, brand_id, size_id, color_id, price, order_date]):
         flash("Todos os campos obrigatórios do pedido devem ser preenchidos.", "warning")
-        return redirect(url_for('index', user_id=user_id))
+        return write_response(user_id)
 
     try:
-        order_id = db.execute("""
-            INSERT INTO orders (product_id, brand_id, size_id, color_id, price, deliver_tax, order_date, delivery_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, product_id, brand_id, size_id, color_id, price, deliver_tax, order_date, delivery_date)
-        
-        initial_status = "shipping"
-        if delivery_date:
-            initial_status = "stock"
-
-        db.execute("""
-            INSERT INTO sales (order_id, user_id, status)
-            VALUES (?, ?, ?)
-        """, order_id, user_id, initial_status)
-        
+        def insert_order(db):
+            order_id = db.execute("""
+                INSERT INTO orders (product_id, brand_id, size_id, color_id, price, deliver_tax, order_date, delivery_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, product_id, brand_id, size_id, color_id, price, deliver_tax, order_date, delivery_date)
+
+            initial_status = "shipping"
+            if delivery_date:
+                initial_status = "stock"
+
+            db.execute("""
+                INSERT INTO sales (order_id, user_id, status)
+                VALUES (?, ?, ?)
+            """, order_id, user_id, initial_status)
+
+            read_models.apply_change(db, {}, read_models.snapshot(db, order_id))
+
+        db.write(insert_order)
+        dashboard_changed(user_id)
         flash("Encomenda adicionada com sucesso!", "success")
     except Exception as e:
         flash(f"Erro ao adicionar encomenda: {e}", "danger")
 
-    return redirect(url_for('index', user_id=user_id))
+    return write_response(user_id, ORDER_ADDED)
 
 
 @app.route("/add_post", methods=["POST"])
@@ -385,38 +643,48 @@ def add_post():
 
     if not all([user_id, order_id, first_price, post_date]):
         flash("Todos os campos obrigatórios do post devem ser preenchidos.", "warning")
-        return redirect(url_for('index', user_id=user_id))
+        return write_response(user_id)
         
-    sale_status = db.execute("SELECT status FROM sales WHERE order_id = ?", order_id)
-    if not sale_status or sale_status[0]['status'] == 'shipping':
-        flash("Não é possível criar um post. A encomenda ainda está 'shipping'.", "danger")
-        return redirect(url_for('index', user_id=user_id))
-        
-    try:
-        if sell_date and not sell_price:
-             flash("Se a Data da Venda for preenchida, o Preço Vendido também é obrigatório.", "warning")
-             return redirect(url_for('index', user_id=user_id))
-        
-        # Inserir com os novos campos (offers = proposals)
-        # Atenção: DB usa 'offers', HTML usa 'proposals'
-        post_id = db.execute("""
-            INSERT INTO posts (order_id, first_price, sell_price, ad_tax, post_date, sell_date, views, likes, offers)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, order_id, first_price, sell_price, ad_tax, post_date, sell_date, views, likes, proposals)
-        
-        new_status = 'sold' if sell_date else 'stock'
+    if sell_date and not sell_price:
+        flash("Se a Data da Venda for preenchida, o Preço Vendido também é obrigatório.", "warning")
+        return write_response(user_id)
 
-        db.execute("""
-            UPDATE sales
-            SET post_id = ?, status = ?
-            WHERE order_id = ?
-        """, post_id, new_status, order_id)
-        
+    try:
+        def insert_post(db):
+            # O estado é lido na mesma transação da escrita (não pode mudar entretanto).
+            sale_status = db.execute("SELECT status FROM sales WHERE order_id = ?", order_id)
+            if not sale_status or sale_status[0]['status'] == 'shipping':
+                return None
+
+            before = read_models.snapshot(db, order_id)
+
+            # Inserir com os novos campos (offers = proposals)
+            # Atenção: DB usa 'offers', HTML usa 'proposals'
+            post_id = db.execute("""
+                INSERT INTO posts (order_id, first_price, sell_price, ad_tax, post_date, sell_date, views, likes, offers)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, order_id, first_price, sell_price, ad_tax, post_date, sell_date, views, likes, proposals)
+
+            new_status = 'sold' if sell_date else 'stock'
+
+            db.execute("""
+                UPDATE sales
+                SET post_id = ?, status = ?
+                WHERE order_id = ?
+            """, post_id, new_status, order_id)
+
+            read_models.apply_change(db, before, read_models.snapshot(db, order_id))
+            return post_id
+
+        if db.write(insert_post) is None:
+            flash("Não é possível criar um post. A encomenda ainda está 'shipping'.", "danger")
+            return write_response(user_id)
+        dashboard_changed(user_id)
         flash("Post adicionado com sucesso!", "success")
     except Exception as e:
         flash(f"Erro ao adicionar post: {e}", "danger")
 
-    return redirect(url_for('index', user_id=user_id))
+    return write_response(user_id, POST_CHANGED)
 
 
 # --- Rotas de Edição ---
@@ -454,29 +722,49 @@ def update_order():
     order_date = request.form.get("order_date")
     delivery_date = request.form.get("delivery_date") or None # Pode ser None
 
-    # 2. Lógica de Status (stock se delivery_date preenchido)
-    status = "shipping"
-    if delivery_date:
-        status = "stock"
-    
-    # 3. Execução da Atualização
-    try:
-        db.execute("""
-            UPDATE orders SET
-                product_id = ?, brand_id = ?, size_id = ?, color_id = ?,
-                price = ?, deliver_tax = ?, order_date = ?, delivery_date = ?, status = ?
-            WHERE id = ? AND user_id = ?
-        """, (product_id, brand_id, size_id, color_id, price, deliver_tax, 
-              order_date, delivery_date, status, order_id, user_id))
-
-        # 4. Atualizar o status do produto associado (importante se o status da encomenda mudou)
-        db.execute("UPDATE products SET status = ? WHERE id = ? AND user_id = ?", (status, product_id, user_id))
+    if not all([product_id, brand_id, size_id, color_id, price, order_date]):
+        flash("Todos os campos obrigatórios do pedido devem ser preenchidos.", "warning")
+        return redirect(url_for('edit_order', order_id=order_id, user_id=user_id))
 
+    # 2. Execução da Atualização
+    try:
+        def write_order(db):
+            # O estado e a posse (user_id) vivem na tabela `sales`; são lidos na mesma
+            # transação da escrita, para não repor um estado que mudou entretanto.
+            sale = db.execute("SELECT status FROM sales WHERE order_id = ? AND user_id = ?", order_id, user_id)
+            if not sale:
+                return None
+
+            # 3. Lógica de Status (stock se delivery_date preenchido; uma venda concretizada mantém-se 'sold')
+            status = sale[0]['status']
+            if status != "sold":
+                status = "stock" if delivery_date else "shipping"
+
+            before = read_models.snapshot(db, order_id)
+
+            db.execute("""
+                UPDATE orders SET
+                    product_id = ?, brand_id = ?, size_id = ?, color_id = ?,
+                    price = ?, deliver_tax = ?, order_date = ?, delivery_date = ?
+                WHERE id = ?
+            """, product_id, brand_id, size_id, color_id, price, deliver_tax,
+                 order_date, delivery_date, order_id)
+
+            # 4. Atualizar o status da venda associada (importante se a data de entrega mudou)
+            db.execute("UPDATE sales SET status = ? WHERE order_id = ? AND user_id = ?", status, order_id, user_id)
+
+            read_models.apply_change(db, before, read_models.snapshot(db, order_id))
+            return status
+
+        if db.write(write_order) is None:
+            flash("Encomenda não encontrada ou acesso negado.", "danger")
+            return write_response(user_id)
+        dashboard_changed(user_id)
         flash("Encomenda atualizada com sucesso!", "success")
     except Exception as e:
         flash(f"Erro ao atualizar a encomenda: {e}", "danger")
 
-    return redirect(url_for('index', user_id=user_id))
+    return write_response(user_id, ORDER_CHANGED)
 
 @app.route("/delete_order", methods=["POST"])
 def delete_order():
@@ -487,43 +775,43 @@ def delete_order():
     order_id = request.form.get("order_id")
     user_id = request.form.get("user_id")
 
-    # 1. Buscar explicitamente o product_id E validar a posse (user_id) em um único passo.
-    order_data = db.execute(
-        "SELECT product_id FROM orders WHERE id = ? AND user_id = ?", 
-        (order_id, user_id)
-    )
-
-    if not order_data:
-        # Se a query não retornar resultados, a encomenda não existe ou não pertence ao utilizador.
-        flash("Encomenda não encontrada ou acesso negado.", "danger")
-        return redirect(url_for('index', user_id=user_id))
-
-    # O registo é válido, extrair o product_id
-    product_id = order_data[0]['product_id']
-
     try:
-        # 2. Deletar a Encomenda
-        db.execute("DELETE FROM orders WHERE id = ? AND user_id = ?", (order_id, user_id))
-
-        # 3. Deletar registros associados a esta encomenda na tabela `sales` 
-        db.execute("DELETE FROM sales WHERE order_id = ? AND user_id = ?", (order_id, user_id))
-        
-        # 4. Buscar e Deletar Post associado ao produto (se existir)
-        post = get_post_by_product_id(product_id)
+        def remove_order(db):
+            # 1. Validar a posse (user_id) através da tabela `sales`, na transação da escrita.
+            if not db.execute("SELECT order_id FROM sales WHERE order_id = ? AND user_id = ?", order_id, user_id):
+                return None
+
+            before = read_models.snapshot(db, order_id)
+
+            # 2. Deletar registros associados a esta encomenda na tabela `sales`
+            db.execute("DELETE FROM sales WHERE order_id = ? AND user_id = ?", order_id, user_id)
+
+            # 3. Buscar e Deletar Post associado à encomenda (se existir)
+            post = get_post_by_order_id(order_id, db)
+            if post:
+                db.execute("DELETE FROM posts WHERE order_id = ?", order_id)
+
+            # 4. Deletar a Encomenda
+            db.execute("DELETE FROM orders WHERE id = ?", order_id)
+
+            # 5. O registo do Produto é MANTIDO.
+            read_models.apply_change(db, before, {})
+            return post
+
+        post = db.write(remove_order)
+        if post is None:
+            # A encomenda não existe ou não pertence ao utilizador.
+            flash("Encomenda não encontrada ou acesso negado.", "danger")
+            return write_response(user_id)
+        dashboard_changed(user_id)
         if post:
-            post_id = post[0]['id']
-            # Deletar o post, garantindo que também pertence ao user_id
-            db.execute("DELETE FROM posts WHERE id = ? AND user_id = ?", (post_id, user_id))
-            flash(f"Post ID {post_id} associado foi excluído.", "info")
-            
-        # 5. [PASSO REMOVIDO] O registo do Produto é MANTIDO.
-        
+            flash(f"Post ID {post[0]['id']} associado foi excluído.", "info")
         flash("Encomenda, registos de venda e post associado (se existir) excluídos com sucesso.", "success")
 
     except Exception as e:
         flash(f"Erro ao deletar a encomenda: {e}", "danger")
 
-    return redirect(url_for('index', user_id=user_id))
+    return write_response(user_id, ORDER_CHANGED)
 
 
 @app.route("/edit_post/<int:post_id>", methods=["GET"])
@@ -568,63 +856,533 @@ def update_post():
     # Novos campos de métricas
     views = request.form.get("views") or 0
     likes = request.form.get("likes") or 0
-    proposals = request.form.get("proposals") or 0
+    proposals = request.form.get("proposals") or 0 # DB usa 'offers'
 
-    # 2. Lógica de Status (SOLD se sell_date preenchido)
-    status = "POSTED"
+    if not all([first_price, post_date]):
+        flash("Todos os campos obrigatórios do post devem ser preenchidos.", "warning")
+        return redirect(url_for('edit_post', post_id=post_id, user_id=user_id))
+
+    # 2. Lógica de Status (sold se sell_date preenchido; o estado vive na tabela `sales`)
+    status = "stock"
     if sell_date:
-        status = "SOLD"
+        status = "sold"
         if not sell_price:
             flash("Erro: A Data da Venda foi preenchida, mas o Preço Vendido está vazio.", "danger")
-            return redirect(url_for('edit_post', post_id=post_id))
-    
+            return redirect(url_for('edit_post', post_id=post_id, user_id=user_id))
+
     # 3. Execução da Atualização
     try:
-        db.execute("""
-            UPDATE posts SET
-                first_price = ?, sell_price = ?, ad_tax = ?, post_date = ?,
-                sell_date = ?, status = ?, views = ?, likes = ?, proposals = ?
-            WHERE id = ? AND user_id = ?
-        """, (first_price, sell_price, ad_tax, post_date, sell_date, status,
-              views, likes, proposals, post_id, user_id))
-
+        def write_post(db):
+            # A posse é validada na mesma transação da escrita.
+            sale = db.execute("SELECT order_id FROM sales WHERE post_id = ? AND user_id = ?", post_id, user_id)
+            if not sale:
+                return None
+            order_id = sale[0]['order_id']
+
+            before = read_models.snapshot(db, order_id)
+
+            db.execute("""
+                UPDATE posts SET
+                    first_price = ?, sell_price = ?, ad_tax = ?, post_date = ?,
+                    sell_date = ?, views = ?, likes = ?, offers = ?
+                WHERE id = ?
+            """, first_price, sell_price, ad_tax, post_date, sell_date,
+                 views, likes, proposals, post_id)
+
+            db.execute("UPDATE sales SET status = ? WHERE post_id = ? AND user_id = ?", status, post_id, user_id)
+
+            read_models.apply_change(db, before, read_models.snapshot(db, order_id))
+            return order_id
+
+        if db.write(write_post) is None:
+            flash("Post não encontrado ou acesso negado.", "danger")
+            return write_response(user_id)
+        dashboard_changed(user_id)
         flash("Post atualizado com sucesso!", "success")
     except Exception as e:
         flash(f"Erro ao atualizar o post: {e}", "danger")
 
-    return redirect(url_for('index', user_id=user_id))
+    return write_response(user_id, POST_CHANGED)
 
 @app.route("/delete_post", methods=["POST"])
 def delete_post():
     """
     Deleta um post.
-    Se o post estava como 'SOLD', o status do produto associado volta para 'STOCK'.
+    A encomenda associada volta para 'stock' (se estava vendida, deixa de contar como venda).
     """
     post_id = request.form.get("post_id")
     user_id = request.form.get("user_id")
-    
-    # 1. Buscar dados atuais do post antes de deletar
-    post = get_post_data(post_id)
-    if not post or post[0]['user_id'] != int(user_id):
-        flash("Post não encontrado ou acesso negado.", "danger")
-        return redirect(url_for('index', user_id=user_id))
-    
-    post_data = post[0]
-    
-    # 2. Deletar o Post
+
     try:
-        db.execute("DELETE FROM posts WHERE id = ? AND user_id = ?", (post_id, user_id))
+        def remove_post(db):
+            # 1. Buscar dados atuais da venda antes de deletar (o estado e a posse vivem em
+            # `sales`), na mesma transação da escrita
+            sale = db.execute("SELECT order_id, status FROM sales WHERE post_id = ? AND user_id = ?", post_id, user_id)
+            if not sale:
+                return None
+            sale_data = sale[0]
+
+            # 2. Deletar o Post
+            before = read_models.snapshot(db, sale_data['order_id'])
+
+            # 3. Regra de negócio: a encomenda volta para STOCK
+            db.execute("UPDATE sales SET post_id = NULL, status = 'stock' WHERE post_id = ? AND user_id = ?", post_id, user_id)
+
+            db.execute("DELETE FROM posts WHERE id = ?", post_id)
+
+            read_models.apply_change(db, before, read_models.snapshot(db, sale_data['order_id']))
+            return sale_data
+
+        sale_data = db.write(remove_post)
+        if sale_data is None:
+            flash("Post não encontrado ou acesso negado.", "danger")
+            return write_response(user_id)
+        dashboard_changed(user_id)
         flash("Post excluído com sucesso!", "success")
-        
-        # 3. Verificar regra de negócio: Se estava vendido, atualizar produto
-        if post_data['status'] == 'SOLD':
-            product_id = post_data['product_id']
-            db.execute("UPDATE products SET status = 'STOCK' WHERE id = ? AND user_id = ?", (product_id, user_id))
-            flash(f"Produto ID {product_id} associado foi movido para STOCK.", "info")
+        if sale_data['status'] == 'sold':
+            flash(f"Encomenda ID {sale_data['order_id']} associada foi movida para STOCK.", "info")
 
     except Exception as e:
         flash(f"Erro ao deletar o post: {e}", "danger")
 
+    return write_response(user_id, POST_CHANGED)
+
+# --- Classificação Geral (todos os utilizadores) ---
+
+# Colunas pelas quais a classificação pode ser ordenada
+LEADERBOARD_SORTS = (
+    "lucro", "faturacao", "gastos", "multiplicador", "invested_stock_cost",
+    "estimated_stock_profit", "tempo_venda_medio", "encomendas_vendidas", "encomendas_stock",
+)
+
+
+def leaderboard_entry(vector, groups=()):
+    """Métricas de calculate_user_metrics_from_data() mais o tempo médio de venda (dias)."""
+    entry = read_models.metrics_from_row(vector, groups)
+    count = vector["dias_venda_count"]
+    entry["tempo_venda_medio"] = vector["dias_venda_total"] / count if count else None
+    return entry
+
+
+def get_leaderboard(sort="lucro", direction="desc"):
+    """
+    Métricas de todos os utilizadores lado a lado e os totais da loja, a partir de uma
+    única consulta agregada (GROUP BY sales.user_id; com shards, uma por shard, em paralelo).
+    Devolve {'users': [...], 'totals': {...}}.
+    """
+    vectors, groups = {}, {}
+    for shard_vectors, shard_groups in db.fan_out(
+            lambda db: (read_models.totals_by_user(db), read_models.projection_groups(db))):
+        vectors.update(shard_vectors)
+        groups.update(shard_groups)
+    users = []
+    for user_id, name in lookup_catalog.names("users").items():
+        vector = vectors.get(user_id, read_models.empty_vector())
+        users.append({"user_id": user_id, "user_name": name, **leaderboard_entry(vector, groups.get(user_id, ()))})
+
+    if sort not in LEADERBOARD_SORTS:
+        sort = "lucro"
+    # Ordenação estável (empates por nome); valores em falta (sem vendas) ficam sempre no fim
+    present = [u for u in users if u[sort] is not None]
+    missing = [u for u in users if u[sort] is None]
+    present.sort(key=lambda u: u[sort], reverse=(direction != "asc"))
+    totals = leaderboard_entry(read_models.sum_vectors(vectors.values()),
+                               [stats for user_groups in groups.values() for stats in user_groups])
+    return {"users": present + missing, "totals": totals, "sort": sort,
+            "direction": "asc" if direction == "asc" else "desc"}
+
+
+@app.route("/leaderboard", methods=["GET"])
+def leaderboard():
+    """Classificação de todos os utilizadores e totais da loja."""
+    data = get_leaderboard(request.args.get("sort", "lucro"), request.args.get("dir", "desc"))
+    return render_template("leaderboard.html", **data)
+
+
+# --- Importação em Massa ---
+
+def run_import(stream, user_id):
+    """Importa um CSV para o utilizador e reconstrói as suas métricas e rollups materializados."""
+    with sharding.use(db, user_id):
+        report = importer.import_csv(db, stream, user_id, lookup_db=catalog_db if SHARD_DIR else None)
+        if report["orders"]:
+            with db.transaction():
+                read_models.rebuild_user(db, user_id)
+                read_models.rebuild_rollups(db, user_id)
+                read_models.rebuild_sale_stats(db, user_id, history=archive.full_history)
+    if report["orders"]:
+        dashboard_changed(user_id)
+    return report
+
+
+@app.route("/import", methods=["POST"])
+def import_orders():
+    """Importa encomendas e posts de um ficheiro CSV enviado pelo formulário."""
+    user_id = request.form.get("user_id")
+    upload = request.files.get("file")
+
+    if not user_id or not user_id.isdigit() or not upload or not upload.filename:
+        flash("Selecione um utilizador e um ficheiro CSV.", "warning")
+        return redirect(url_for('index', user_id=user_id))
+
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        report = run_import(stream, int(user_id))
+    except Exception as e:
+        flash(f"Erro ao importar o CSV: {e}", "danger")
+        return redirect(url_for('index', user_id=user_id))
+
+    flash(f"Importação concluída: {report['orders']} encomendas e {report['posts']} posts.", "success")
+    if report["errors"]:
+        flash(f"{len(report['errors'])} linha(s) ignorada(s).", "warning")
+        for line, message in report["errors"][:10]:
+            flash(f"Linha {line}: {message}", "warning")
+
     return redirect(url_for('index', user_id=user_id))
 
-app.jinja_env.globals.update(format_date_pt=format_date_pt)
\ No newline at end of file
+
+# --- Exportação ---
+
+def parse_iso_date(value):
+    """Valida um parâmetro de data YYYY-MM-DD. Devolve a string, None se vazio, ou levanta ValueError."""
+    if not value:
+        return None
+    return date.fromisoformat(value).isoformat()
+
+
+@app.route("/export/<kind>", methods=["GET"])
+def export_data(kind):
+    """
+    Exporta em streaming o livro de vendas (`sales`), as encomendas (`orders`) ou os posts (`posts`)
+    de um utilizador, em CSV ou JSONL, opcionalmente filtrados por intervalo de datas.
+    """
+    user_id = request.args.get("user_id", type=int)
+    fmt = request.args.get("format", "csv")
+    if kind not in exporter.EXPORTS or fmt not in exporter.FORMATS or user_id is None:
+        abort(400)
+    try:
+        date_from = parse_iso_date(request.args.get("from"))
+        date_to = parse_iso_date(request.args.get("to"))
+    except ValueError:
+        abort(400)
+
+    # O streaming continua depois do fim do pedido (e do encaminhamento): o shard fica fixado já.
+    chunks = exporter.stream(db.current() if SHARD_DIR else db, kind, user_id, fmt, date_from, date_to)
+    filename = f"{kind}_utilizador_{user_id}.{fmt}"
+    return app.response_class(
+        stream_with_context(chunks),
+        mimetype=exporter.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# --- API JSON (só leitura) ---
+
+def conditional_json(user_id, build):
+    """
+    Resposta JSON com ETag derivada da versão dos dados do utilizador.
+    Se o cliente já tiver a versão atual (If-None-Match), devolve 304 sem executar `build`.
+    """
+    if lookup_catalog.name("users", user_id) is None:
+        abort(404)
+
+    version = get_data_version(user_id)
+    etag = hashlib.sha1(f"{version}|{request.full_path}".encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def api_table_page(table, user_id):
+    """Página de uma tabela do dashboard com os parâmetros da API (sort, dir, after, before, history)."""
+    args = {f"{table}_{key}": request.args.get(key) for key in ("sort", "dir", "after", "before")}
+    args["history"] = request.args.get("history")
+    page = get_table_page(table, user_id, args)
+    return {
+        "user_id": user_id,
+        "data": [row.to_dict() for row in page["rows"]],
+        "sort": page["sort"],
+        "direction": page["direction"],
+        "next_cursor": page["next_cursor"],
+        "prev_cursor": page["prev_cursor"],
+    }
+
+
+@app.route("/api/users/<int:user_id>/orders", methods=["GET"])
+def api_orders(user_id):
+    """Encomendas do utilizador (paginadas)."""
+    return conditional_json(user_id, lambda: api_table_page("orders", user_id))
+
+
+@app.route("/api/users/<int:user_id>/posts", methods=["GET"])
+def api_posts(user_id):
+    """Posts do utilizador (paginados)."""
+    return conditional_json(user_id, lambda: api_table_page("posts", user_id))
+
+
+@app.route("/api/users/<int:user_id>/sales", methods=["GET"])
+def api_sales(user_id):
+    """Tabela de vendas concretizadas do utilizador (paginada)."""
+    return conditional_json(user_id, lambda: api_table_page("sales", user_id))
+
+
+@app.route("/api/users/<int:user_id>/metrics", methods=["GET"])
+def api_metrics(user_id):
+    """KPIs do utilizador (os mesmos do dashboard, sobre o histórico completo)."""
+    return conditional_json(user_id, lambda: {"user_id": user_id, "metrics": get_user_metrics(user_id)})
+
+
+def parse_month(value):
+    """Normaliza 'YYYY-MM' ou 'YYYY-MM-DD' para 'YYYY-MM'. Devolve None se vazio, ou levanta ValueError."""
+    date_value = parse_iso_date(f"{value}-01" if value and len(value) == 7 else value)
+    return date_value[:7] if date_value else None
+
+
+@app.route("/api/users/<int:user_id>/trends", methods=["GET"])
+def api_trends(user_id):
+    """
+    Vendas mensais (faturação, lucro, unidades, dias médios até à venda) a partir dos
+    rollups. Parâmetros: `from`/`to` (YYYY-MM) e `by` (brand ou product).
+    """
+    by = request.args.get("by") or None
+    if by not in read_models.TREND_GROUPS:
+        abort(400)
+    try:
+        month_from = parse_month(request.args.get("from"))
+        month_to = parse_month(request.args.get("to"))
+    except ValueError:
+        abort(400)
+
+    def build():
+        rows = read_models.monthly_trends(db, user_id, month_from, month_to, by)
+        if by:
+            names = lookup_catalog.names(f"{by}s")
+            for row in rows:
+                row[f"{by}_name"] = names.get(row[f"{by}_id"])
+        return {"user_id": user_id, "from": month_from, "to": month_to, "by": by, "data": rows}
+
+    return conditional_json(user_id, build)
+
+
+@app.route("/api/users/<int:user_id>/search", methods=["GET"])
+def api_search(user_id):
+    """
+    Pesquisa de texto livre e por facetas nos artigos do utilizador. Parâmetros: `q` (ex.:
+    "Nike tamanho 42 preto por vender"), `status` (lista separada por vírgulas), `date`
+    (order_date, post_date ou sell_date) com `from`/`to`, e `sort`, `dir`, `after`, `before`.
+    """
+    statuses = [s for s in request.args.get("status", "").split(",") if s] or None
+    date_field = request.args.get("date", "order_date")
+    sort = request.args.get("sort", "order_date")
+    if date_field not in search.DATE_FIELDS or sort not in search.SORTS:
+        abort(400)
+    try:
+        date_from = parse_iso_date(request.args.get("from"))
+        date_to = parse_iso_date(request.args.get("to"))
+    except ValueError:
+        abort(400)
+
+    def build():
+        page = search.search(
+            db, user_id, request.args.get("q", ""), statuses, date_field, date_from, date_to,
+            sort=sort, descending=request.args.get("dir") != "asc",
+            after=request.args.get("after"), before=request.args.get("before"),
+        )
+        return {"user_id": user_id, "query": request.args.get("q", ""), "data": page.pop("rows"), **page}
+
+    return conditional_json(user_id, build)
+
+
+@app.route("/api/leaderboard", methods=["GET"])
+def api_leaderboard():
+    """Métricas de todos os utilizadores e totais da loja (ordenáveis por `sort` e `dir`)."""
+    return jsonify(get_leaderboard(request.args.get("sort", "lucro"), request.args.get("dir", "desc")))
+
+
+# --- Ingestão dos contadores de interação (scraper) ---
+
+@app.route("/api/engagement", methods=["POST"])
+def api_engagement():
+    """
+    Recebe contadores de interação (views, likes, offers) de muitos posts, em incrementos
+    ou valores absolutos. São escritos em lote na janela seguinte (ou já, com `?flush=1`).
+    """
+    try:
+        updates = engagement.parse_updates(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    pending = engagement_buffer.add(updates)
+    if request.args.get("flush") == "1":
+        engagement_buffer.flush()
+        pending = engagement_buffer.pending()
+    return jsonify(accepted=len(updates), pending=pending), 202
+
+
+# --- Comandos de Linha de Comando ---
+
+def for_each_shard(fn, user_id=None):
+    """
+    Corre `fn(db)` na base de dados de `user_id` ou, sem utilizador, em todas (com shards,
+    em paralelo, uma vez por shard). Devolve a lista dos resultados.
+    """
+    if user_id is None:
+        return db.fan_out(fn)
+    with sharding.use(db, user_id):
+        return [fn(db)]
+
+
+@app.cli.command("migrate")
+@click.option("--check", "check_only", is_flag=True, help="Apenas verifica os planos de consulta (EXPLAIN QUERY PLAN).")
+def migrate_command(check_only):
+    """Aplica as migrações pendentes do esquema e verifica os planos das consultas críticas."""
+    errors = []
+    for path in DATABASE_PATHS:
+        prefix = f"{path}: " if SHARD_DIR else ""
+        if not check_only:
+            applied = migrations.migrate(path)
+            click.echo(f"{prefix}Migrações aplicadas: {applied or 'nenhuma'}")
+        conn = migrations.connect(path)
+        click.echo(f"{prefix}Versão do esquema: {migrations.current_version(conn)}")
+        conn.close()
+        errors += [prefix + error for error in migrations.check(path)]
+    for error in errors:
+        click.echo(error, err=True)
+    if errors:
+        raise SystemExit(1)
+    click.echo("Planos de consulta OK (sem SCAN nas tabelas de dados).")
+
+
+@app.cli.command("import-csv")
+@click.argument("csv_file", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--user-id", type=int, required=True, help="Utilizador dono das encomendas importadas.")
+def import_csv_command(csv_file, user_id):
+    """Importa encomendas e posts de um CSV (uma encomenda por linha)."""
+    report = run_import(csv_file, user_id)
+    for line, message in report["errors"]:
+        click.echo(f"Linha {line}: {message}", err=True)
+    click.echo(f"Importadas {report['orders']} encomendas e {report['posts']} posts; "
+               f"{len(report['errors'])} linha(s) com erro.")
+
+
+@app.cli.command("export")
+@click.argument("kind", type=click.Choice(list(exporter.EXPORTS)))
+@click.option("--user-id", type=int, required=True)
+@click.option("--format", "fmt", type=click.Choice(list(exporter.FORMATS)), default="csv")
+@click.option("--from", "date_from", help="Data inicial (YYYY-MM-DD).")
+@click.option("--to", "date_to", help="Data final (YYYY-MM-DD).")
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-", help="Ficheiro de saída (stdout por omissão).")
+def export_command(kind, user_id, fmt, date_from, date_to, output):
+    """Exporta em streaming o livro de vendas, encomendas ou posts de um utilizador."""
+    chunks = exporter.stream(db, kind, user_id, fmt, parse_iso_date(date_from), parse_iso_date(date_to))
+    with sharding.use(db, user_id):
+        for chunk in chunks:
+            output.write(chunk)
+
+
+@app.cli.command("metrics-rebuild")
+@click.option("--user-id", type=int, help="Reconstrói apenas este utilizador.")
+def metrics_rebuild_command(user_id):
+    """Reconstrói de raiz a tabela user_metrics a partir do histórico."""
+    def rebuild(db):
+        with db.transaction():
+            if user_id is None:
+                return read_models.rebuild_all(db)
+            read_models.rebuild_user(db, user_id)
+            return 1
+
+    count = sum(for_each_shard(rebuild, user_id))
+    click.echo(f"user_metrics reconstruída para {count} utilizador(es).")
+
+
+@app.cli.command("rollups-rebuild")
+@click.option("--user-id", type=int, help="Reconstrói apenas este utilizador.")
+def rollups_rebuild_command(user_id):
+    """Reconstrói de raiz a tabela monthly_rollups a partir do histórico."""
+    def rebuild(db):
+        with db.transaction():
+            read_models.rebuild_rollups(db, user_id)
+
+    for_each_shard(rebuild, user_id)
+    count = sum(db.fan_out(lambda db: db.execute("SELECT COUNT(*) AS n FROM monthly_rollups")[0]["n"]))
+    click.echo(f"monthly_rollups reconstruída ({count} linhas no total).")
+
+
+@app.cli.command("stats-rebuild")
+@click.option("--user-id", type=int, help="Reconstrói apenas este utilizador.")
+def stats_rebuild_command(user_id):
+    """Reconstrói de raiz sale_stats (estatísticas de venda por grupo) a partir do histórico completo."""
+    def rebuild(db):
+        with db.transaction():
+            read_models.rebuild_sale_stats(db, user_id, history=archive.full_history)
+
+    for_each_shard(rebuild, user_id)
+    count = sum(db.fan_out(lambda db: db.execute("SELECT COUNT(*) AS n FROM sale_stats")[0]["n"]))
+    click.echo(f"sale_stats reconstruída ({count} grupos no total).")
+
+
+@app.cli.command("search-rebuild")
+def search_rebuild_command():
+    """Reconstrói de raiz o índice de pesquisa (search_index) a partir das vendas."""
+    def rebuild(db):
+        with db.transaction():
+            return search.rebuild(db)
+
+    count = sum(db.fan_out(rebuild))
+    click.echo(f"search_index reconstruído ({count} artigos).")
+
+
+@app.cli.command("archive")
+@click.option("--older-than", "days", type=int, default=archive.ARCHIVE_DAYS, show_default=True,
+              help="Arquiva as vendas concretizadas há mais de N dias.")
+def archive_command(days):
+    """Move as vendas antigas para as tabelas de arquivo (os totais não mudam)."""
+    before = archive.cutoff_date(days)
+    count = sum(db.fan_out(lambda db: archive.archive_sold(db, before)))
+    click.echo(f"{count} venda(s) anteriores a {before} arquivada(s); "
+               f"{sum(db.fan_out(archive.archived_count))} no arquivo.")
+
+
+@app.cli.command("engagement-compact")
+@click.option("--older-than", "days", type=int, default=engagement.COMPACT_DAYS, show_default=True,
+              help="Compacta as amostras com mais de N dias.")
+def engagement_compact_command(days):
+    """Reduz o histórico de interações antigo à última amostra de cada post por dia."""
+    before = (date.today() - timedelta(days=days)).isoformat()
+    count = sum(db.fan_out(lambda db: engagement.compact(db, before)))
+    click.echo(f"{count} amostra(s) anteriores a {before} removida(s) de engagement_history.")
+
+
+@app.cli.command("metrics-check")
+@click.option("--user-id", type=int, help="Verifica apenas este utilizador.")
+def metrics_check_command(user_id):
+    """Compara user_metrics com calculate_user_metrics_from_data() e lista as diferenças."""
+    if user_id is None:
+        user_ids = [row["id"] for row in catalog_db.execute("SELECT id FROM users ORDER BY id")]
+    else:
+        user_ids = [user_id]
+
+    mismatches = 0
+    for uid in user_ids:
+        with sharding.use(db, uid):
+            expected = calculate_user_metrics_from_data(*get_user_data(uid, include_archive=True),
+                                                        stats=read_models.load_sale_stats(db, uid))
+            stored = read_models.load_metrics(db, uid)
+        if stored is None:
+            click.echo(f"Utilizador {uid}: sem linha em user_metrics.")
+            continue
+        for key in read_models.compare(expected, stored):
+            mismatches += 1
+            click.echo(f"Utilizador {uid}: {key} guardado={stored[key]!r} recalculado={expected[key]!r}", err=True)
+
+    if mismatches:
+        click.echo(f"{mismatches} diferença(s) encontrada(s). Corra 'flask metrics-rebuild'.", err=True)
+        raise SystemExit(1)
+    click.echo(f"user_metrics consistente para {len(user_ids)} utilizador(es).")
+
+
+app.jinja_env.globals.update(format_date_pt=format_date_pt, page_url=page_url)
\ No newline at end of file
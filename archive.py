@@ -0,0 +1,216 @@
+"""
+Arquivo das vendas antigas (separação entre dados quentes e frios).
+
+As vendas concretizadas há mais de `ARCHIVE_DAYS` dias já não mudam, mas eram lidas em
+todas as consultas do histórico do utilizador. `archive_sold()` move-as (encomenda, posts
+e linha de `sales`) para as tabelas `orders_archive`, `posts_archive` e `sales_archive`
+(criadas pela migração 9) e soma antes a sua contribuição aos resumos do arquivo
+(`archived_metrics` e `archived_rollups`, ver read_models.py). As reconstruções dos modelos
+de leitura somam esses resumos aos dados ativos, pelo que os totais não mudam.
+
+O dashboard, a API, a pesquisa (search.py: as vendas arquivadas saem do `search_index`) e
+as consultas de métricas leem apenas as tabelas ativas. Quem pedir o
+histórico completo (`history=all` no dashboard e na API, as exportações, `flask
+metrics-check`) usa `full_history(sql)`, que reescreve a consulta com um CTE que junta as
+tabelas ativas e arquivadas sob os mesmos nomes. As linhas arquivadas são só de leitura.
+
+Os ids arquivados nunca são reutilizados: orders, posts e sales usam AUTOINCREMENT
+(migração 12, `monotonic_ids()`), pelo que arquivar a linha com o maior id não faz com que
+a próxima inserção o repita (o histórico completo juntaria linhas diferentes com o mesmo id).
+
+    flask archive --older-than 365
+"""
+import re
+from datetime import date, timedelta
+
+import read_models
+
+ARCHIVE_DAYS = 365
+BATCH_SIZE = 10000
+
+# Colunas de cada tabela arquivada, pela ordem do esquema base
+ARCHIVED_TABLES = {
+    "orders": ("id", "product_id", "color_id", "brand_id", "size_id", "price", "deliver_tax",
+               "order_date", "delivery_date"),
+    "posts": ("id", "post_date", "sell_date", "likes", "views", "offers", "ad_tax", "first_price",
+              "sell_price", "order_id"),
+    "sales": ("id", "order_id", "post_id", "user_id", "status"),
+}
+
+_FULL_HISTORY = "WITH " + ", ".join(
+    f"{table} AS (SELECT {', '.join(columns)} FROM main.{table} "
+    f"UNION ALL SELECT {', '.join(columns)} FROM {table}_archive)"
+    for table, columns in ARCHIVED_TABLES.items()
+) + " "
+
+
+def full_history(sql):
+    """
+    Reescreve uma consulta sobre orders/posts/sales para incluir as linhas arquivadas.
+    O CTE tem os nomes das tabelas, pelo que a consulta não muda (e não pode ter o seu próprio WITH).
+    """
+    return _FULL_HISTORY + sql
+
+
+def schema_statements():
+    """Tabelas de arquivo, resumos e índices (usados pela migração 9)."""
+    types = {
+        "orders": ("INTEGER PRIMARY KEY", "INTEGER", "INTEGER", "INTEGER", "INTEGER", "NUMERIC",
+                   "NUMERIC", "TIMESTAMP", "TIMESTAMP"),
+        "posts": ("INTEGER PRIMARY KEY", "TIMESTAMP", "TIMESTAMP", "INTEGER", "INTEGER", "INTEGER",
+                  "NUMERIC", "NUMERIC", "NUMERIC", "INTEGER"),
+        "sales": ("INTEGER PRIMARY KEY", "INTEGER", "INTEGER", "INTEGER", "TEXT"),
+    }
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {table}_archive ("
+        + ", ".join(f"{column} {kind}" for column, kind in zip(columns, types[table])) + ")"
+        for table, columns in ARCHIVED_TABLES.items()
+    ]
+    statements += [
+        "CREATE INDEX IF NOT EXISTS idx_sales_archive_user ON sales_archive (user_id, status, order_id, post_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_archive_order_id ON sales_archive (order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_archive_post_id ON sales_archive (post_id)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_archive_order_id ON posts_archive (order_id)",
+        f"""
+        CREATE TABLE IF NOT EXISTS archived_metrics (
+            user_id INTEGER PRIMARY KEY,
+            {", ".join(f"{c} NUMERIC NOT NULL DEFAULT 0" for c in read_models.METRIC_COLUMNS)}
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS archived_rollups (
+            {", ".join(f"{k} {'TEXT' if k == 'month' else 'INTEGER'} NOT NULL" for k in read_models.ROLLUP_KEY)},
+            {", ".join(f"{c} NUMERIC NOT NULL DEFAULT 0" for c in read_models.ROLLUP_COLUMNS)},
+            PRIMARY KEY ({", ".join(read_models.ROLLUP_KEY)})
+        ) WITHOUT ROWID
+        """,
+    ]
+    return statements
+
+
+_CREATE_TABLE = re.compile(r'^\s*CREATE TABLE\s+(?:IF NOT EXISTS\s+)?"?(\w+)"?', re.IGNORECASE)
+_PRIMARY_KEYS = ('PRIMARY KEY("id")', "PRIMARY KEY(id)", "PRIMARY KEY (id)")
+
+
+def _rebuild_autoincrement(conn, table, sql):
+    """Recria `table` com AUTOINCREMENT (mesmas colunas e linhas). Índices: ver monotonic_ids()."""
+    primary_key = next((key for key in _PRIMARY_KEYS if key in sql), None)
+    if primary_key is None:
+        raise ValueError(f"Chave primária não reconhecida: {sql}")
+    sql = _CREATE_TABLE.sub(f"CREATE TABLE {table}_rebuild", sql, count=1)
+    conn.execute(sql.replace(primary_key, 'PRIMARY KEY("id" AUTOINCREMENT)', 1))
+    names = ", ".join(f'"{row[1]}"' for row in conn.execute(f"PRAGMA table_info({table})"))
+    conn.execute(f"INSERT INTO {table}_rebuild ({names}) SELECT {names} FROM main.{table}")
+    conn.execute(f"DROP TABLE main.{table}")
+    conn.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+
+
+def monotonic_ids(conn):
+    """
+    Migração 12: orders, posts e sales passam a AUTOINCREMENT e o sqlite_sequence parte do
+    maior id ativo ou arquivado. Corre sem chaves estrangeiras ativas (ligação das migrações);
+    os triggers são retirados durante a reconstrução e os índices recriados depois.
+    """
+    schema = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall())
+    rebuild = [table for table in ARCHIVED_TABLES if "AUTOINCREMENT" not in schema[table].upper()]
+    if rebuild:
+        dependents = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL AND "
+            f"(type IN ('trigger', 'view') OR (type = 'index' AND tbl_name IN ({', '.join('?' for _ in rebuild)})))",
+            rebuild,
+        ).fetchall()
+        for kind, name, _ in dependents:
+            if kind != "index":
+                conn.execute(f'DROP {kind.upper()} "{name}"')
+        for table in rebuild:
+            _rebuild_autoincrement(conn, table, schema[table])
+        for _, _, sql in dependents:
+            conn.execute(sql)
+
+    for table in ARCHIVED_TABLES:
+        seq = conn.execute(
+            f"SELECT MAX(id) FROM (SELECT seq AS id FROM sqlite_sequence WHERE name = ? "
+            f"UNION ALL SELECT MAX(id) FROM main.{table} UNION ALL SELECT MAX(id) FROM {table}_archive)",
+            (table,),
+        ).fetchone()[0] or 0
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seq))
+
+
+# Vendas concretizadas antes de `?`, cuja encomenda não tem outras linhas em `sales`.
+# O CROSS JOIN faz a procura partir do índice idx_posts_sell_date (sell_date, id) da migração 4.
+CANDIDATES_QUERY = """
+    SELECT sales.id, sales.order_id, sales.user_id
+    FROM posts
+    CROSS JOIN sales ON sales.post_id = posts.id AND sales.order_id = posts.order_id
+    WHERE posts.sell_date < ? AND sales.status = 'sold' AND posts.sell_price IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM sales AS other WHERE other.order_id = sales.order_id AND other.id <> sales.id)
+    LIMIT ?
+"""
+
+_IN_BATCH = "sales.id IN (SELECT sale_id FROM temp.archive_batch)"
+
+
+def cutoff_date(days=ARCHIVE_DAYS, today=None):
+    """Data (YYYY-MM-DD) a partir da qual as vendas se mantêm ativas."""
+    return ((today or date.today()) - timedelta(days=days)).isoformat()
+
+
+def _archive_batch(db, before, batch_size):
+    db.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS archive_batch (
+            sale_id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL, user_id INTEGER
+        )
+    """)
+    db.execute("DELETE FROM temp.archive_batch")
+    db.execute("INSERT INTO temp.archive_batch (sale_id, order_id, user_id) " + CANDIDATES_QUERY,
+               before, batch_size)
+    count = db.execute("SELECT COUNT(*) AS n FROM temp.archive_batch")[0]["n"]
+    if not count:
+        return 0
+
+    # 1. A contribuição das vendas passa para os resumos do arquivo (totais inalterados).
+    read_models.archive_contributions(db, _IN_BATCH)
+
+    # 2. Cópia para as tabelas de arquivo (posts órfãos da mesma encomenda incluídos).
+    orders_in_batch = "SELECT order_id FROM temp.archive_batch"
+    filters = {"orders": f"id IN ({orders_in_batch})",
+               "posts": f"order_id IN ({orders_in_batch})",
+               "sales": "id IN (SELECT sale_id FROM temp.archive_batch)"}
+    for table, columns in ARCHIVED_TABLES.items():
+        names = ", ".join(columns)
+        db.execute(f"INSERT INTO {table}_archive ({names}) SELECT {names} FROM main.{table} WHERE {filters[table]}")
+
+    # 3. Remoção das tabelas ativas, respeitando as chaves estrangeiras (o trigger de
+    #    `sales` retira também as vendas do índice de pesquisa).
+    for table in ("sales", "posts", "orders"):
+        db.execute(f"DELETE FROM main.{table} WHERE {filters[table]}")
+
+    # 4. Os dados visíveis no dashboard mudaram: novas versões (ETags, cache do pré-cálculo).
+    db.execute("""
+        UPDATE user_metrics SET version = version + 1
+        WHERE user_id IN (SELECT DISTINCT user_id FROM temp.archive_batch)
+    """)
+    db.execute("DELETE FROM temp.archive_batch")
+    return count
+
+
+def archive_sold(db, before, batch_size=BATCH_SIZE):
+    """
+    Arquiva as vendas concretizadas antes da data `before` (YYYY-MM-DD), em transações de
+    até `batch_size` vendas. Devolve o número de vendas arquivadas.
+    """
+    total = 0
+    while True:
+        with db.transaction():
+            count = _archive_batch(db, before, batch_size)
+        total += count
+        if count < batch_size:
+            return total
+
+
+def archived_count(db, user_id=None):
+    """Número de vendas arquivadas (de um utilizador ou no total)."""
+    if user_id is None:
+        return db.execute("SELECT COUNT(*) AS n FROM sales_archive")[0]["n"]
+    return db.execute("SELECT COUNT(*) AS n FROM sales_archive WHERE user_id = ?", user_id)[0]["n"]
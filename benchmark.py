@@ -0,0 +1,166 @@
+"""
+Micro-benchmarks do pipeline do dashboard.
+
+Mede `get_all_lookups()`, `get_user_data()`, `calculate_user_metrics_from_data()` e o
+`index()` completo (através do cliente de testes do Flask) contra uma base de dados
+(normalmente gerada com synthetic.py) e escreve os resultados em JSON, para comparar
+execuções entre commits. Mede também a memória alocada por `get_user_data()` (pico e
+retida pelas linhas devolvidas, com tracemalloc).
+
+    python synthetic.py bench.db --users 1000 --orders 1000000
+    python benchmark.py bench.db --output bench-$(git rev-parse --short HEAD).json
+"""
+import gc
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import click
+
+
+def _stats(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def timeit(function, repeat, warmup=1):
+    """Executa `function` `warmup` vezes sem medir e `repeat` vezes a medir."""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return _stats(samples)
+
+
+def measure_memory(function):
+    """Memória (KiB) alocada por `function()`: pico durante a chamada e retida pelo resultado."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {"peak_kib": peak / 1024, "retained_kib": retained / 1024}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _pick_users(path):
+    """Utilizador com mais encomendas e utilizador mediano (por número de encomendas)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT user_id, COUNT(*) FROM sales WHERE user_id IS NOT NULL GROUP BY user_id ORDER BY 2 DESC"
+        ).fetchall()
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("users", "orders", "posts", "sales")}
+    finally:
+        conn.close()
+    if not rows:
+        raise click.ClickException(f"{path} não tem vendas.")
+    return {"largest": rows[0][0], "median": rows[len(rows) // 2][0]}, dict(rows), counts
+
+
+def run(path, user_ids, repeat):
+    """
+    Corre o benchmark. `SALES_DB` tem de apontar para `path` antes de importar a app.
+    Devolve (tempos, memória).
+    """
+    os.environ["SALES_DB"] = path
+    os.environ.setdefault("SALES_MIGRATE", "1")     # a base de dados medida fica na versão atual
+    import app as sales_app
+
+    client = sales_app.app.test_client()
+    results = {}
+    memory = {}
+
+    def cold_lookups():
+        sales_app.lookup_catalog.invalidate()
+        sales_app.get_all_lookups()
+
+    results["get_all_lookups (frio)"] = timeit(cold_lookups, repeat)
+    results["get_all_lookups"] = timeit(sales_app.get_all_lookups, repeat)
+
+    for label, user_id in user_ids.items():
+        with sales_app.app.app_context():
+            results[f"get_user_data [{label}]"] = timeit(lambda: sales_app.get_user_data(user_id), repeat)
+            memory[f"get_user_data [{label}]"] = measure_memory(lambda: sales_app.get_user_data(user_id))
+            data = sales_app.get_user_data(user_id)
+            results[f"calculate_user_metrics_from_data [{label}]"] = timeit(
+                lambda: sales_app.calculate_user_metrics_from_data(*data), repeat
+            )
+
+        def render_index():
+            response = client.get(f"/?user_id={user_id}")
+            if response.status_code != 200:
+                raise click.ClickException(f"GET /?user_id={user_id} devolveu {response.status_code}")
+
+        results[f"index [{label}]"] = timeit(render_index, repeat)
+    return results, memory
+
+
+@click.command()
+@click.argument("path")
+@click.option("--user-id", type=int, multiple=True,
+              help="Utilizador(es) a medir (por omissão: o maior e o mediano).")
+@click.option("--repeat", default=5, show_default=True, help="Repetições medidas por benchmark.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Ficheiro JSON de resultados (senão, stdout).")
+def main(path, user_id, repeat, output):
+    """Mede o pipeline do dashboard contra a base de dados PATH."""
+    if not os.path.exists(path):
+        raise click.ClickException(f"{path} não existe.")
+    picked, per_user, counts = _pick_users(path)
+    user_ids = {f"user {uid}": uid for uid in user_id} if user_id else picked
+
+    results, memory = run(path, user_ids, repeat)
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "database": {"path": path, **counts},
+        "users": {label: {"id": uid, "orders": per_user.get(uid, 0)} for label, uid in user_ids.items()},
+        "repeat": repeat,
+        "results": results,
+        "memory": memory,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        for name, stats in results.items():
+            click.echo(f"{name:<45} mediana {stats['median_ms']:10.2f} ms")
+        for name, stats in memory.items():
+            click.echo(f"{name:<45} retida  {stats['retained_kib']:10.0f} KiB (pico {stats['peak_kib']:.0f} KiB)")
+    else:
+        click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
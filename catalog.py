@@ -0,0 +1,66 @@
+"""
+Catálogo em memória das tabelas de lookup (utilizadores, produtos, marcas, tamanhos e cores).
+
+As tabelas são lidas uma única vez e servidas a partir da memória. Cada escrita numa tabela
+de lookup incrementa um contador de versão na própria base de dados (via triggers criados
+pela migração 1, ver migrations.py), pelo que vários processos a partilhar o mesmo
+`sales.db` detetam a alteração e recarregam o catálogo.
+"""
+import threading
+
+LOOKUP_TABLES = ("users", "products", "brands", "sizes", "colors")
+
+
+class LookupCatalog:
+    """Cache das tabelas de lookup, invalidada pelo contador `lookup_version`."""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._version = None
+        self._lists = {}
+        self._names = {}
+
+    def current_version(self):
+        """Lê a versão atual do catálogo na base de dados (uma única linha)."""
+        rows = self.db.execute("SELECT version FROM lookup_version WHERE id = 1")
+        return rows[0]["version"] if rows else 0
+
+    def _refresh(self):
+        version = self.current_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            # A versão é lida ANTES das tabelas: se outra escrita ocorrer entretanto,
+            # a próxima verificação vê uma versão nova e volta a carregar.
+            lists = {
+                table: self.db.execute(f"SELECT id, name FROM {table} ORDER BY name")
+                for table in LOOKUP_TABLES
+            }
+            self._names = {
+                table: {row["id"]: row["name"] for row in rows}
+                for table, rows in lists.items()
+            }
+            self._lists = lists
+            self._version = version
+
+    def lists(self):
+        """Devolve {tabela: [{'id', 'name'}, ...]} ordenado por nome, como o antigo get_all_lookups()."""
+        self._refresh()
+        return self._lists
+
+    def names(self, table):
+        """Devolve o mapa id -> nome de uma tabela de lookup."""
+        self._refresh()
+        return self._names[table]
+
+    def name(self, table, lookup_id):
+        """Devolve o nome de um id de lookup, ou None se não existir."""
+        return self.names(table).get(lookup_id)
+
+    def invalidate(self):
+        """Força a recarga na próxima leitura."""
+        with self._lock:
+            self._version = None
@@ -0,0 +1,363 @@
+"""
+Camada de acesso à base de dados SQLite (substitui o wrapper `cs50.SQL`).
+
+Mantém a mesma interface que o resto da aplicação já usa: `db.execute(sql, *args)` devolve
+uma lista de dicts para consultas, o `lastrowid` para INSERT e o número de linhas afetadas
+para UPDATE/DELETE. Por baixo:
+
+- cada thread usa a sua própria ligação `sqlite3`, retirada de um pool de ligações já
+  abertas e configuradas e devolvida ao pool no fim do pedido (`release()`), pelo que as
+  ligações (e a sua cache de páginas e de statements preparados) são reutilizadas;
+- a base de dados corre em modo WAL (leitores não bloqueiam o escritor) com
+  `synchronous=NORMAL`, cache de páginas e `mmap` configuráveis;
+- as transações são explícitas (`with db.transaction():`), abertas com BEGIN IMMEDIATE
+  para que o lock de escrita seja tomado logo no início; transações aninhadas usam
+  SAVEPOINTs;
+- as escritas das rotas passam por `db.write(fn)`: com o group commit ativo
+  (`enable_group_commit()`), uma thread de escrita junta as escritas concorrentes numa
+  única transação (cada uma no seu SAVEPOINT, pelo que continua atómica) e faz um só
+  COMMIT (um só fsync) por grupo.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+POOL_SIZE = 8
+
+# PRAGMAs aplicados a cada ligação nova
+PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -32768,        # KiB (32 MiB por ligação)
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",        # o cs50 também ativava as chaves estrangeiras
+}
+
+CACHED_STATEMENTS = 256
+
+
+@lru_cache(maxsize=1024)
+def _command(sql):
+    """Primeira palavra do SQL em maiúsculas (INSERT, UPDATE, ...)."""
+    words = sql.split(None, 1)
+    return words[0].upper() if words else ""
+
+
+def _rows(cursor):
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+class Database:
+    """Pool de ligações SQLite (uma por thread) com a interface `execute()` do cs50."""
+
+    def __init__(self, path, pool_size=POOL_SIZE, pragmas=None, timeout=30):
+        self.path = path
+        self.pool_size = pool_size
+        self.pragmas = dict(PRAGMAS, **(pragmas or {}))
+        self.timeout = timeout
+        self._local = threading.local()
+        self._idle = []
+        self._lock = threading.Lock()
+        # Hook opcional chamado como on_query(sql, segundos) depois de cada consulta
+        # (ver instrumentation.py). None = sem instrumentação.
+        self.on_query = None
+        # Thread de escrita com group commit (enable_group_commit()). None = desligado.
+        self.group_commit = None
+
+        # O modo WAL é persistente no ficheiro: basta ativá-lo uma vez, na primeira ligação
+        # (criar o Database não toca no ficheiro).
+        self._wal = False
+
+    # --- Pool ---
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,            # autocommit: as transações são explícitas
+            timeout=self.timeout,
+            check_same_thread=False,         # a ligação muda de thread ao passar pelo pool
+            cached_statements=CACHED_STATEMENTS,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if not self._wal:
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._wal = True
+        return conn
+
+    def _get(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _put(self, conn):
+        if conn.in_transaction:
+            # Nunca devolver ao pool uma ligação com uma transação pendente.
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def connection(self):
+        """Ligação da thread atual (retirada do pool no primeiro uso)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._get()
+            self._local.depth = 0
+        return conn
+
+    def release(self):
+        """Devolve ao pool a ligação da thread atual (chamado no fim de cada pedido)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.depth:
+            return
+        self._local.conn = None
+        self._put(conn)
+
+    def close(self):
+        """Fecha todas as ligações inativas do pool (e pára a thread de group commit)."""
+        if self.group_commit is not None:
+            self.group_commit.stop()
+            self.group_commit = None
+        self.release()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    # --- Consultas ---
+
+    def execute(self, sql, *args):
+        """
+        Executa uma instrução. Devolve uma lista de dicts (consultas), o id da linha
+        inserida (INSERT), o número de linhas afetadas (UPDATE/DELETE) ou True.
+        """
+        if self.on_query is None:
+            return self._execute(sql, args)
+        start = time.perf_counter()
+        try:
+            return self._execute(sql, args)
+        finally:
+            self._record(sql, time.perf_counter() - start)
+
+    def _record(self, sql, elapsed):
+        # Na thread de escrita, as consultas de cada escrita ficam com a escrita (`trace`) e
+        # são entregues ao hook pela thread que a submeteu (ver GroupCommitter.submit).
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.append((sql, elapsed))
+        else:
+            self.on_query(sql, elapsed)
+
+    def _execute(self, sql, args):
+        cursor = self.connection().execute(sql, args)
+        if cursor.description is not None:
+            return _rows(cursor)
+        command = _command(sql)
+        if command in ("INSERT", "REPLACE"):
+            return cursor.lastrowid if cursor.rowcount > 0 else None
+        if command in ("UPDATE", "DELETE"):
+            return cursor.rowcount
+        return True
+
+    def execute_as(self, row_class, sql, *args, **extra):
+        """
+        Executa uma consulta e constrói cada linha diretamente como `row_class(*valores,
+        **extra)`, sem dicts intermédios (ver rows.py). As colunas do resultado têm de ser
+        `row_class.COLUMNS`, pela mesma ordem.
+        """
+        if self.on_query is None:
+            return self._execute_as(row_class, sql, args, extra)
+        start = time.perf_counter()
+        try:
+            return self._execute_as(row_class, sql, args, extra)
+        finally:
+            self._record(sql, time.perf_counter() - start)
+
+    def _execute_as(self, row_class, sql, args, extra):
+        cursor = self.connection().execute(sql, args)
+        columns = tuple(column[0] for column in cursor.description)
+        if columns != row_class.COLUMNS:
+            raise ValueError(f"Colunas {columns} não correspondem a {row_class.__name__}")
+        return [row_class(*row, **extra) for row in cursor]
+
+    def executemany(self, sql, seq_of_args):
+        """Executa a mesma instrução para cada tuplo de parâmetros. Devolve as linhas afetadas."""
+        if self.on_query is None:
+            return self.connection().executemany(sql, seq_of_args).rowcount
+        start = time.perf_counter()
+        try:
+            return self.connection().executemany(sql, seq_of_args).rowcount
+        finally:
+            self._record(sql, time.perf_counter() - start)
+
+    def iterate(self, sql, *args):
+        """
+        Gera as linhas (dicts) de uma consulta uma a uma, sem as materializar numa lista.
+        Usa uma ligação própria do pool, para que um gerador consumido aos poucos (ex.:
+        uma resposta em streaming) não prenda a ligação da thread numa leitura.
+        """
+        conn = self._get()
+        cursor = None
+        try:
+            cursor = conn.execute(sql, args)
+            columns = [column[0] for column in cursor.description]
+            for row in cursor:
+                yield dict(zip(columns, row))
+        finally:
+            if cursor is not None:
+                cursor.close()
+            self._put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Executa um bloco numa transação (COMMIT no fim, ROLLBACK em caso de erro).
+        Dentro de outra transação abre um SAVEPOINT, que só desfaz o bloco interior.
+        """
+        conn = self.connection()
+        depth = self._local.depth
+        if depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        else:
+            conn.execute(f"SAVEPOINT sp_{depth}")
+        self._local.depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            self._local.depth = depth
+            if depth == 0:
+                conn.execute("ROLLBACK")
+            else:
+                conn.execute(f"ROLLBACK TO sp_{depth}")
+                conn.execute(f"RELEASE sp_{depth}")
+            raise
+        self._local.depth = depth
+        if depth == 0:
+            conn.execute("COMMIT")
+        else:
+            conn.execute(f"RELEASE sp_{depth}")
+
+    # --- Escritas ---
+
+    def write(self, fn):
+        """
+        Executa `fn(db)` atomicamente e devolve o seu resultado (ou levanta a sua exceção).
+        Com o group commit ativo a escrita é feita pela thread de escrita, partilhando o
+        COMMIT com as escritas concorrentes; caso contrário (ou dentro de uma transação já
+        aberta nesta thread) corre aqui numa transação própria.
+        """
+        if self.group_commit is None or getattr(self._local, "depth", 0):
+            with self.transaction():
+                return fn(self)
+        return self.group_commit.submit(fn)
+
+    def fan_out(self, fn):
+        """
+        Corre `fn(db)` em cada base de dados com dados de utilizadores e devolve a lista dos
+        resultados: aqui só esta; com shards, todos eles (ver sharding.ShardRouter).
+        """
+        return [fn(self)]
+
+    def enable_group_commit(self, max_batch=None):
+        """Liga o group commit das escritas feitas com `write()`. Devolve o GroupCommitter."""
+        if self.group_commit is None:
+            self.group_commit = GroupCommitter(self, max_batch or GROUP_COMMIT_BATCH)
+        return self.group_commit
+
+
+GROUP_COMMIT_BATCH = 64
+
+
+class _WriteJob:
+    __slots__ = ("fn", "done", "result", "error", "queries")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.queries = []       # (sql, segundos) das consultas da escrita, com on_query ativo
+
+
+class GroupCommitter:
+    """
+    Thread única de escrita. Cada grupo é tudo o que estiver na fila quando a thread fica
+    livre (até `max_batch`): sem espera artificial, com pouca carga cada escrita faz o seu
+    COMMIT; em rajada, as escritas que chegam durante um COMMIT partilham o seguinte.
+    Cada escrita corre num SAVEPOINT: uma escrita que falha só desfaz as suas alterações.
+    As consultas de cada escrita são passadas ao hook `on_query` na thread que a submeteu,
+    pelo que a instrumentação as conta no pedido que fez a escrita.
+    """
+
+    def __init__(self, db, max_batch=GROUP_COMMIT_BATCH):
+        self.db = db
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self.stats = {"writes": 0, "commits": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """Põe `fn(db)` na fila e espera pelo COMMIT do seu grupo."""
+        job = _WriteJob(fn)
+        self._queue.put(job)
+        job.done.wait()
+        if self.db.on_query is not None:
+            for sql, elapsed in job.queries:
+                self.db.on_query(sql, elapsed)
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._queue.put(None)
+                    break
+                batch.append(job)
+            self._commit(batch)
+        self.db.release()
+
+    def _commit(self, batch):
+        try:
+            with self.db.transaction():
+                for job in batch:
+                    self.db._local.trace = job.queries
+                    try:
+                        with self.db.transaction():
+                            job.result = job.fn(self.db)
+                    except BaseException as e:
+                        job.error = e
+                    finally:
+                        self.db._local.trace = None
+        except BaseException as e:
+            # O COMMIT (ou o BEGIN) falhou: nenhuma escrita do grupo ficou gravada.
+            for job in batch:
+                if job.error is None:
+                    job.error = e
+        self.stats["writes"] += len(batch)
+        self.stats["commits"] += 1
+        self.stats["failed"] += sum(1 for job in batch if job.error is not None)
+        for job in batch:
+            job.done.set()
@@ -0,0 +1,282 @@
+"""
+Ingestão em lote dos contadores de interação dos posts (visualizações, gostos, propostas).
+
+Um scraper envia para `POST /api/engagement`, de poucos em poucos minutos, os contadores
+de milhares de posts: incrementos (`delta`) ou valores absolutos (`set`). Os pedidos não
+escrevem na base de dados: `EngagementBuffer.add()` junta as atualizações em memória por
+post (um valor absoluto substitui o que estava pendente; os incrementos somam-se) e uma
+thread aplica-as a cada `window` segundos com um único `executemany` sobre `posts`, pela
+mesma via das outras escritas (`db.write()`, com group commit; com shards, em paralelo
+em cada um). Uma escrita que falha volta a juntar-se às pendentes.
+
+O histórico fica em `engagement_history` (criada pela migração 10), uma linha por post e
+por alteração dos contadores, escrita por um trigger em `posts` (inclui as edições feitas
+em /update_post). Como as atualizações são coalescidas, cada escrita gera no máximo uma
+linha por post; `compact()` (e `flask engagement-compact`) reduz as amostras antigas à
+última de cada dia. As consultas do dashboard não leem esta tabela.
+
+Variáveis de ambiente:
+    SALES_ENGAGEMENT_WINDOW=2     segundos entre escritas (0 = escrever em cada pedido)
+"""
+import json
+import logging
+import os
+import threading
+
+COUNTERS = ("views", "likes", "offers")
+MODES = ("delta", "set")
+
+WINDOW = 2.0            # segundos entre escritas
+MAX_PENDING = 50_000    # posts pendentes a partir dos quais a escrita é antecipada
+MAX_UPDATES = 10_000    # atualizações por pedido
+COMPACT_DAYS = 7        # amostras mais antigas do que isto ficam reduzidas a uma por dia
+
+log = logging.getLogger(__name__)
+
+# Por contador: (atualizado?, valor absoluto ou NULL, incremento). Os contadores não
+# atualizados mantêm o valor (incluindo NULL); os resultados nunca ficam negativos.
+APPLY_SQL = "UPDATE posts SET " + ", ".join(
+    f"{column} = CASE WHEN ? THEN MAX(COALESCE(?, {column}, 0) + ?, 0) ELSE {column} END"
+    for column in COUNTERS
+) + " WHERE id = ?"
+
+# Posts existentes e utilizadores dos posts atualizados (`?` = lista JSON de post ids)
+_POSTS_IN = "SELECT value FROM json_each(?)"
+POSTS_FOUND = f"SELECT id FROM posts WHERE id IN ({_POSTS_IN})"
+USERS_QUERY = f"SELECT DISTINCT user_id FROM sales WHERE post_id IN ({_POSTS_IN}) AND user_id IS NOT NULL"
+BUMP_VERSIONS = f"""
+    UPDATE user_metrics SET version = version + 1
+    WHERE user_id IN (SELECT user_id FROM sales WHERE post_id IN ({_POSTS_IN}))
+"""
+
+
+def schema_statements():
+    """Tabela do histórico e trigger que a alimenta (usados pela migração 10)."""
+    changed = " OR ".join(f"NEW.{column} IS NOT OLD.{column}" for column in COUNTERS)
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS engagement_history (
+            post_id INTEGER NOT NULL,
+            recorded_at TEXT NOT NULL,
+            {", ".join(f"{column} INTEGER" for column in COUNTERS)},
+            PRIMARY KEY (post_id, recorded_at)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_engagement_history_recorded_at ON engagement_history (recorded_at)",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS posts_engagement_history
+        AFTER UPDATE OF {", ".join(COUNTERS)} ON posts
+        WHEN {changed}
+        BEGIN
+            INSERT OR REPLACE INTO engagement_history (post_id, recorded_at, {", ".join(COUNTERS)})
+            VALUES (NEW.id, strftime('%Y-%m-%d %H:%M:%S', 'now'), {", ".join(f"NEW.{c}" for c in COUNTERS)});
+        END
+        """,
+    ]
+
+
+# Amostras anteriores a `?` que não são a última do seu dia (para o mesmo post)
+COMPACT_SQL = """
+    DELETE FROM engagement_history
+    WHERE recorded_at < ? AND recorded_at < (
+        SELECT MAX(later.recorded_at) FROM engagement_history AS later
+        WHERE later.post_id = engagement_history.post_id
+          AND later.recorded_at >= date(engagement_history.recorded_at)
+          AND later.recorded_at < date(engagement_history.recorded_at, '+1 day')
+    )
+"""
+
+
+def compact(db, before):
+    """Reduz as amostras anteriores a `before` (YYYY-MM-DD) à última de cada dia. Devolve as removidas."""
+    with db.transaction():
+        return db.execute(COMPACT_SQL, before)
+
+
+def history(db, post_id):
+    """Amostras de um post, da mais antiga para a mais recente."""
+    return db.execute(
+        f"SELECT recorded_at, {', '.join(COUNTERS)} FROM engagement_history "
+        "WHERE post_id = ? ORDER BY recorded_at",
+        post_id,
+    )
+
+
+# --- Validação do pedido ---
+
+def _count(value, name, allow_negative):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{name} tem de ser um inteiro")
+    if value < 0 and not allow_negative:
+        raise ValueError(f"{name} não pode ser negativo num valor absoluto")
+    return value
+
+
+def parse_updates(payload, max_updates=MAX_UPDATES):
+    """
+    Valida o corpo de um pedido: {"mode": "delta"|"set", "updates": [{"post_id": 1,
+    "views": 10, ...}, ...]}; cada atualização pode ter o seu próprio "mode".
+    Devolve [(post_id, mode, {contador: valor})]. Levanta ValueError se for inválido.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("updates"), list):
+        raise ValueError('O corpo tem de ser um objeto JSON com a lista "updates"')
+    default_mode = payload.get("mode", "delta")
+    if default_mode not in MODES:
+        raise ValueError(f"Modo desconhecido: {default_mode!r}")
+    if len(payload["updates"]) > max_updates:
+        raise ValueError(f"No máximo {max_updates} atualizações por pedido")
+
+    updates = []
+    for i, item in enumerate(payload["updates"]):
+        if not isinstance(item, dict):
+            raise ValueError(f"updates[{i}] tem de ser um objeto")
+        mode = item.get("mode", default_mode)
+        if mode not in MODES:
+            raise ValueError(f"updates[{i}]: modo desconhecido {mode!r}")
+        post_id = _count(item.get("post_id"), f"updates[{i}].post_id", False)
+        values = {column: _count(item[column], f"updates[{i}].{column}", mode == "delta")
+                  for column in COUNTERS if item.get(column) is not None}
+        if values:
+            updates.append((post_id, mode, values))
+    return updates
+
+
+# --- Coalescência e escrita ---
+
+def _empty():
+    # Por contador: [valor absoluto (ou None), incremento]
+    return [[None, 0] for _ in COUNTERS]
+
+
+def _merge(older, newer):
+    """Junta duas atualizações pendentes do mesmo post (`newer` aplicada depois de `older`)."""
+    for old, new in zip(older, newer):
+        if new[0] is not None:
+            old[0], old[1] = new
+        else:
+            old[1] += new[1]
+    return older
+
+
+class EngagementBuffer:
+    """Atualizações pendentes (post_id -> contadores) e thread que as escreve a cada `window` s."""
+
+    def __init__(self, db, window=WINDOW, max_pending=MAX_PENDING, on_flush=None):
+        self.db = db
+        self.window = window
+        self.max_pending = max_pending
+        self.on_flush = on_flush        # on_flush(user_ids) depois de cada escrita confirmada
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self.stats = {"received": 0, "coalesced": 0, "flushes": 0, "written": 0, "failed": 0}
+        self._thread = None
+        if window > 0:
+            self._thread = threading.Thread(target=self._run, name="engagement-flush", daemon=True)
+            self._thread.start()
+
+    def add(self, updates):
+        """Junta as atualizações de `parse_updates()` às pendentes. Devolve o número de posts pendentes."""
+        with self._lock:
+            for post_id, mode, values in updates:
+                entry = self._pending.get(post_id)
+                if entry is None:
+                    entry = self._pending[post_id] = _empty()
+                else:
+                    self.stats["coalesced"] += 1
+                for column, slot in zip(COUNTERS, entry):
+                    if column not in values:
+                        continue
+                    if mode == "set":
+                        slot[0], slot[1] = values[column], 0
+                    else:
+                        slot[1] += values[column]
+            self.stats["received"] += len(updates)
+            pending = len(self._pending)
+        if self._thread is None:
+            self.flush()
+        elif pending >= self.max_pending:
+            self._wakeup.set()
+        return pending
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Escreve as atualizações pendentes (um executemany). Devolve o número de posts escritos."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            params = []
+            for post_id, entry in batch.items():
+                row = []
+                for absolute, delta in entry:
+                    row += [absolute is not None or delta != 0, absolute, delta]
+                params.append(row + [post_id])
+            post_ids = json.dumps(list(batch))
+
+            def apply(db):
+                db.executemany(APPLY_SQL, params)
+                # Os contadores aparecem no dashboard: novas versões (ETags, pré-cálculo).
+                db.execute(BUMP_VERSIONS, post_ids)
+                found = [row["id"] for row in db.execute(POSTS_FOUND, post_ids)]
+                return found, [row["user_id"] for row in db.execute(USERS_QUERY, post_ids)]
+
+            def write(db):
+                try:
+                    return db.write(apply)
+                except Exception as e:
+                    return e
+
+            # Com shards, cada um escreve os seus posts (os outros ids não mudam nada).
+            results = self.db.fan_out(write)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                # Volta a juntar às pendentes (antes das que chegaram entretanto) os posts
+                # que não foram escritos, para não aplicar duas vezes os incrementos.
+                written = {post_id for result in results if not isinstance(result, Exception)
+                           for post_id in result[0]}
+                with self._lock:
+                    retry = {post_id: entry for post_id, entry in batch.items() if post_id not in written}
+                    for post_id, entry in self._pending.items():
+                        retry[post_id] = _merge(retry.get(post_id) or _empty(), entry)
+                    self._pending = retry
+                    self.stats["failed"] += 1
+                raise errors[0]
+            user_ids = [user_id for _, users in results for user_id in users]
+            self.stats["flushes"] += 1
+            self.stats["written"] += len(params)
+        if self.on_flush is not None:
+            self.on_flush(user_ids)
+        return len(params)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Falha ao escrever os contadores de interação (nova tentativa na próxima janela)")
+            finally:
+                self.db.release()
+
+    def close(self):
+        """Pára a thread e escreve o que estiver pendente."""
+        self._stopped = True
+        if self._thread is not None:
+            self._wakeup.set()
+            self._thread.join()
+        self.flush()
+
+
+def init(db, on_flush=None, window=None):
+    """Cria o EngagementBuffer (janela em `window` ou em SALES_ENGAGEMENT_WINDOW)."""
+    if window is None:
+        window = float(os.environ.get("SALES_ENGAGEMENT_WINDOW", WINDOW))
+    return EngagementBuffer(db, window=window, on_flush=on_flush)
@@ -0,0 +1,169 @@
+"""
+Exportação em streaming (CSV ou JSONL) do histórico de um utilizador.
+
+As linhas são lidas de um cursor SQLite uma a uma e escritas em blocos de texto, sem
+nunca materializar o resultado completo numa lista do Python.
+
+A ordem por data não vem de nenhum índice (não há um índice por utilizador e data, e o
+histórico completo junta tabelas ativas e arquivadas): o SQLite ordena o resultado numa
+B-tree temporária antes da primeira linha e, com `temp_store = MEMORY` (database.PRAGMAS),
+essa ordenação ocupa memória proporcional ao tamanho da exportação.
+"""
+import csv
+import io
+import json
+
+import archive
+from helpers import calculate_days_diff
+
+CHUNK_SIZE = 64 * 1024
+
+_LOOKUP_JOINS = """
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+"""
+
+
+def _ledger_row(row):
+    """Linha do livro de vendas: mesmas contas da tabela de vendas do dashboard."""
+    row["days_to_sale"] = calculate_days_diff(row["post_date"], row["sell_date"])
+    row["days_total"] = calculate_days_diff(row["order_date"], row["sell_date"])
+    return row
+
+
+# Tipo de exportação -> consulta, coluna usada no filtro de datas e colunas de saída
+EXPORTS = {
+    "sales": {
+        "query": """
+            SELECT
+                posts.id AS post_id, orders.id AS order_id,
+                products.name AS product, brands.name AS brand, sizes.name AS size, colors.name AS color,
+                orders.order_date, posts.post_date, posts.sell_date,
+                (COALESCE(orders.price, 0) + COALESCE(orders.deliver_tax, 0)) AS cost,
+                COALESCE(posts.ad_tax, 0) AS ad_tax,
+                (COALESCE(orders.price, 0) + COALESCE(orders.deliver_tax, 0) + COALESCE(posts.ad_tax, 0)) AS total_cost,
+                posts.sell_price,
+                (posts.sell_price - COALESCE(orders.price, 0) - COALESCE(orders.deliver_tax, 0) - COALESCE(posts.ad_tax, 0)) AS profit
+            FROM posts
+            JOIN orders ON orders.id = posts.order_id
+        """ + _LOOKUP_JOINS + """
+            JOIN sales ON sales.post_id = posts.id
+            WHERE sales.user_id = ? AND sales.status = 'sold'
+              AND posts.sell_price IS NOT NULL AND posts.sell_date IS NOT NULL
+        """,
+        "date_column": "posts.sell_date",
+        "order_by": "posts.sell_date, posts.id",
+        "columns": (
+            "post_id", "order_id", "product", "brand", "size", "color", "order_date", "post_date",
+            "sell_date", "cost", "ad_tax", "total_cost", "sell_price", "profit", "days_to_sale", "days_total",
+        ),
+        "derive": _ledger_row,
+    },
+    "orders": {
+        "query": """
+            SELECT
+                orders.id AS order_id, sales.status, sales.post_id,
+                products.name AS product, brands.name AS brand, sizes.name AS size, colors.name AS color,
+                orders.price, orders.deliver_tax, orders.order_date, orders.delivery_date
+            FROM orders
+        """ + _LOOKUP_JOINS + """
+            JOIN sales ON sales.order_id = orders.id
+            WHERE sales.user_id = ?
+        """,
+        "date_column": "orders.order_date",
+        "order_by": "orders.order_date, orders.id",
+        "columns": (
+            "order_id", "status", "post_id", "product", "brand", "size", "color",
+            "price", "deliver_tax", "order_date", "delivery_date",
+        ),
+        "derive": None,
+    },
+    "posts": {
+        "query": """
+            SELECT
+                posts.id AS post_id, orders.id AS order_id, sales.status,
+                products.name AS product, brands.name AS brand, sizes.name AS size, colors.name AS color,
+                posts.post_date, posts.first_price, posts.sell_price, posts.ad_tax, posts.sell_date,
+                posts.views, posts.likes, posts.offers
+            FROM posts
+            JOIN orders ON orders.id = posts.order_id
+        """ + _LOOKUP_JOINS + """
+            JOIN sales ON sales.post_id = posts.id
+            WHERE sales.user_id = ?
+        """,
+        "date_column": "posts.post_date",
+        "order_by": "posts.post_date, posts.id",
+        "columns": (
+            "post_id", "order_id", "status", "product", "brand", "size", "color", "post_date",
+            "first_price", "sell_price", "ad_tax", "sell_date", "views", "likes", "offers",
+        ),
+        "derive": None,
+    },
+}
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def iter_rows(db, kind, user_id, date_from=None, date_to=None, include_archive=True):
+    """
+    Gera as linhas (dicts) de uma exportação, uma de cada vez, a partir de um cursor.
+    Por omissão inclui as vendas arquivadas (histórico completo).
+    """
+    export = EXPORTS[kind]
+    sql = export["query"]
+    params = [user_id]
+    if date_from:
+        sql += f" AND {export['date_column']} >= ?"
+        params.append(date_from)
+    if date_to:
+        sql += f" AND {export['date_column']} <= ?"
+        params.append(date_to)
+    sql += f" ORDER BY {export['order_by']}"
+    if include_archive:
+        sql = archive.full_history(sql)
+
+    derive = export["derive"]
+    for row in db.iterate(sql, *params):
+        yield derive(row) if derive else row
+
+
+def _chunked(lines):
+    """Agrupa linhas de texto em blocos de ~CHUNK_SIZE para reduzir o número de escritas."""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _csv_lines(rows, columns):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    yield out.getvalue()
+    for row in rows:
+        out.seek(0)
+        out.truncate()
+        writer.writerow([row[c] for c in columns])
+        yield out.getvalue()
+
+
+def _jsonl_lines(rows, columns):
+    for row in rows:
+        yield json.dumps({c: row[c] for c in columns}, ensure_ascii=False) + "\n"
+
+
+def stream(db, kind, user_id, fmt="csv", date_from=None, date_to=None, include_archive=True):
+    """Gerador de blocos de texto com a exportação no formato pedido (csv ou jsonl)."""
+    rows = iter_rows(db, kind, user_id, date_from, date_to, include_archive)
+    columns = EXPORTS[kind]["columns"]
+    lines = _csv_lines(rows, columns) if fmt == "csv" else _jsonl_lines(rows, columns)
+    return _chunked(lines)
@@ -0,0 +1,59 @@
+"""Funções auxiliares de datas partilhadas pela aplicação e pelos modelos de leitura."""
+from datetime import date, datetime
+from functools import lru_cache
+
+
+@lru_cache(maxsize=65536)
+def _parse_date(date_str):
+    # strptime aceita '2025-1-5'; só a forma ISO exata conta, como date(x) = x no SQLite
+    # (read_models), para o leaderboard e as métricas em Python contarem as mesmas vendas.
+    try:
+        parsed = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except Exception:
+        return None
+    return parsed if parsed.isoformat() == date_str else None
+
+
+def parse_date(date_str):
+    """
+    Converte 'YYYY-MM-DD' num `date` (None se a entrada for inválida ou sem zeros à esquerda).
+    Memoizada: num histórico as mesmas datas repetem-se em muitas linhas.
+    """
+    if not isinstance(date_str, str):
+        return None
+    return _parse_date(date_str)
+
+
+def calculate_days_diff(start_date_str, end_date_str=None, today=None):
+    """
+    Calcula a diferença em dias.
+    Se end_date_str for None, calcula até `today` (por omissão, a data de hoje).
+    Retorna None se alguma das datas for inválida.
+    """
+    start_date = parse_date(start_date_str)
+    if start_date is None:
+        return None
+
+    if end_date_str:
+        end_date = parse_date(end_date_str)
+        if end_date is None:
+            return None
+    else:
+        end_date = today or date.today() # Usa data atual se não houver data final
+
+    return (end_date - start_date).days
+
+
+@lru_cache(maxsize=65536)
+def _format_date_pt(date_str):
+    dt_obj = _parse_date(date_str)
+    return dt_obj.strftime('%d/%m/%Y') if dt_obj else date_str
+
+
+def format_date_pt(date_str):
+    """Formata a data de YYYY-MM-DD para DD/MM/YYYY. Retorna None se a entrada for None."""
+    if not date_str:
+        return None
+    if not isinstance(date_str, str):
+        return date_str
+    return _format_date_pt(date_str)
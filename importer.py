@@ -0,0 +1,234 @@
+"""
+Importação em massa de encomendas e posts a partir de CSV.
+
+Cada linha do CSV é uma encomenda e, opcionalmente, o seu post. Os nomes de produto, marca,
+tamanho e cor são resolvidos contra as tabelas de lookup (criando os que faltam). As linhas
+são validadas com as mesmas regras de `add_order`/`add_post` e escritas com `executemany`
+em transações por lote. Linhas inválidas não interrompem a importação: ficam no relatório.
+
+Colunas (cabeçalho obrigatório; as restantes são ignoradas):
+    product, brand, size, color, price, deliver_tax, order_date, delivery_date,
+    first_price, sell_price, ad_tax, post_date, sell_date, views, likes, offers (ou proposals)
+"""
+import csv
+import re
+from datetime import date
+from functools import lru_cache
+
+BATCH_SIZE = 5000
+
+# Coluna do CSV -> tabela de lookup
+LOOKUP_COLUMNS = {"product": "products", "brand": "brands", "size": "sizes", "color": "colors"}
+
+
+class CSVImportError(Exception):
+    """Erro fatal de importação (ficheiro sem cabeçalho, utilizador inexistente...)."""
+
+
+def _text(row, column):
+    value = (row.get(column) or "").strip()
+    return value or None
+
+
+def _number(row, column, default=None):
+    value = _text(row, column)
+    if value is None:
+        return default
+    try:
+        number = float(value.replace(",", "."))
+    except ValueError:
+        raise ValueError(f"'{column}' não é um número: {value!r}")
+    return int(number) if number.is_integer() else number
+
+
+def _integer(row, column):
+    number = _number(row, column, 0)
+    if not isinstance(number, int):
+        raise ValueError(f"'{column}' tem de ser inteiro: {number!r}")
+    return number
+
+
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+@lru_cache(maxsize=4096)
+def _is_date(value):
+    # As datas repetem-se muito num CSV: validar cada valor distinto uma só vez.
+    if not _DATE_PATTERN.fullmatch(value):
+        return False
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _date(row, column):
+    value = _text(row, column)
+    if value is None:
+        return None
+    if not _is_date(value):
+        raise ValueError(f"'{column}' não é uma data YYYY-MM-DD: {value!r}")
+    return value
+
+
+def parse_row(row):
+    """
+    Valida uma linha do CSV e devolve {'order': {...}, 'post': {...} ou None}.
+    Levanta ValueError com a mensagem a reportar.
+    """
+    if "proposals" in row and not row.get("offers"):
+        row = dict(row, offers=row["proposals"])
+
+    order = {column: _text(row, column) for column in LOOKUP_COLUMNS}
+    order["price"] = _number(row, "price")
+    order["deliver_tax"] = _number(row, "deliver_tax", 0)
+    order["order_date"] = _date(row, "order_date")
+    order["delivery_date"] = _date(row, "delivery_date")
+
+    required = [order[c] for c in LOOKUP_COLUMNS] + [order["price"], order["order_date"]]
+    if any(value is None for value in required):
+        raise ValueError("Todos os campos obrigatórios do pedido devem ser preenchidos.")
+
+    # Mesma regra de add_order: 'stock' se já foi entregue
+    order["status"] = "stock" if order["delivery_date"] else "shipping"
+
+    has_post = any(_text(row, c) for c in ("first_price", "post_date", "sell_price", "sell_date"))
+    if not has_post:
+        return {"order": order, "post": None}
+
+    post = {
+        "first_price": _number(row, "first_price"),
+        "sell_price": _number(row, "sell_price"),
+        "ad_tax": _number(row, "ad_tax", 0),
+        "post_date": _date(row, "post_date"),
+        "sell_date": _date(row, "sell_date"),
+        "views": _integer(row, "views"),
+        "likes": _integer(row, "likes"),
+        "offers": _integer(row, "offers"),
+    }
+
+    # Mesmas regras de add_post
+    if post["first_price"] is None or post["post_date"] is None:
+        raise ValueError("Todos os campos obrigatórios do post devem ser preenchidos.")
+    if order["status"] == "shipping":
+        raise ValueError("Não é possível criar um post. A encomenda ainda está 'shipping'.")
+    if post["sell_date"] and post["sell_price"] is None:
+        raise ValueError("Se a Data da Venda for preenchida, o Preço Vendido também é obrigatório.")
+
+    order["status"] = "sold" if post["sell_date"] else "stock"
+    return {"order": order, "post": post}
+
+
+def _load_lookups(db):
+    return {
+        table: {row["name"]: row["id"] for row in db.execute(f"SELECT id, name FROM {table}")}
+        for table in LOOKUP_COLUMNS.values()
+    }
+
+
+def _resolve_lookups(db, lookups, items, lookup_db=None):
+    """
+    Substitui os nomes de lookup pelos ids, criando os que ainda não existem. Com shards,
+    os nomes novos são criados no catálogo (`lookup_db`) e copiados, com o mesmo id, para o shard.
+    """
+    for item in items:
+        order = item["order"]
+        for column, table in LOOKUP_COLUMNS.items():
+            name = order[column]
+            if name not in lookups[table]:
+                if lookup_db is None:
+                    lookups[table][name] = db.execute(f"INSERT INTO {table} (name) VALUES (?)", name)
+                else:
+                    lookup_id = lookup_db.execute(f"INSERT INTO {table} (name) VALUES (?)", name)
+                    db.execute(f"INSERT OR IGNORE INTO {table} (id, name) VALUES (?, ?)", lookup_id, name)
+                    lookups[table][name] = lookup_id
+            order[f"{column}_id"] = lookups[table][name]
+
+
+def _next_id(db, table):
+    """Primeiro id livre de `table` (nos shards, o sqlite_sequence guarda o início do intervalo)."""
+    next_id = db.execute(f"SELECT COALESCE(MAX(id), 0) + 1 AS id FROM {table}")[0]["id"]
+    if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'"):
+        seq = db.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", table)
+        if seq:
+            next_id = max(next_id, seq[0]["seq"] + 1)
+    return next_id
+
+
+def _write_batch(db, user_id, items, lookups, lookup_db=None):
+    """Escreve um lote de linhas válidas numa única transação."""
+    with db.transaction():
+        _resolve_lookups(db, lookups, items, lookup_db)
+
+        # Com o lock de escrita tomado, os ids seguintes podem ser reservados em bloco.
+        next_order = _next_id(db, "orders")
+        next_post = _next_id(db, "posts")
+
+        orders, sales, posts = [], [], []
+        for item in items:
+            order, post = item["order"], item["post"]
+            order_id = next_order
+            next_order += 1
+            orders.append((
+                order_id, order["product_id"], order["brand_id"], order["size_id"], order["color_id"],
+                order["price"], order["deliver_tax"], order["order_date"], order["delivery_date"],
+            ))
+            post_id = None
+            if post:
+                post_id = next_post
+                next_post += 1
+                posts.append((
+                    post_id, order_id, post["first_price"], post["sell_price"], post["ad_tax"],
+                    post["post_date"], post["sell_date"], post["views"], post["likes"], post["offers"],
+                ))
+            sales.append((order_id, post_id, user_id, order["status"]))
+
+        db.executemany("""
+            INSERT INTO orders (id, product_id, brand_id, size_id, color_id, price, deliver_tax, order_date, delivery_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, orders)
+        db.executemany("""
+            INSERT INTO posts (id, order_id, first_price, sell_price, ad_tax, post_date, sell_date, views, likes, offers)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, posts)
+        db.executemany("""
+            INSERT INTO sales (order_id, post_id, user_id, status)
+            VALUES (?, ?, ?, ?)
+        """, sales)
+    return len(orders), len(posts)
+
+
+def import_csv(db, stream, user_id, batch_size=BATCH_SIZE, lookup_db=None):
+    """
+    Importa um CSV (objeto de texto iterável) para o utilizador `user_id`. Com shards, `db`
+    é o shard do utilizador e `lookup_db` o catálogo das lookups.
+    Devolve {'orders': n, 'posts': n, 'errors': [(linha, mensagem), ...]}.
+    """
+    report = {"orders": 0, "posts": 0, "errors": []}
+    if not db.execute("SELECT 1 FROM users WHERE id = ?", user_id):
+        raise CSVImportError(f"Utilizador {user_id} não existe.")
+
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or not set(LOOKUP_COLUMNS) <= {f.strip() for f in reader.fieldnames}:
+        raise CSVImportError("O CSV tem de ter cabeçalho com pelo menos: " + ", ".join(LOOKUP_COLUMNS))
+    reader.fieldnames = [f.strip() for f in reader.fieldnames]
+
+    lookups = _load_lookups(lookup_db or db)
+    batch = []
+    for row in reader:
+        try:
+            batch.append(parse_row(row))
+        except ValueError as e:
+            report["errors"].append((reader.line_num, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            orders, posts = _write_batch(db, user_id, batch, lookups, lookup_db)
+            report["orders"] += orders
+            report["posts"] += posts
+            batch = []
+    if batch:
+        orders, posts = _write_batch(db, user_id, batch, lookups, lookup_db)
+        report["orders"] += orders
+        report["posts"] += posts
+    return report
@@ -0,0 +1,218 @@
+"""
+Instrumentação por pedido e por consulta, exposta em formato Prometheus em `/metrics`.
+
+Para cada rota regista o tempo total, o número de consultas SQL e o tempo de render dos
+templates; para cada consulta (SQL normalizado: espaços colapsados e literais trocados
+por `?`) regista o número de execuções e o tempo acumulado. Opcionalmente, os pedidos
+mais lentos do que um limiar são escritos no log da app com a lista das suas consultas.
+
+Desligada por omissão. Variáveis de ambiente:
+    SALES_METRICS=1            ativa a instrumentação e o endpoint /metrics
+    SALES_SLOW_REQUEST_MS=500  ativa o registo de pedidos lentos (acima de 500 ms)
+
+Desligada, nada é registado na app e a camada de dados não chama nenhum hook.
+"""
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import Response, before_render_template, current_app, request, template_rendered
+
+# Limites (em segundos) dos buckets do histograma de duração dos pedidos
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Chave estável para uma consulta: sem literais, listas IN colapsadas e espaços únicos."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _SPACES.sub(" ", sql).strip()
+    return _IN_LIST.sub("(?, ...)", sql)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_label(value)}"' for name, value in labels.items()) + "}"
+
+
+class Instrumentation:
+    """Acumula as métricas (thread-safe) e liga-se à app Flask e à camada de dados."""
+
+    def __init__(self, slow_request_ms=None):
+        self.slow_request_ms = slow_request_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.requests = {}        # (endpoint, method, status) -> total
+        self.durations = {}       # endpoint -> [contagens por bucket..., soma, total]
+        self.request_queries = {} # endpoint -> [soma de consultas, total de pedidos]
+        self.queries = {}         # sql normalizado -> [tempo total, execuções]
+        self.templates = {}       # template -> [tempo total, renders]
+
+    # --- Recolha ---
+
+    def on_query(self, sql, elapsed):
+        """Hook da camada de dados: chamado depois de cada consulta."""
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = [0.0, 0]
+            stats[0] += elapsed
+            stats[1] += 1
+        queries = getattr(self._local, "queries", None)
+        if queries is not None:
+            queries.append((key, elapsed))
+
+    def _before_request(self):
+        self._local.start = time.perf_counter()
+        self._local.queries = []
+        self._local.status = 500
+        self._local.render_start = []
+
+    def _after_request(self, response):
+        self._local.status = response.status_code
+        return response
+
+    def _teardown_request(self, exception):
+        start = getattr(self._local, "start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        queries = self._local.queries
+        self._local.start = self._local.queries = None
+        endpoint = request.endpoint or "404"
+        self.record_request(endpoint, request.method, self._local.status, elapsed, len(queries))
+
+        if self.slow_request_ms is not None and elapsed * 1000 >= self.slow_request_ms:
+            self._log_slow(elapsed, queries)
+
+    def _log_slow(self, elapsed, queries):
+        lines = [f"Pedido lento: {request.method} {request.full_path} {elapsed * 1000:.1f} ms, "
+                 f"{len(queries)} consultas ({sum(q[1] for q in queries) * 1000:.1f} ms em SQL)"]
+        lines += [f"  {q_elapsed * 1000:8.2f} ms  {sql}" for sql, q_elapsed in queries]
+        current_app.logger.warning("\n".join(lines))
+
+    def record_request(self, endpoint, method, status, elapsed, query_count):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            histogram = self.durations.get(endpoint)
+            if histogram is None:
+                histogram = self.durations[endpoint] = [0] * len(DURATION_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    histogram[i] += 1
+            histogram[-2] += elapsed
+            histogram[-1] += 1
+
+            counts = self.request_queries.setdefault(endpoint, [0, 0])
+            counts[0] += query_count
+            counts[1] += 1
+
+    def _before_render(self, sender, template, context, **extra):
+        stack = getattr(self._local, "render_start", None)
+        if stack is not None:
+            stack.append(time.perf_counter())
+
+    def _rendered(self, sender, template, context, **extra):
+        stack = getattr(self._local, "render_start", None)
+        if not stack:
+            return
+        elapsed = time.perf_counter() - stack.pop()
+        with self._lock:
+            stats = self.templates.setdefault(template.name, [0.0, 0])
+            stats[0] += elapsed
+            stats[1] += 1
+
+    # --- Exposição ---
+
+    def render(self):
+        """Todas as métricas em formato de texto Prometheus (0.0.4)."""
+        with self._lock:
+            requests = dict(self.requests)
+            durations = {k: list(v) for k, v in self.durations.items()}
+            request_queries = {k: list(v) for k, v in self.request_queries.items()}
+            queries = {k: list(v) for k, v in self.queries.items()}
+            templates = {k: list(v) for k, v in self.templates.items()}
+
+        out = [
+            "# HELP sales_http_requests_total Pedidos HTTP por rota, método e estado.",
+            "# TYPE sales_http_requests_total counter",
+        ]
+        for (endpoint, method, status), total in sorted(requests.items()):
+            out.append(f"sales_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {total}")
+
+        out += [
+            "# HELP sales_http_request_duration_seconds Tempo total de cada pedido por rota.",
+            "# TYPE sales_http_request_duration_seconds histogram",
+        ]
+        for endpoint, histogram in sorted(durations.items()):
+            for bound, count in zip(DURATION_BUCKETS, histogram):
+                out.append(f"sales_http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {count}")
+            out.append(f"sales_http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le='+Inf')} {histogram[-1]}")
+            out.append(f"sales_http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {histogram[-2]}")
+            out.append(f"sales_http_request_duration_seconds_count{_labels(endpoint=endpoint)} {histogram[-1]}")
+
+        out += [
+            "# HELP sales_http_request_queries Consultas SQL por pedido, por rota.",
+            "# TYPE sales_http_request_queries summary",
+        ]
+        for endpoint, (total, count) in sorted(request_queries.items()):
+            out.append(f"sales_http_request_queries_sum{_labels(endpoint=endpoint)} {total}")
+            out.append(f"sales_http_request_queries_count{_labels(endpoint=endpoint)} {count}")
+
+        out += [
+            "# HELP sales_db_query_duration_seconds Tempo das consultas SQL, por SQL normalizado.",
+            "# TYPE sales_db_query_duration_seconds summary",
+        ]
+        for sql, (total, count) in sorted(queries.items()):
+            out.append(f"sales_db_query_duration_seconds_sum{_labels(sql=sql)} {total}")
+            out.append(f"sales_db_query_duration_seconds_count{_labels(sql=sql)} {count}")
+
+        out += [
+            "# HELP sales_template_render_seconds Tempo de render dos templates Jinja.",
+            "# TYPE sales_template_render_seconds summary",
+        ]
+        for name, (total, count) in sorted(templates.items()):
+            out.append(f"sales_template_render_seconds_sum{_labels(template=name)} {total}")
+            out.append(f"sales_template_render_seconds_count{_labels(template=name)} {count}")
+        return "\n".join(out) + "\n"
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app, db, enabled=None, slow_request_ms=None):
+    """
+    Liga a instrumentação à app e à camada de dados se estiver ativa (argumentos ou
+    variáveis de ambiente). Devolve a instância, ou None se estiver desligada.
+    """
+    if slow_request_ms is None and os.environ.get("SALES_SLOW_REQUEST_MS"):
+        slow_request_ms = float(os.environ["SALES_SLOW_REQUEST_MS"])
+    if enabled is None:
+        enabled = os.environ.get("SALES_METRICS", "") not in ("", "0")
+    if not enabled and slow_request_ms is None:
+        return None
+
+    instrumentation = Instrumentation(slow_request_ms)
+    db.on_query = instrumentation.on_query
+    app.before_request(instrumentation._before_request)
+    app.after_request(instrumentation._after_request)
+    app.teardown_request(instrumentation._teardown_request)
+    before_render_template.connect(instrumentation._before_render, app, weak=False)
+    template_rendered.connect(instrumentation._rendered, app, weak=False)
+    if enabled:
+        app.add_url_rule("/metrics", "metrics", instrumentation.metrics_view)
+    return instrumentation
@@ -0,0 +1,390 @@
+"""
+Teste de carga ponta a ponta com uma mistura realista de pedidos.
+
+Vários clientes concorrentes (threads) repetem, durante `--duration` segundos, pedidos
+escolhidos de uma mistura ponderada das rotas do dashboard: navegação (`/?user_id=`),
+novas encomendas e posts, o formulário de edição e a atualização e remoção de posts. Os
+identificadores usados vêm da própria base de dados (ex.: uma encomenda em stock sem post
+para `/add_post`), lidos por uma ligação só de leitura e repostos quando se esgotam.
+
+As escritas são feitas com o cabeçalho `X-Fragments` (ver write_response() em app.py), pelo
+que a resposta traz logo as mensagens de flash: um erro da rota (alerta `danger`) conta como
+erro, e um `database is locked` conta também como contenção de locks do SQLite.
+
+No fim escreve o débito (pedidos/s) e, por rota, o número de pedidos, as latências p50,
+p95 e p99, a taxa de erros e os erros de lock, em JSON.
+
+Sem `--url`, arranca a app num servidor local (multithread) sobre PATH. As escritas alteram
+a base de dados: usar uma cópia ou uma base gerada com synthetic.py.
+
+    python synthetic.py load.db --users 200 --orders 200000
+    python loadtest.py load.db --clients 32 --duration 60 --output load.json
+    python loadtest.py load.db --mix browse=80,add_order=10,add_post=10
+"""
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode, urlsplit
+
+import click
+
+CLIENTS = 16
+DURATION = 30           # segundos
+POOL_SIZE = 2000        # identificadores lidos de cada vez para cada rota
+
+# Peso por omissão de cada rota na mistura
+DEFAULT_MIX = {
+    "browse": 60,
+    "add_order": 10,
+    "add_post": 8,
+    "edit_order": 10,
+    "update_post": 8,
+    "delete_post": 4,
+}
+
+LOCKED = "database is locked"
+
+# Identificadores de cada rota: consulta que devolve um lote aleatório
+POOL_QUERIES = {
+    "users": """
+        SELECT user_id FROM sales WHERE user_id IS NOT NULL
+        GROUP BY user_id ORDER BY random() LIMIT ?
+    """,
+    "orders": "SELECT order_id, user_id FROM sales WHERE user_id IS NOT NULL ORDER BY random() LIMIT ?",
+    "unposted": """
+        SELECT order_id, user_id FROM sales
+        WHERE status = 'stock' AND post_id IS NULL AND user_id IS NOT NULL
+        ORDER BY random() LIMIT ?
+    """,
+    "posts": """
+        SELECT posts.id AS post_id, sales.user_id, posts.post_date, posts.first_price
+        FROM sales JOIN posts ON posts.id = sales.post_id
+        WHERE sales.status = 'stock' AND sales.user_id IS NOT NULL
+        ORDER BY random() LIMIT ?
+    """,
+}
+
+
+def percentile(ordered, fraction):
+    """Percentil pelo método do posto mais próximo (`ordered` já ordenado)."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Workload:
+    """Identificadores para os pedidos, partilhados pelos clientes e repostos a partir da BD."""
+
+    def __init__(self, path, pool_size=POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._pools = {}
+        conn = self._connect()
+        try:
+            self.lookups = {table: [row[0] for row in conn.execute(f"SELECT id FROM {table}")]
+                            for table in ("products", "brands", "sizes", "colors")}
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def take(self, pool, rng, consume=False):
+        """
+        Um identificador (linha) do lote `pool`, ou None se a BD não tiver nenhum. Com
+        `consume`, a linha é retirada do lote (ex.: um post que vai ser apagado).
+        """
+        with self._lock:
+            rows = self._pools.get(pool)
+            if not rows:
+                conn = self._connect()
+                try:
+                    rows = self._pools[pool] = [dict(row) for row in
+                                                conn.execute(POOL_QUERIES[pool], (self.pool_size,))]
+                finally:
+                    conn.close()
+                if not rows:
+                    return None
+            index = rng.randrange(len(rows))
+            if consume:
+                rows[index], rows[-1] = rows[-1], rows[index]
+                return rows.pop()
+            return rows[index]
+
+
+def _day(rng, days_back=30):
+    return (date.today() - timedelta(days=rng.randrange(days_back))).isoformat()
+
+
+# --- Pedidos: cada função devolve (método, caminho, formulário) ou None se não houver dados ---
+
+def browse(workload, rng):
+    user = workload.take("users", rng)
+    return user and ("GET", "/?" + urlencode({"user_id": user["user_id"]}), None)
+
+
+def add_order(workload, rng):
+    user = workload.take("users", rng)
+    if user is None:
+        return None
+    delivered = rng.random() < 0.5
+    return ("POST", "/add_order", {
+        "user_id": user["user_id"],
+        "product_id": rng.choice(workload.lookups["products"]),
+        "brand_id": rng.choice(workload.lookups["brands"]),
+        "size_id": rng.choice(workload.lookups["sizes"]),
+        "color_id": rng.choice(workload.lookups["colors"]),
+        "price": round(rng.uniform(5, 120), 2),
+        "deliver_tax": round(rng.uniform(0, 8), 2),
+        "order_date": _day(rng, 60),
+        "delivery_date": _day(rng, 10) if delivered else "",
+    })
+
+
+def add_post(workload, rng):
+    order = workload.take("unposted", rng, consume=True)
+    return order and ("POST", "/add_post", {
+        "user_id": order["user_id"],
+        "order_id": order["order_id"],
+        "first_price": round(rng.uniform(10, 200), 2),
+        "ad_tax": round(rng.uniform(0, 3), 2),
+        "post_date": _day(rng),
+        "views": rng.randrange(500),
+        "likes": rng.randrange(50),
+        "proposals": rng.randrange(10),
+    })
+
+
+def edit_order(workload, rng):
+    order = workload.take("orders", rng)
+    return order and ("GET", f"/edit_order/{order['order_id']}?" + urlencode({"user_id": order["user_id"]}), None)
+
+
+def update_post(workload, rng):
+    post = workload.take("posts", rng)
+    return post and ("POST", "/update_post", {
+        "user_id": post["user_id"],
+        "post_id": post["post_id"],
+        "first_price": post["first_price"],
+        "ad_tax": 0,
+        "post_date": post["post_date"],
+        "views": rng.randrange(1000),
+        "likes": rng.randrange(100),
+        "proposals": rng.randrange(20),
+    })
+
+
+def delete_post(workload, rng):
+    post = workload.take("posts", rng, consume=True)
+    return post and ("POST", "/delete_post", {"user_id": post["user_id"], "post_id": post["post_id"]})
+
+
+ROUTES = {
+    "browse": browse,
+    "add_order": add_order,
+    "add_post": add_post,
+    "edit_order": edit_order,
+    "update_post": update_post,
+    "delete_post": delete_post,
+}
+
+
+def parse_mix(text):
+    """'browse=60,add_order=10' -> {'browse': 60, 'add_order': 10}."""
+    mix = {}
+    for part in filter(None, (item.strip() for item in text.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise click.BadParameter(f"Rota desconhecida: {name!r} (disponíveis: {', '.join(ROUTES)})")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise click.BadParameter(f"Peso inválido para {name!r}: {weight!r}") from None
+    if not any(weight > 0 for weight in mix.values()):
+        raise click.BadParameter("A mistura não tem nenhuma rota com peso positivo.")
+    return mix
+
+
+# --- Clientes ---
+
+def _classify(method, status, body):
+    """(erro, lock) para uma resposta."""
+    locked = LOCKED in body
+    if status >= 400:
+        return True, locked
+    if method == "POST" and status == 200:
+        try:
+            messages = json.loads(body)["fragments"]["messages"]
+        except (ValueError, KeyError, TypeError):
+            return True, locked
+        return "alert-danger" in messages, locked
+    # Páginas: o dashboard mostra as falhas de leitura como alerta `danger`
+    return "alert-danger" in body, locked
+
+
+class Client(threading.Thread):
+    """Um cliente: uma ligação HTTP persistente que faz pedidos até `deadline`."""
+
+    def __init__(self, index, base_url, workload, mix, deadline, seed):
+        super().__init__(name=f"loadtest-client-{index}", daemon=True)
+        self.base = urlsplit(base_url)
+        self.workload = workload
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.deadline = deadline
+        self.rng = random.Random(seed * 1000 + index)
+        self.samples = []       # (rota, segundos, erro, lock)
+        self.skipped = 0        # pedidos sem dados disponíveis na BD
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.base.hostname, self.base.port or 80, timeout=60)
+        try:
+            while time.monotonic() < self.deadline:
+                name = self.rng.choices(self.names, self.weights)[0]
+                request = ROUTES[name](self.workload, self.rng)
+                if request is None:
+                    self.skipped += 1
+                    continue
+                self.samples.append((name, *self._send(conn, *request)))
+        finally:
+            conn.close()
+
+    def _send(self, conn, method, path, form):
+        headers = {"Connection": "keep-alive"}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["X-Fragments"] = "1"
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            text = response.read().decode("utf-8", "replace")
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            return time.perf_counter() - start, True, LOCKED in str(e)
+        elapsed = time.perf_counter() - start
+        return (elapsed, *_classify(method, response.status, text))
+
+
+def _route_stats(samples, duration):
+    latencies = sorted(sample[1] for sample in samples)
+    errors = sum(1 for sample in samples if sample[2])
+    locked = sum(1 for sample in samples if sample[3])
+    return {
+        "requests": len(samples),
+        "throughput_rps": len(samples) / duration if duration else 0,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0,
+        "locked": locked,
+    }
+
+
+def run(base_url, path, mix, clients=CLIENTS, duration=DURATION, seed=42):
+    """Corre o teste de carga contra `base_url`. Devolve {'total', 'routes', 'skipped'}."""
+    workload = Workload(path)
+    deadline = time.monotonic() + duration
+    threads = [Client(i, base_url, workload, mix, deadline, seed) for i in range(clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    samples = [sample for thread in threads for sample in thread.samples]
+    routes = {name: _route_stats([s for s in samples if s[0] == name], elapsed)
+              for name in mix if any(s[0] == name for s in samples)}
+    return {
+        "elapsed_s": elapsed,
+        "total": _route_stats(samples, elapsed),
+        "routes": routes,
+        "skipped": sum(thread.skipped for thread in threads),
+    }
+
+
+def start_server(path):
+    """Arranca a app sobre `path` num servidor local multithread. Devolve (URL, servidor)."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    os.environ["SALES_DB"] = path
+    os.environ.setdefault("SALES_MIGRATE", "1")     # a base de dados medida fica na versão atual
+    import app as sales_app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # HTTP/1.1 para que cada cliente reutilize a sua ligação.
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    server = make_server("127.0.0.1", 0, sales_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+@click.command()
+@click.argument("path")
+@click.option("--url", help="Servidor já em execução sobre PATH (senão, arranca um servidor local).")
+@click.option("--clients", default=CLIENTS, show_default=True, help="Clientes concorrentes.")
+@click.option("--duration", default=DURATION, show_default=True, help="Duração (segundos).")
+@click.option("--mix", "mix_text", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+              show_default=True, help="Pesos das rotas (rota=peso, separados por vírgulas).")
+@click.option("--seed", default=42, show_default=True, help="Semente dos clientes.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Ficheiro JSON de resultados (senão, stdout).")
+def main(path, url, clients, duration, mix_text, seed, output):
+    """Teste de carga da app sobre a base de dados PATH."""
+    if not os.path.exists(path):
+        raise click.ClickException(f"{path} não existe.")
+    mix = parse_mix(mix_text)
+
+    server = None
+    if url is None:
+        url, server = start_server(path)
+    try:
+        results = run(url, path, mix, clients=clients, duration=duration, seed=seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "database": path,
+        "url": url,
+        "clients": clients,
+        "duration_s": duration,
+        "mix": mix,
+        **results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        click.echo(f"{'rota':<14}{'pedidos':>9}{'pedidos/s':>11}{'p50 ms':>9}{'p95 ms':>9}"
+                   f"{'p99 ms':>9}{'erros':>8}{'locks':>7}")
+        for name, stats in {**results["routes"], "total": results["total"]}.items():
+            if not stats["requests"]:
+                continue
+            click.echo(f"{name:<14}{stats['requests']:>9}{stats['throughput_rps']:>11.1f}"
+                       f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+                       f"{stats['error_rate']:>8.1%}{stats['locked']:>7}")
+    else:
+        click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
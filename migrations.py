@@ -0,0 +1,403 @@
+"""
+Migrações versionadas do esquema do `sales.db`.
+
+Cada migração tem um número de versão, as instruções SQL a aplicar (ou funções que
+recebem a ligação, para passos que dependem do esquema existente) e, opcionalmente,
+verificações `EXPLAIN QUERY PLAN` que provam que as consultas críticas deixaram de fazer
+SCAN completo às tabelas grandes. A versão aplicada fica registada na tabela
+`schema_migrations`. As migrações correm com `flask migrate` (e no arranque da aplicação
+com SALES_MIGRATE=1).
+"""
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import archive
+import engagement
+import read_models
+import search
+from catalog import LOOKUP_TABLES
+
+
+class MigrationError(Exception):
+    """Erro ao aplicar uma migração ou falha numa verificação de plano de consulta."""
+
+
+def _lookup_version_statements():
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS lookup_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO lookup_version (id, version) VALUES (1, 0)",
+    ]
+    for table in LOOKUP_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            statements.append(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_lookup_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE lookup_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+    return statements
+
+
+# Cada verificação: (consulta, parâmetros, tabelas que NÃO podem aparecer em SCAN)
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "Contador de versão do catálogo de lookups",
+        "statements": _lookup_version_statements(),
+        "checks": [],
+    },
+    {
+        "version": 2,
+        "description": "Índices nas chaves de junção de sales, posts e orders",
+        "statements": [
+            "CREATE INDEX IF NOT EXISTS idx_sales_user_status ON sales (user_id, status, order_id, post_id)",
+            "CREATE INDEX IF NOT EXISTS idx_sales_order_id ON sales (order_id)",
+            "CREATE INDEX IF NOT EXISTS idx_sales_post_id ON sales (post_id)",
+            "CREATE INDEX IF NOT EXISTS idx_posts_order_id ON posts (order_id)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders (order_date)",
+        ],
+        "checks": [
+            # get_user_data(): encomendas do utilizador
+            ("""
+                SELECT orders.id, sales.status, sales.post_id
+                FROM orders
+                JOIN products ON products.id = orders.product_id
+                JOIN brands ON brands.id = orders.brand_id
+                JOIN colors ON colors.id = orders.color_id
+                JOIN sizes ON sizes.id = orders.size_id
+                JOIN sales ON sales.order_id = orders.id
+                WHERE sales.user_id = ?
+            """, (1,), ("orders", "sales")),
+            # get_user_data(): posts do utilizador
+            ("""
+                SELECT posts.id, sales.status
+                FROM posts
+                JOIN orders ON orders.id = posts.order_id
+                JOIN sales ON sales.post_id = posts.id
+                WHERE sales.user_id = ?
+            """, (1,), ("orders", "sales", "posts")),
+            # Contagens por estado
+            ("SELECT COUNT(*) FROM sales WHERE user_id = ? AND status = ?", (1, "stock"), ("sales",)),
+            # add_post(): estado da venda de uma encomenda
+            ("SELECT status FROM sales WHERE order_id = ?", (1,), ("sales",)),
+            # Post associado a uma encomenda
+            ("SELECT id FROM posts WHERE order_id = ?", (1,), ("posts",)),
+            # Filtros por data de encomenda
+            ("SELECT id FROM orders WHERE order_date >= ?", ("2025-01-01",), ("orders",)),
+        ],
+    },
+    {
+        "version": 3,
+        "description": "Modelo de leitura user_metrics (somas acumuladas por utilizador)",
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS user_metrics (
+                user_id INTEGER PRIMARY KEY,
+                faturacao NUMERIC NOT NULL DEFAULT 0,
+                gastos NUMERIC NOT NULL DEFAULT 0,
+                encomendas_vendidas INTEGER NOT NULL DEFAULT 0,
+                encomendas_stock INTEGER NOT NULL DEFAULT 0,
+                encomendas_chegar INTEGER NOT NULL DEFAULT 0,
+                dias_venda_total INTEGER NOT NULL DEFAULT 0,
+                dias_venda_count INTEGER NOT NULL DEFAULT 0,
+                invested_stock_cost NUMERIC NOT NULL DEFAULT 0,
+                stock_margin NUMERIC NOT NULL DEFAULT 0,
+                unpriced_stock_cost NUMERIC NOT NULL DEFAULT 0,
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            )
+            """,
+        ],
+        # As linhas são construídas pela aplicação (read_models) na primeira leitura.
+        "checks": [
+            ("SELECT * FROM user_metrics WHERE user_id = ?", (1,), ("user_metrics",)),
+        ],
+    },
+    {
+        "version": 4,
+        "description": "Índices de datas para a paginação por keyset do dashboard",
+        "statements": [
+            "CREATE INDEX IF NOT EXISTS idx_posts_post_date ON posts (post_date, id)",
+            "CREATE INDEX IF NOT EXISTS idx_posts_sell_date ON posts (sell_date, id)",
+        ],
+        "checks": [
+            # get_table_page('orders'): uma página por data de encomenda
+            ("""
+                SELECT orders.id FROM orders
+                JOIN sales ON sales.order_id = orders.id
+                WHERE sales.user_id = ? AND (orders.order_date, orders.id) < (?, ?)
+                ORDER BY orders.order_date DESC, orders.id DESC LIMIT 11
+            """, (1, "2025-01-01", 1), ("orders", "sales")),
+            # get_table_page('sales'): uma página por data de venda
+            ("""
+                SELECT posts.id FROM posts
+                JOIN sales ON sales.post_id = posts.id
+                WHERE sales.user_id = ? AND sales.status = 'sold'
+                  AND (posts.sell_date, posts.id) < (?, ?)
+                ORDER BY posts.sell_date DESC, posts.id DESC LIMIT 11
+            """, (1, "2025-01-01", 1), ("posts", "sales")),
+        ],
+    },
+    {
+        "version": 5,
+        "description": "Versão dos dados por utilizador (ETags da API)",
+        "statements": [
+            "ALTER TABLE user_metrics ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        ],
+        "checks": [],
+    },
+    {
+        "version": 6,
+        "description": "Rollups mensais de vendas por utilizador, mês, marca e produto",
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS monthly_rollups (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                brand_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                revenue NUMERIC NOT NULL DEFAULT 0,
+                cost NUMERIC NOT NULL DEFAULT 0,
+                units_sold INTEGER NOT NULL DEFAULT 0,
+                days_total INTEGER NOT NULL DEFAULT 0,
+                days_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, brand_id, product_id)
+            ) WITHOUT ROWID
+            """,
+            # Carga inicial a partir do histórico; daí em diante são mantidos pelas escritas.
+            "INSERT INTO monthly_rollups (user_id, month, brand_id, product_id, revenue, cost, units_sold, days_total, days_count) "
+            + read_models.ROLLUP_QUERY.format(where=""),
+        ],
+        "checks": [
+            (
+                "SELECT month, brand_id, SUM(revenue) FROM monthly_rollups "
+                "WHERE user_id = ? AND month >= ? AND month <= ? GROUP BY month, brand_id",
+                (1, "2024-01", "2024-12"),
+                ("monthly_rollups",),
+            ),
+        ],
+    },
+    {
+        "version": 7,
+        "description": "Sessões do lado do servidor (backend SALES_SESSIONS=sqlite)",
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)",
+        ],
+        "checks": [
+            ("SELECT data FROM sessions WHERE sid = ? AND expires_at > ?", ("x", 0), ("sessions",)),
+            ("DELETE FROM sessions WHERE expires_at <= ?", (0,), ("sessions",)),
+        ],
+    },
+    {
+        "version": 8,
+        "description": "Índice de pesquisa FTS5 (produto, marca, cor, tamanho) mantido por triggers",
+        "statements": search.schema_statements(),
+        "checks": [
+            # search.search(): texto livre + estado, a partir do índice FTS
+            (
+                search.SEARCH_QUERY.format(sort_key="", source=search.FTS_SOURCE)
+                + search.FTS_FILTER + " AND sales.status IN (?, ?)",
+                (1, 'owner : "u1" AND "nike"*', "stock", "shipping"),
+                ("sales", "orders", "posts"),
+            ),
+            # search.search(): só facetas (sem texto)
+            (
+                search.SEARCH_QUERY.format(sort_key="", source="sales") + " AND sales.status = ?",
+                (1, "sold"),
+                ("sales", "orders", "posts"),
+            ),
+        ],
+    },
+    {
+        "version": 9,
+        "description": "Arquivo das vendas antigas e resumos das suas contribuições",
+        "statements": archive.schema_statements(),
+        "checks": [
+            # archive_sold(): candidatos pela data de venda (idx_posts_sell_date, migração 4)
+            (archive.CANDIDATES_QUERY, ("2024-01-01", 100), ("posts", "sales")),
+            # Histórico completo: encomendas do utilizador nas tabelas ativas e arquivadas
+            (
+                archive.full_history(
+                    "SELECT orders.id, sales.status FROM orders "
+                    "JOIN sales ON sales.order_id = orders.id WHERE sales.user_id = ?"
+                ),
+                (1,),
+                ("orders", "sales", "orders_archive", "sales_archive"),
+            ),
+            ("SELECT * FROM archived_metrics WHERE user_id = ?", (1,), ("archived_metrics",)),
+        ],
+    },
+    {
+        "version": 10,
+        "description": "Histórico dos contadores de interação dos posts (views, likes, offers)",
+        "statements": engagement.schema_statements(),
+        "checks": [
+            # EngagementBuffer.flush(): utilizadores dos posts atualizados
+            (engagement.USERS_QUERY, ("[1, 2]",), ("sales",)),
+            (engagement.APPLY_SQL, (1, None, 1, 0, None, 0, 0, None, 0, 1), ("posts",)),
+            # compact(): amostras antigas pela data
+            (engagement.COMPACT_SQL, ("2024-01-01",), ("engagement_history",)),
+            ("SELECT * FROM engagement_history WHERE post_id = ? ORDER BY recorded_at", (1,),
+             ("engagement_history",)),
+        ],
+    },
+    {
+        "version": 11,
+        "description": "Estatísticas de venda por utilizador, marca, produto e tamanho (projeções do stock)",
+        # Carga inicial a partir do histórico completo (incluindo o arquivo); daí em diante
+        # são mantidas pelas escritas (read_models.apply_change).
+        "statements": read_models.stats_schema_statements()
+        + read_models.stats_load_statements(history=archive.full_history)
+        + [read_models.MEDIAN_SQL.format(where="")],
+        "checks": [
+            # load_metrics(): grupos com stock do utilizador
+            (read_models.PROJECTION_QUERY.format(where="user_id = ? AND"), (1, 3, 3), ("sale_stats",)),
+            # apply_stats_change(): mediana de um grupo
+            (read_models.MEDIAN_SQL.format(where="WHERE " + " AND ".join(f"{k} = ?" for k in read_models.STATS_KEY)),
+             (1, 1, 1, 1), ("sale_stats", "sale_days")),
+            (read_models.STATS_QUERY.format(where="AND sales.order_id = ?"), (1,), ("sales", "orders", "posts")),
+        ],
+    },
+    {
+        "version": 12,
+        "description": "Ids de orders, posts e sales sempre crescentes (AUTOINCREMENT, sem reutilizar ids arquivados)",
+        "statements": [archive.monotonic_ids],
+        "checks": [
+            # As consultas sobre as tabelas reconstruídas continuam a usar os índices.
+            (archive.CANDIDATES_QUERY, ("2024-01-01", 100), ("posts", "sales")),
+            ("SELECT status FROM sales WHERE order_id = ?", (1,), ("sales",)),
+            ("SELECT id FROM posts WHERE order_id = ?", (1,), ("posts",)),
+            ("SELECT id FROM orders WHERE order_date >= ?", ("2025-01-01",), ("orders",)),
+        ],
+    },
+]
+
+LATEST_VERSION = MIGRATIONS[-1]["version"]
+
+
+def connect(path):
+    """Abre uma ligação em modo autocommit para controlar as transações explicitamente."""
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def current_version(conn):
+    """Devolve a última versão aplicada (0 se nenhuma)."""
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()
+    return row[0]
+
+
+def pending(path):
+    """Versões por aplicar em `path`, sem o alterar (aberto só para leitura; inexistente = todas)."""
+    try:
+        conn = sqlite3.connect(Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return [migration["version"] for migration in MIGRATIONS]
+    try:
+        version = 0
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'").fetchone():
+            version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+    finally:
+        conn.close()
+    return [migration["version"] for migration in MIGRATIONS if migration["version"] > version]
+
+
+def plan_scans(conn, sql, params, tables):
+    """Devolve as linhas do EXPLAIN QUERY PLAN que fazem SCAN a alguma das tabelas indicadas."""
+    pattern = re.compile(r"^SCAN (%s)\b" % "|".join(re.escape(t) for t in tables))
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row["detail"] for row in rows if pattern.match(row["detail"])]
+
+
+def check_migration(conn, migration):
+    """Executa as verificações de plano de uma migração. Levanta MigrationError se houver SCAN."""
+    for sql, params, tables in migration["checks"]:
+        scans = plan_scans(conn, sql, params, tables)
+        if scans:
+            query = " ".join(sql.split())
+            raise MigrationError(
+                f"Migração {migration['version']}: a consulta ainda faz {scans}: {query}"
+            )
+
+
+def migrate(path, target=None):
+    """
+    Aplica todas as migrações pendentes até `target` (por omissão, a mais recente).
+    Cada migração corre numa transação própria (BEGIN IMMEDIATE), pelo que vários
+    processos a arrancar em simultâneo não aplicam a mesma migração duas vezes.
+    Devolve a lista de versões aplicadas.
+    """
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    conn = connect(path)
+    try:
+        for migration in MIGRATIONS:
+            if migration["version"] > target:
+                break
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current_version(conn) >= migration["version"]:
+                    conn.execute("ROLLBACK")
+                    continue
+                for statement in migration["statements"]:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                check_migration(conn, migration)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                    (migration["version"], migration["description"], datetime.now().isoformat(timespec="seconds")),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(migration["version"])
+    finally:
+        conn.close()
+    return applied
+
+
+def check(path):
+    """Corre as verificações de plano de todas as migrações já aplicadas. Devolve a lista de erros."""
+    errors = []
+    conn = connect(path)
+    try:
+        version = current_version(conn)
+        for migration in MIGRATIONS:
+            if migration["version"] > version:
+                break
+            try:
+                check_migration(conn, migration)
+            except MigrationError as e:
+                errors.append(str(e))
+    finally:
+        conn.close()
+    return errors
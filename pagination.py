@@ -0,0 +1,76 @@
+"""
+Paginação por keyset (seek) para as tabelas do dashboard.
+
+Em vez de OFFSET, cada página é pedida a partir de um cursor com a chave de ordenação e o
+id da última (ou primeira) linha da página anterior. A consulta só lê as linhas da página,
+independentemente de quantas páginas já foram percorridas.
+"""
+import base64
+import json
+
+PAGE_SIZE = 10
+
+
+def encode_cursor(sort_key, row_id):
+    """Codifica (chave de ordenação, id) num token seguro para URLs."""
+    raw = json.dumps([sort_key, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Descodifica um cursor. Devolve None se o token for inválido."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        sort_key, row_id = json.loads(raw)
+    except Exception:
+        return None
+    if isinstance(sort_key, (list, dict)) or not isinstance(row_id, int):
+        return None
+    return sort_key, row_id
+
+
+def fetch_page(db, sql, params, sort_expr, id_expr, id_key, descending=True,
+               after=None, before=None, limit=PAGE_SIZE):
+    """
+    Executa uma consulta paginada por keyset.
+
+    `sql` termina numa cláusula WHERE (sem ORDER BY) e contém o marcador `{sort_key}` no
+    início da lista de colunas. `id_expr`/`id_key` identificam o desempate único (expressão
+    SQL e nome da coluna no resultado). Devolve {'rows', 'next_cursor', 'prev_cursor'}.
+    """
+    cursor = decode_cursor(after)
+    backwards = False
+    if cursor is None:
+        cursor = decode_cursor(before)
+        backwards = cursor is not None
+
+    # Ao recuar percorre-se a ordem inversa e inverte-se o resultado no fim.
+    travel_desc = descending != backwards
+    op = "<" if travel_desc else ">"
+    order = "DESC" if travel_desc else "ASC"
+
+    query = sql.format(sort_key=f"{sort_expr} AS sort_key,")
+    args = list(params)
+    if cursor is not None:
+        query += f" AND ({sort_expr}, {id_expr}) {op} (?, ?)"
+        args.extend(cursor)
+    query += f" ORDER BY {sort_expr} {order}, {id_expr} {order} LIMIT ?"
+    args.append(limit + 1)
+
+    rows = db.execute(query, *args)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    has_next = True if backwards else more
+    has_prev = more if backwards else cursor is not None
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1]["sort_key"], rows[-1][id_key])
+    if rows and has_prev:
+        prev_cursor = encode_cursor(rows[0]["sort_key"], rows[0][id_key])
+    return {"rows": rows, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
@@ -0,0 +1,139 @@
+"""
+Pré-cálculo em segundo plano dos dashboards depois de cada escrita.
+
+Todas as rotas de escrita redirecionam para o dashboard do utilizador. Depois do COMMIT,
+`schedule(user_id)` põe o utilizador na fila de um pool de threads, que recalcula a vista
+por omissão do dashboard (primeira página de cada tabela, encomendas em aberto e KPIs) e a
+guarda numa cache indexada pela versão dos dados do utilizador (ver get_data_version() em
+app.py). `index()` serve a partir da cache enquanto a versão guardada for a atual.
+
+- Coalescência: um utilizador que já está na fila (ainda não começou) não é posto de novo,
+  pelo que uma rajada de escritas dá origem a um único recálculo. Uma escrita feita
+  durante um recálculo volta a pôr o utilizador na fila.
+- Fila limitada: com `max_pending` utilizadores à espera, novos pedidos são descartados
+  (o dashboard é então calculado no próprio pedido, como sem pré-cálculo).
+- Um pedido que chega enquanto o recálculo do seu utilizador está pendente espera por ele
+  até `wait` segundos antes de calcular por si.
+
+Ativo por omissão. Variáveis de ambiente:
+    SALES_PRECOMPUTE=0             desliga o pré-cálculo
+    SALES_PRECOMPUTE_WORKERS=2     número de threads do pool
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+WORKERS = 2
+MAX_PENDING = 256       # utilizadores à espera de recálculo
+MAX_ENTRIES = 1024      # dashboards guardados (LRU)
+WAIT = 0.5              # segundos que um pedido espera por um recálculo pendente
+
+log = logging.getLogger(__name__)
+
+
+class DashboardWarmer:
+    """Pool de threads que recalcula dashboards e cache LRU (user_id -> (versão, dados))."""
+
+    def __init__(self, db, version, compute, workers=WORKERS, max_pending=MAX_PENDING,
+                 max_entries=MAX_ENTRIES, wait=WAIT):
+        self.db = db
+        self.version = version      # version(user_id) -> versão atual dos dados
+        self.compute = compute      # compute(user_id) -> dados do dashboard por omissão
+        self.max_pending = max_pending
+        self.max_entries = max_entries
+        self.wait = wait
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="dashboard-warmer")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._queued = set()        # utilizadores na fila que ainda não começaram
+        self._futures = {}          # user_id -> último recálculo submetido
+        self.stats = {"scheduled": 0, "coalesced": 0, "dropped": 0, "computed": 0,
+                      "hits": 0, "misses": 0}
+
+    def schedule(self, user_id):
+        """Pede o recálculo do dashboard de um utilizador. Devolve False se a fila estiver cheia."""
+        with self._lock:
+            if user_id in self._queued:
+                self.stats["coalesced"] += 1
+                return True
+            if len(self._queued) >= self.max_pending:
+                self.stats["dropped"] += 1
+                return False
+            self._queued.add(user_id)
+            self.stats["scheduled"] += 1
+            self._futures[user_id] = self._executor.submit(self._run, user_id)
+        return True
+
+    def _run(self, user_id):
+        with self._lock:
+            self._queued.discard(user_id)
+        try:
+            # A versão é lida ANTES dos dados: se outra escrita ocorrer entretanto, a
+            # entrada fica com uma versão antiga e não volta a ser servida.
+            version = self.version(user_id)
+            self.put(user_id, version, self.compute(user_id))
+            with self._lock:
+                self.stats["computed"] += 1
+        except Exception:
+            log.exception("Falha ao pré-calcular o dashboard do utilizador %s", user_id)
+        finally:
+            self.db.release()
+
+    def put(self, user_id, version, data):
+        """Guarda o dashboard de um utilizador para uma versão dos dados."""
+        with self._lock:
+            self._cache[user_id] = (version, data)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def get(self, user_id, version):
+        """
+        Dashboard guardado para `version`, ou None. Se houver um recálculo pendente para o
+        utilizador, espera por ele até `wait` segundos.
+        """
+        for attempt in range(2):
+            with self._lock:
+                entry = self._cache.get(user_id)
+                if entry is not None and entry[0] == version:
+                    self._cache.move_to_end(user_id)
+                    self.stats["hits"] += 1
+                    return entry[1]
+                future = self._futures.get(user_id)
+            if attempt or future is None or future.done():
+                break
+            try:
+                future.result(timeout=self.wait)
+            except FutureTimeoutError:
+                break
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def invalidate(self, user_id=None):
+        """Esquece o dashboard de um utilizador (ou de todos)."""
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def init(db, version, compute, enabled=None, workers=None):
+    """
+    Cria o DashboardWarmer se estiver ativo (argumentos ou variáveis de ambiente).
+    Devolve a instância, ou None se estiver desligado.
+    """
+    if enabled is None:
+        enabled = os.environ.get("SALES_PRECOMPUTE", "1") not in ("", "0")
+    if not enabled:
+        return None
+    if workers is None:
+        workers = int(os.environ.get("SALES_PRECOMPUTE_WORKERS", WORKERS))
+    return DashboardWarmer(db, version, compute, workers=workers)
@@ -0,0 +1,684 @@
+"""
+Modelos de leitura materializados: `user_metrics` (somas acumuladas por utilizador) e
+`monthly_rollups` (vendas agregadas por utilizador, mês, marca e produto).
+
+Cada encomenda (linha de `sales` + `orders` + post associado) contribui com um vetor de
+somas (faturação, gastos, contagens de stock, tempos de venda, ...). As rotas de escrita
+tiram um `snapshot()` da encomenda antes e depois da alteração e `apply_change()` soma a
+diferença à linha do utilizador, dentro da mesma transação, e incrementa a sua `version`
+(usada nas ETags da API). As métricas do dashboard
+(`metrics_from_row()`) são derivadas dessas somas com as mesmas fórmulas de
+`calculate_user_metrics_from_data()`. Os rollups mensais seguem o mesmo esquema: o
+snapshot inclui a contribuição da encomenda para o seu (mês de venda, marca, produto).
+
+O terceiro modelo, `sale_stats`, agrupa as encomendas por utilizador × marca × produto ×
+tamanho: vendas (número, faturação, custos e ROI), dias até à venda (número, média e
+mediana, esta a partir do histograma em `sale_days`) e o stock ainda por vender. As
+projeções do stock (`dias_fim_stock` e `estimated_stock_profit`) usam as estatísticas do
+grupo de cada artigo, quando o grupo tem vendas suficientes, em vez de uma média global.
+
+As vendas arquivadas (archive.py) deixam as tabelas ativas, mas a sua contribuição fica
+guardada em `archived_metrics` e `archived_rollups`; as reconstruções somam esses resumos
+aos dados ativos. O arquivo não altera `sale_stats`, cuja reconstrução lê o histórico
+completo (archive.full_history).
+"""
+import math
+
+from helpers import calculate_days_diff
+
+METRIC_COLUMNS = (
+    "faturacao",            # soma de sell_price das vendas concretizadas
+    "gastos",               # soma de custo + portes + destaques das vendas concretizadas
+    "encomendas_vendidas",
+    "encomendas_stock",
+    "encomendas_chegar",
+    "dias_venda_total",     # soma de dias post -> venda (vendas com dias válidos e > 0)
+    "dias_venda_count",
+    "invested_stock_cost",  # custo das encomendas em stock ou a caminho
+    "stock_margin",         # preço anunciado - custos, para o stock com post
+    "unpriced_stock_cost",  # custo do stock sem preço anunciado (projetado com o ROI)
+)
+
+# Mesmas junções do dashboard (get_user_data), restritas a uma encomenda ou utilizador.
+ITEM_QUERY = """
+    SELECT
+        sales.order_id,
+        sales.user_id,
+        sales.status,
+        orders.price,
+        orders.deliver_tax,
+        posts.id AS post_id,
+        posts.post_date,
+        posts.sell_date,
+        posts.first_price,
+        posts.sell_price,
+        posts.ad_tax
+    FROM sales
+    JOIN orders ON orders.id = sales.order_id
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    LEFT JOIN posts ON posts.id = sales.post_id AND posts.order_id = orders.id
+"""
+
+
+def empty_vector():
+    return dict.fromkeys(METRIC_COLUMNS, 0)
+
+
+def item_vector(row):
+    """Contribuição de uma linha de ITEM_QUERY para as somas do utilizador."""
+    v = empty_vector()
+    status = row["status"]
+    has_post = row["post_id"] is not None
+    cost = (row["price"] or 0) + (row["deliver_tax"] or 0)
+
+    if status == "sold" and has_post:
+        if row["sell_price"] is not None and row["sell_date"] is not None:
+            v["faturacao"] = row["sell_price"]
+            v["gastos"] = cost + (row["ad_tax"] or 0)
+            v["encomendas_vendidas"] = 1
+        if row["sell_date"]:
+            days = calculate_days_diff(row["post_date"], row["sell_date"])
+            if days:
+                v["dias_venda_total"] = days
+                v["dias_venda_count"] = 1
+
+    if status == "shipping":
+        v["encomendas_chegar"] = 1
+        v["invested_stock_cost"] = cost
+        v["unpriced_stock_cost"] = cost
+    elif status == "stock":
+        v["encomendas_stock"] = 1
+        v["invested_stock_cost"] = cost
+        if has_post and row["first_price"] is not None:
+            v["stock_margin"] = row["first_price"] - (cost + (row["ad_tax"] or 0))
+        else:
+            v["unpriced_stock_cost"] = cost
+    return v
+
+
+def _sum_by_user(rows):
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row["user_id"], empty_vector())
+        for column, value in item_vector(row).items():
+            total[column] += value
+    return totals
+
+
+def snapshot(db, order_id):
+    """
+    Contribuição atual de uma encomenda para os modelos de leitura:
+    {'users': {user_id: vetor}, 'rollups': {(user_id, mês, marca, produto): vetor},
+    'stats': {(user_id, marca, produto, tamanho, dias): vetor}}.
+    Uma encomenda inexistente corresponde a {}.
+    """
+    return {
+        "users": _sum_by_user(db.execute(ITEM_QUERY + " WHERE sales.order_id = ?", order_id)),
+        "rollups": rollup_snapshot(db, order_id),
+        "stats": stats_snapshot(db, order_id),
+    }
+
+
+def apply_change(db, before, after):
+    """Soma a diferença entre dois snapshots às linhas de user_metrics, monthly_rollups e sale_stats afetadas."""
+    apply_rollup_change(db, before.get("rollups", {}), after.get("rollups", {}))
+    apply_stats_change(db, before.get("stats", {}), after.get("stats", {}))
+    before = before.get("users", {})
+    after = after.get("users", {})
+    zero = empty_vector()
+    for user_id in set(before) | set(after):
+        if user_id is None:
+            continue
+        old = before.get(user_id, zero)
+        new = after.get(user_id, zero)
+        delta = [new[c] - old[c] for c in METRIC_COLUMNS]
+        assignments = ", ".join(f"{c} = {c} + ?" for c in METRIC_COLUMNS) + ", version = version + 1"
+        updated = db.execute(
+            f"UPDATE user_metrics SET {assignments} WHERE user_id = ?", *delta, user_id
+        )
+        if not updated:
+            # Sem linha materializada: construir a partir do estado atual (já inclui a escrita).
+            rebuild_user(db, user_id)
+
+
+def _store(db, user_id, vector):
+    # Upsert que preserva e incrementa a versão, para que uma reconstrução nunca
+    # volte a emitir uma versão (ETag) já usada com outros dados.
+    columns = ", ".join(METRIC_COLUMNS)
+    placeholders = ", ".join("?" for _ in METRIC_COLUMNS)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in METRIC_COLUMNS)
+    db.execute(
+        f"""
+        INSERT INTO user_metrics (user_id, {columns}) VALUES (?, {placeholders})
+        ON CONFLICT (user_id) DO UPDATE SET {updates}, version = user_metrics.version + 1
+        """,
+        user_id, *[vector[c] for c in METRIC_COLUMNS],
+    )
+
+
+def rebuild_user(db, user_id):
+    """Recalcula de raiz a linha de um utilizador (dados ativos + arquivo). Devolve o vetor guardado."""
+    vector = sum_vectors([
+        _sum_by_user(db.execute(ITEM_QUERY + " WHERE sales.user_id = ?", user_id)).get(user_id, empty_vector()),
+        archived_by_user(db, user_id).get(user_id, empty_vector()),
+    ])
+    _store(db, user_id, vector)
+    return vector
+
+
+def rebuild_all(db):
+    """Recalcula de raiz todas as linhas de user_metrics. Devolve o número de utilizadores."""
+    totals = _add_archived(_sum_by_user(db.execute(ITEM_QUERY)), archived_by_user(db))
+    for row in db.execute("SELECT id FROM users"):
+        totals.setdefault(row["id"], empty_vector())
+    db.execute("DELETE FROM user_metrics WHERE user_id NOT IN (SELECT id FROM users)")
+    for user_id, vector in totals.items():
+        if user_id is not None:
+            _store(db, user_id, vector)
+    return len(totals)
+
+
+# As mesmas somas de item_vector(), calculadas pelo SQLite para todos os utilizadores numa
+# única passagem. Os dias post -> venda usam julianday() e só contam datas YYYY-MM-DD válidas
+# (date(x) = x), tal como calculate_days_diff() devolve None para datas inválidas.
+_COST = "(COALESCE(orders.price, 0) + COALESCE(orders.deliver_tax, 0))"
+_SOLD = ("sales.status = 'sold' AND posts.id IS NOT NULL "
+         "AND posts.sell_price IS NOT NULL AND posts.sell_date IS NOT NULL")
+_SALE_DAYS = "CAST(julianday(posts.sell_date) - julianday(posts.post_date) AS INTEGER)"
+_VALID_SALE_DAYS = (
+    "sales.status = 'sold' AND posts.id IS NOT NULL AND posts.sell_date <> '' "
+    "AND date(posts.post_date) = posts.post_date AND date(posts.sell_date) = posts.sell_date "
+    f"AND {_SALE_DAYS} <> 0"
+)
+_PRICED_STOCK = "sales.status = 'stock' AND posts.id IS NOT NULL AND posts.first_price IS NOT NULL"
+
+AGGREGATE_QUERY = f"""
+    SELECT
+        sales.user_id,
+        SUM(CASE WHEN {_SOLD} THEN posts.sell_price ELSE 0 END) AS faturacao,
+        SUM(CASE WHEN {_SOLD} THEN {_COST} + COALESCE(posts.ad_tax, 0) ELSE 0 END) AS gastos,
+        SUM(CASE WHEN {_SOLD} THEN 1 ELSE 0 END) AS encomendas_vendidas,
+        SUM(CASE WHEN sales.status = 'stock' THEN 1 ELSE 0 END) AS encomendas_stock,
+        SUM(CASE WHEN sales.status = 'shipping' THEN 1 ELSE 0 END) AS encomendas_chegar,
+        SUM(CASE WHEN {_VALID_SALE_DAYS} THEN {_SALE_DAYS} ELSE 0 END) AS dias_venda_total,
+        SUM(CASE WHEN {_VALID_SALE_DAYS} THEN 1 ELSE 0 END) AS dias_venda_count,
+        SUM(CASE WHEN sales.status IN ('shipping', 'stock') THEN {_COST} ELSE 0 END) AS invested_stock_cost,
+        SUM(CASE WHEN {_PRICED_STOCK}
+                 THEN posts.first_price - ({_COST} + COALESCE(posts.ad_tax, 0)) ELSE 0 END) AS stock_margin,
+        SUM(CASE WHEN sales.status = 'shipping' OR (sales.status = 'stock' AND NOT ({_PRICED_STOCK}))
+                 THEN {_COST} ELSE 0 END) AS unpriced_stock_cost
+    FROM sales
+    JOIN orders ON orders.id = sales.order_id
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    LEFT JOIN posts ON posts.id = sales.post_id AND posts.order_id = orders.id
+    WHERE sales.user_id IS NOT NULL
+    GROUP BY sales.user_id
+"""
+
+
+def totals_by_user(db):
+    """Devolve {user_id: vetor} para todos os utilizadores com vendas (ativas ou arquivadas)."""
+    totals = {
+        row["user_id"]: {c: row[c] for c in METRIC_COLUMNS}
+        for row in db.execute(AGGREGATE_QUERY)
+    }
+    return _add_archived(totals, archived_by_user(db))
+
+
+def sum_vectors(vectors):
+    """Soma vários vetores (ex.: os de todos os utilizadores, para os totais da loja)."""
+    total = empty_vector()
+    for vector in vectors:
+        for column in METRIC_COLUMNS:
+            total[column] += vector[column]
+    return total
+
+
+# --- Resumos do arquivo ---
+
+def archived_by_user(db, user_id=None):
+    """Devolve {user_id: vetor} com as somas das vendas arquivadas (todos os utilizadores ou só um)."""
+    if user_id is None:
+        rows = db.execute("SELECT * FROM archived_metrics")
+    else:
+        rows = db.execute("SELECT * FROM archived_metrics WHERE user_id = ?", user_id)
+    return {row["user_id"]: {c: row[c] for c in METRIC_COLUMNS} for row in rows}
+
+
+def _add_archived(totals, archived):
+    for user_id, vector in archived.items():
+        totals[user_id] = sum_vectors([totals.get(user_id, empty_vector()), vector])
+    return totals
+
+
+def archive_contributions(db, sale_filter):
+    """
+    Soma a archived_metrics e archived_rollups a contribuição das vendas que satisfazem
+    `sale_filter` (condição SQL sobre `sales`), antes de estas serem movidas para o arquivo.
+    """
+    columns = ", ".join(METRIC_COLUMNS)
+    placeholders = ", ".join("?" for _ in METRIC_COLUMNS)
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in METRIC_COLUMNS)
+    for user_id, vector in _sum_by_user(db.execute(ITEM_QUERY + f" WHERE {sale_filter}")).items():
+        if user_id is None:
+            continue
+        db.execute(
+            f"""
+            INSERT INTO archived_metrics (user_id, {columns}) VALUES (?, {placeholders})
+            ON CONFLICT (user_id) DO UPDATE SET {updates}
+            """,
+            user_id, *[vector[c] for c in METRIC_COLUMNS],
+        )
+
+    columns = ", ".join(ROLLUP_KEY + ROLLUP_COLUMNS)
+    updates = ", ".join(f"{c} = archived_rollups.{c} + excluded.{c}" for c in ROLLUP_COLUMNS)
+    db.execute(
+        f"INSERT INTO archived_rollups ({columns}) SELECT * FROM ("
+        + ROLLUP_QUERY.format(where=f"AND {sale_filter}")
+        + f") WHERE true ON CONFLICT ({', '.join(ROLLUP_KEY)}) DO UPDATE SET {updates}"
+    )
+
+
+# --- Rollups mensais ---
+
+ROLLUP_KEY = ("user_id", "month", "brand_id", "product_id")
+ROLLUP_COLUMNS = (
+    "revenue",      # soma de sell_price
+    "cost",         # soma de custo + portes + destaques
+    "units_sold",
+    "days_total",   # soma de dias post -> venda (vendas com dias válidos e > 0)
+    "days_count",
+)
+
+# Vendas concretizadas (as mesmas da tabela de vendas) agregadas pelo mês da venda. Usada
+# tanto na reconstrução em bloco como nos snapshots por encomenda, para que as duas vias
+# produzam exatamente os mesmos valores.
+ROLLUP_QUERY = f"""
+    SELECT
+        sales.user_id,
+        substr(posts.sell_date, 1, 7) AS month,
+        orders.brand_id,
+        orders.product_id,
+        SUM(posts.sell_price) AS revenue,
+        SUM({_COST} + COALESCE(posts.ad_tax, 0)) AS cost,
+        COUNT(*) AS units_sold,
+        SUM(CASE WHEN {_VALID_SALE_DAYS} THEN {_SALE_DAYS} ELSE 0 END) AS days_total,
+        SUM(CASE WHEN {_VALID_SALE_DAYS} THEN 1 ELSE 0 END) AS days_count
+    FROM sales
+    JOIN orders ON orders.id = sales.order_id
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    JOIN posts ON posts.id = sales.post_id AND posts.order_id = orders.id
+    WHERE {_SOLD} AND sales.user_id IS NOT NULL {{where}}
+    GROUP BY sales.user_id, month, orders.brand_id, orders.product_id
+"""
+
+TREND_GROUPS = {None: (), "brand": ("brand_id",), "product": ("product_id",)}
+
+
+def rollup_snapshot(db, order_id):
+    """Devolve {(user_id, mês, marca, produto): vetor} com a venda de uma encomenda ({} se não vendida)."""
+    rows = db.execute(ROLLUP_QUERY.format(where="AND sales.order_id = ?"), order_id)
+    return {
+        tuple(row[k] for k in ROLLUP_KEY): {c: row[c] for c in ROLLUP_COLUMNS}
+        for row in rows
+    }
+
+
+def apply_rollup_change(db, before, after):
+    """Soma a diferença entre dois snapshots de rollups às linhas de monthly_rollups."""
+    columns = ", ".join(ROLLUP_KEY + ROLLUP_COLUMNS)
+    placeholders = ", ".join("?" for _ in ROLLUP_KEY + ROLLUP_COLUMNS)
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in ROLLUP_COLUMNS)
+    key_filter = " AND ".join(f"{k} = ?" for k in ROLLUP_KEY)
+    zero = dict.fromkeys(ROLLUP_COLUMNS, 0)
+    for key in set(before) | set(after):
+        old = before.get(key, zero)
+        new = after.get(key, zero)
+        delta = [new[c] - old[c] for c in ROLLUP_COLUMNS]
+        if not any(delta):
+            continue
+        db.execute(
+            f"""
+            INSERT INTO monthly_rollups ({columns}) VALUES ({placeholders})
+            ON CONFLICT ({", ".join(ROLLUP_KEY)}) DO UPDATE SET {updates}
+            """,
+            *key, *delta,
+        )
+        # Um grupo sem vendas deixa de existir (em vez de ficar com somas a zero).
+        db.execute(f"DELETE FROM monthly_rollups WHERE {key_filter} AND units_sold <= 0", *key)
+
+
+def rebuild_rollups(db, user_id=None):
+    """
+    Recalcula de raiz monthly_rollups (todos os utilizadores ou só um) numa só instrução,
+    a partir das vendas ativas e dos resumos do arquivo (archived_rollups).
+    """
+    columns = ", ".join(ROLLUP_KEY + ROLLUP_COLUMNS)
+    key = ", ".join(ROLLUP_KEY)
+    sums = ", ".join(f"SUM({c})" for c in ROLLUP_COLUMNS)
+    if user_id is None:
+        active, archived, args = ROLLUP_QUERY.format(where=""), "", ()
+        db.execute("DELETE FROM monthly_rollups")
+    else:
+        active, archived, args = ROLLUP_QUERY.format(where="AND sales.user_id = ?"), " WHERE user_id = ?", (user_id, user_id)
+        db.execute("DELETE FROM monthly_rollups WHERE user_id = ?", user_id)
+    db.execute(
+        f"INSERT INTO monthly_rollups ({columns}) SELECT {key}, {sums} FROM ("
+        f"{active} UNION ALL SELECT {columns} FROM archived_rollups{archived}"
+        f") GROUP BY {key}",
+        *args,
+    )
+
+
+def monthly_trends(db, user_id, month_from=None, month_to=None, by=None):
+    """
+    Vendas mensais de um utilizador, opcionalmente por marca (`by='brand'`) ou produto
+    (`by='product'`), entre dois meses 'YYYY-MM' (inclusive). Lê apenas monthly_rollups.
+    """
+    group = ("month",) + TREND_GROUPS[by]
+    sums = ", ".join(f"SUM({c}) AS {c}" for c in ROLLUP_COLUMNS)
+    sql = f"SELECT {', '.join(group)}, {sums} FROM monthly_rollups WHERE user_id = ?"
+    args = [user_id]
+    if month_from:
+        sql += " AND month >= ?"
+        args.append(month_from)
+    if month_to:
+        sql += " AND month <= ?"
+        args.append(month_to)
+    sql += f" GROUP BY {', '.join(group)} ORDER BY {', '.join(group)}"
+
+    rows = db.execute(sql, *args)
+    for row in rows:
+        row["profit"] = row["revenue"] - row["cost"]
+        row["avg_days_to_sale"] = row["days_total"] / row["days_count"] if row["days_count"] else None
+    return rows
+
+
+# --- Estatísticas de venda por grupo (projeções do stock) ---
+
+STATS_KEY = ("user_id", "brand_id", "product_id", "size_id")
+STATS_VALUES = (
+    "units_sold",           # vendas concretizadas
+    "revenue",              # soma de sell_price
+    "cost",                 # soma de custo + portes + destaques das vendas
+    "days_count",           # vendas com dias post -> venda válidos (e > 0)
+    "stock_units",          # encomendas em stock ou a caminho
+    "unpriced_stock_cost",  # custo do stock sem preço anunciado
+)
+MIN_SAMPLES = 3             # vendas a partir das quais o grupo substitui os valores globais
+
+# Contribuições por grupo e por número de dias até à venda (NULL: sem dias válidos). Usada
+# nos snapshots por encomenda e na reconstrução, como ROLLUP_QUERY.
+STATS_QUERY = f"""
+    SELECT
+        sales.user_id,
+        orders.brand_id,
+        orders.product_id,
+        orders.size_id,
+        CASE WHEN {_VALID_SALE_DAYS} THEN {_SALE_DAYS} END AS days,
+        SUM(CASE WHEN {_SOLD} THEN 1 ELSE 0 END) AS units_sold,
+        SUM(CASE WHEN {_SOLD} THEN posts.sell_price ELSE 0 END) AS revenue,
+        SUM(CASE WHEN {_SOLD} THEN {_COST} + COALESCE(posts.ad_tax, 0) ELSE 0 END) AS cost,
+        SUM(CASE WHEN {_VALID_SALE_DAYS} THEN 1 ELSE 0 END) AS days_count,
+        SUM(CASE WHEN sales.status IN ('shipping', 'stock') THEN 1 ELSE 0 END) AS stock_units,
+        SUM(CASE WHEN sales.status = 'shipping' OR (sales.status = 'stock' AND NOT ({_PRICED_STOCK}))
+                 THEN {_COST} ELSE 0 END) AS unpriced_stock_cost
+    FROM sales
+    JOIN orders ON orders.id = sales.order_id
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    LEFT JOIN posts ON posts.id = sales.post_id AND posts.order_id = orders.id
+    WHERE sales.user_id IS NOT NULL {{where}}
+    GROUP BY sales.user_id, orders.brand_id, orders.product_id, orders.size_id, days
+"""
+
+# Mediana dos dias até à venda de cada grupo, a partir do histograma (média dos dois
+# valores do meio quando o número de vendas é par).
+MEDIAN_SQL = f"""
+    UPDATE sale_stats SET days_median = (
+        SELECT (MIN(CASE WHEN upto >= (total + 1) / 2 THEN days END)
+                + MIN(CASE WHEN upto >= total / 2 + 1 THEN days END)) / 2.0
+        FROM (
+            SELECT days, SUM(units) OVER (ORDER BY days) AS upto, SUM(units) OVER () AS total
+            FROM sale_days
+            WHERE {" AND ".join(f"sale_days.{k} = sale_stats.{k}" for k in STATS_KEY)}
+        )
+    )
+    {{where}}
+"""
+
+_STATS_GROUP = " AND ".join(f"{k} = ?" for k in STATS_KEY)
+
+# Grupos com stock cujas estatísticas substituem as globais (ver group_projection())
+PROJECTION_QUERY = """
+    SELECT * FROM sale_stats
+    WHERE {where} stock_units > 0 AND (days_count >= ? OR units_sold >= ?)
+"""
+
+
+def stats_schema_statements():
+    """Tabelas sale_stats e sale_days (usadas pela migração 11)."""
+    key = ", ".join(f"{k} INTEGER NOT NULL" for k in STATS_KEY)
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS sale_stats (
+            {key},
+            {", ".join(f"{c} NUMERIC NOT NULL DEFAULT 0" for c in STATS_VALUES)},
+            days_total INTEGER NOT NULL DEFAULT 0,
+            days_median REAL,
+            PRIMARY KEY ({", ".join(STATS_KEY)})
+        ) WITHOUT ROWID
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS sale_days (
+            {key},
+            days INTEGER NOT NULL,
+            units INTEGER NOT NULL,
+            PRIMARY KEY ({", ".join(STATS_KEY)}, days)
+        ) WITHOUT ROWID
+        """,
+    ]
+
+
+def stats_load_statements(where="", history=None):
+    """
+    Instruções que carregam sale_days e sale_stats a partir de STATS_QUERY (`where` filtra
+    as vendas; `history` reescreve a consulta, ex.: archive.full_history) e calculam as medianas.
+    """
+    source = STATS_QUERY.format(where=where)
+    if history is not None:
+        source = history(source)
+    key = ", ".join(STATS_KEY)
+    values = ", ".join(STATS_VALUES)
+    sums = ", ".join(f"SUM({c})" for c in STATS_VALUES)
+    return [
+        f"INSERT INTO sale_days ({key}, days, units) "
+        f"SELECT {key}, days, SUM(days_count) FROM ({source}) "
+        f"WHERE days IS NOT NULL GROUP BY {key}, days",
+        f"INSERT INTO sale_stats ({key}, {values}, days_total) "
+        f"SELECT {key}, {sums}, SUM(COALESCE(days, 0) * days_count) FROM ({source}) GROUP BY {key}",
+    ]
+
+
+def stats_snapshot(db, order_id):
+    """Devolve {(user_id, marca, produto, tamanho, dias): vetor} com a contribuição de uma encomenda."""
+    rows = db.execute(STATS_QUERY.format(where="AND sales.order_id = ?"), order_id)
+    return {
+        tuple(row[k] for k in STATS_KEY) + (row["days"],): {c: row[c] for c in STATS_VALUES}
+        for row in rows
+    }
+
+
+def apply_stats_change(db, before, after):
+    """Soma a diferença entre dois snapshots a sale_stats e sale_days e recalcula as medianas afetadas."""
+    zero = dict.fromkeys(STATS_VALUES, 0)
+    groups = {}
+    for key in set(before) | set(after):
+        old = before.get(key, zero)
+        new = after.get(key, zero)
+        delta = {c: new[c] - old[c] for c in STATS_VALUES}
+        if not any(delta.values()):
+            continue
+        group, days = key[:-1], key[-1]
+        total = groups.setdefault(group, dict(zero, days_total=0))
+        for column in STATS_VALUES:
+            total[column] += delta[column]
+        if days is not None and delta["days_count"]:
+            total["days_total"] += days * delta["days_count"]
+            db.execute(
+                f"""
+                INSERT INTO sale_days ({", ".join(STATS_KEY)}, days, units) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT ({", ".join(STATS_KEY)}, days) DO UPDATE SET units = units + excluded.units
+                """,
+                *group, days, delta["days_count"],
+            )
+            db.execute(f"DELETE FROM sale_days WHERE {_STATS_GROUP} AND days = ? AND units <= 0", *group, days)
+
+    columns = STATS_VALUES + ("days_total",)
+    for group, delta in groups.items():
+        db.execute(
+            f"""
+            INSERT INTO sale_stats ({", ".join(STATS_KEY + columns)})
+            VALUES ({", ".join("?" for _ in STATS_KEY + columns)})
+            ON CONFLICT ({", ".join(STATS_KEY)}) DO UPDATE SET
+                {", ".join(f"{c} = {c} + excluded.{c}" for c in columns)}
+            """,
+            *group, *[delta[c] for c in columns],
+        )
+        # Um grupo sem vendas nem stock deixa de existir.
+        db.execute(f"DELETE FROM sale_stats WHERE {_STATS_GROUP} AND units_sold <= 0 AND stock_units <= 0", *group)
+        db.execute(MEDIAN_SQL.format(where=f"WHERE {_STATS_GROUP}"), *group)
+
+
+def rebuild_sale_stats(db, user_id=None, history=None):
+    """
+    Recalcula de raiz sale_stats e sale_days (todos os utilizadores ou só um). `history`
+    inclui as vendas arquivadas (archive.full_history), que o arquivo não retira daqui.
+    """
+    if user_id is None:
+        where, args, median_where = "", (), ""
+        db.execute("DELETE FROM sale_days")
+        db.execute("DELETE FROM sale_stats")
+    else:
+        where, args, median_where = "AND sales.user_id = ?", (user_id,), "WHERE user_id = ?"
+        db.execute("DELETE FROM sale_days WHERE user_id = ?", user_id)
+        db.execute("DELETE FROM sale_stats WHERE user_id = ?", user_id)
+    for statement in stats_load_statements(where, history):
+        db.execute(statement, *args)
+    db.execute(MEDIAN_SQL.format(where=median_where), *args)
+
+
+def load_sale_stats(db, user_id):
+    """Índice (marca, produto, tamanho) -> linha de sale_stats de um utilizador."""
+    return {
+        (row["brand_id"], row["product_id"], row["size_id"]): row
+        for row in db.execute("SELECT * FROM sale_stats WHERE user_id = ?", user_id)
+    }
+
+
+def projection_groups(db, user_id=None):
+    """{user_id: [linhas de sale_stats]} dos grupos com stock e vendas suficientes (ver group_projection())."""
+    if user_id is None:
+        rows = db.execute(PROJECTION_QUERY.format(where=""), MIN_SAMPLES, MIN_SAMPLES)
+    else:
+        rows = db.execute(PROJECTION_QUERY.format(where="user_id = ? AND"), user_id, MIN_SAMPLES, MIN_SAMPLES)
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["user_id"], []).append(row)
+    return groups
+
+
+def group_projection(stats, tempo_venda_medio, multiplicador):
+    """
+    Dias até à venda e ROI previstos para um artigo do grupo `stats` (linha de sale_stats
+    ou None): a mediana e o ROI do grupo quando este tem pelo menos MIN_SAMPLES vendas,
+    caso contrário os valores globais do utilizador.
+    """
+    days, roi = tempo_venda_medio, multiplicador
+    if stats is not None:
+        if stats["days_count"] >= MIN_SAMPLES:
+            days = stats["days_median"]
+        if stats["units_sold"] >= MIN_SAMPLES and stats["cost"] > 0:
+            roi = (stats["revenue"] - stats["cost"]) / stats["cost"]
+    return days, roi
+
+
+def project_stock(stock_units, unpriced_cost, groups, tempo_venda_medio, multiplicador):
+    """
+    Projeção do stock: (dias para vender todo o stock, lucro estimado do stock sem preço).
+    Os artigos dos `groups` (projection_groups()) usam as estatísticas do seu grupo; os
+    restantes, a média de dias e o ROI globais.
+    """
+    days_total = 0
+    profit = 0
+    for stats in groups:
+        days, roi = group_projection(stats, tempo_venda_medio, multiplicador)
+        days_total += stats["stock_units"] * days
+        profit += stats["unpriced_stock_cost"] * roi
+        stock_units -= stats["stock_units"]
+        unpriced_cost -= stats["unpriced_stock_cost"]
+    return days_total + stock_units * tempo_venda_medio, profit + unpriced_cost * multiplicador
+
+
+def metrics_from_row(row, groups=()):
+    """
+    Converte as somas guardadas no dicionário de calculate_user_metrics_from_data().
+    `groups` são os grupos de sale_stats com estatísticas próprias (projection_groups()).
+    """
+    faturacao = row["faturacao"]
+    gastos_totais = row["gastos"]
+    lucro_total = faturacao - gastos_totais
+
+    multiplicador = 0.0
+    if gastos_totais > 0:
+        multiplicador = lucro_total / gastos_totais
+
+    valid_sales = row["dias_venda_count"]
+    tempo_venda_medio = (row["dias_venda_total"] / valid_sales) if valid_sales > 0 else 60
+    stock_atual = row["encomendas_stock"] + row["encomendas_chegar"]
+    dias_stock, unpriced_profit = project_stock(
+        stock_atual, row["unpriced_stock_cost"], groups, tempo_venda_medio, multiplicador)
+
+    dias_fim_stock = 0
+    if stock_atual > 0:
+        dias_fim_stock = dias_stock if dias_stock > 0 else 365
+
+    return {
+        'faturacao': faturacao,
+        'gastos': gastos_totais,
+        'lucro': lucro_total,
+        'multiplicador': multiplicador,
+        'encomendas_stock': row["encomendas_stock"],
+        'encomendas_chegar': row["encomendas_chegar"],
+        'encomendas_vendidas': row["encomendas_vendidas"],
+        'dias_fim_stock': dias_fim_stock,
+        'invested_stock_cost': row["invested_stock_cost"],
+        'estimated_stock_profit': row["stock_margin"] + unpriced_profit,
+    }
+
+
+def load_metrics(db, user_id):
+    """Lê a linha materializada de um utilizador (e os grupos da projeção). Devolve None se ainda não existir."""
+    rows = db.execute("SELECT * FROM user_metrics WHERE user_id = ?", user_id)
+    if not rows:
+        return None
+    return metrics_from_row(rows[0], projection_groups(db, user_id).get(user_id, ()))
+
+
+def compare(expected, actual, rel_tol=1e-9, abs_tol=1e-6):
+    """Devolve as chaves cujo valor materializado difere do recalculado."""
+    return [
+        key for key, value in expected.items()
+        if not math.isclose(value, actual.get(key, 0), rel_tol=rel_tol, abs_tol=abs_tol)
+    ]
@@ -0,0 +1,256 @@
+"""
+Linhas compactas do pipeline do dashboard (encomendas, posts e vendas).
+
+Substituem os dicts que get_user_data() e get_table_page() construíam por linha: cada
+linha é um objeto com `__slots__` (sem `__dict__`), os nomes do catálogo (produto, marca,
+cor, tamanho), os estados e as datas são internados, pelo que milhares de linhas partilham
+as mesmas strings (um histórico de anos tem só alguns milhares de datas distintas), e
+os campos derivados (contagens de dias, datas formatadas, gastos e lucro das vendas) são
+calculados quando são lidos em vez de guardados. Uma venda (`SaleRow`) é apenas uma vista
+sobre o post vendido, sem cópia dos seus campos.
+
+As linhas aceitam o mesmo acesso que os dicts que substituem (`row["campo"]`,
+`row.get("campo")`, `row.campo` nos templates Jinja), pelo que os templates e
+calculate_user_metrics_from_data() não mudam. `to_dict()` devolve o dict de antes (API).
+"""
+from sys import intern
+
+from helpers import calculate_days_diff, format_date_pt
+
+
+def _shared(value):
+    return intern(value) if isinstance(value, str) else value
+
+
+class Row:
+    """Base das linhas: acesso por chave sobre os atributos listados em `KEYS`."""
+
+    __slots__ = ()
+    KEYS = ()
+    _KEY_SET = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._KEY_SET = frozenset(cls.KEYS)
+
+    def __getitem__(self, key):
+        if key not in self._KEY_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._KEY_SET
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._KEY_SET else default
+
+    def keys(self):
+        return self.KEYS
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class OrderRow(Row):
+    """Encomenda do dashboard (colunas de ORDERS_QUERY, datas guardadas em YYYY-MM-DD)."""
+
+    COLUMNS = ("order_id", "product_name", "brand_name", "color_name", "size_name",
+               "order_date", "delivery_date", "price", "deliver_tax", "total_cost",
+               "sale_id", "status", "post_id", "brand_id", "product_id", "size_id")
+    KEYS = COLUMNS + ("days_to_delivery", "days_since_order")
+    __slots__ = ("order_id", "product_name", "brand_name", "color_name", "size_name",
+                 "order_date_iso", "delivery_date_iso", "price", "deliver_tax", "sale_id",
+                 "status", "post_id", "brand_id", "product_id", "size_id", "today")
+
+    def __init__(self, order_id, product_name, brand_name, color_name, size_name, order_date,
+                 delivery_date, price, deliver_tax, total_cost, sale_id, status, post_id,
+                 brand_id=None, product_id=None, size_id=None, today=None):
+        self.order_id = order_id
+        self.product_name = _shared(product_name)
+        self.brand_name = _shared(brand_name)
+        self.color_name = _shared(color_name)
+        self.size_name = _shared(size_name)
+        self.order_date_iso = _shared(order_date)
+        self.delivery_date_iso = _shared(delivery_date)
+        self.price = price
+        self.deliver_tax = deliver_tax
+        self.sale_id = sale_id
+        self.status = _shared(status)
+        self.post_id = post_id
+        # Grupo do artigo nas estatísticas de venda (projeções do stock)
+        self.brand_id = brand_id
+        self.product_id = product_id
+        self.size_id = size_id
+        self.today = today
+
+    @property
+    def order_date(self):
+        return format_date_pt(self.order_date_iso)
+
+    @property
+    def delivery_date(self):
+        return format_date_pt(self.delivery_date_iso)
+
+    @property
+    def total_cost(self):
+        return (self.price or 0) + (self.deliver_tax or 0)
+
+    @property
+    def days_to_delivery(self):
+        # Se já chegou, dias que demorou (Order -> Delivery)
+        if not self.delivery_date_iso:
+            return None
+        return calculate_days_diff(self.order_date_iso, self.delivery_date_iso)
+
+    @property
+    def days_since_order(self):
+        # Se não chegou, dias desde o pedido até hoje (Order -> Hoje)
+        if self.delivery_date_iso:
+            return None
+        return calculate_days_diff(self.order_date_iso, None, self.today)
+
+
+class PostRow(Row):
+    """Post do dashboard (colunas de POSTS_QUERY, datas guardadas em YYYY-MM-DD)."""
+
+    COLUMNS = ("post_id", "post_date", "first_price", "sell_price", "ad_tax", "sell_date",
+               "likes", "views", "proposals", "order_id", "order_date", "delivery_date",
+               "order_price", "order_deliver_tax", "product_name", "brand_name", "color_name",
+               "size_name", "status")
+    KEYS = COLUMNS + ("days_to_sale", "days_since_post")
+    __slots__ = ("post_id", "post_date_iso", "first_price", "sell_price", "ad_tax",
+                 "sell_date_iso", "likes", "views", "proposals", "order_id", "order_date",
+                 "delivery_date", "order_price", "order_deliver_tax", "product_name",
+                 "brand_name", "color_name", "size_name", "status", "today")
+
+    def __init__(self, post_id, post_date, first_price, sell_price, ad_tax, sell_date, likes,
+                 views, proposals, order_id, order_date, delivery_date, order_price,
+                 order_deliver_tax, product_name, brand_name, color_name, size_name, status,
+                 today=None):
+        self.post_id = post_id
+        self.post_date_iso = _shared(post_date)
+        self.first_price = first_price
+        self.sell_price = sell_price
+        self.ad_tax = ad_tax
+        self.sell_date_iso = _shared(sell_date)
+        self.likes = likes
+        self.views = views
+        self.proposals = proposals
+        self.order_id = order_id
+        # As datas da encomenda ficam em YYYY-MM-DD, como nos dicts de antes.
+        self.order_date = _shared(order_date)
+        self.delivery_date = _shared(delivery_date)
+        self.order_price = order_price
+        self.order_deliver_tax = order_deliver_tax
+        self.product_name = _shared(product_name)
+        self.brand_name = _shared(brand_name)
+        self.color_name = _shared(color_name)
+        self.size_name = _shared(size_name)
+        self.status = _shared(status)
+        self.today = today
+
+    @property
+    def post_date(self):
+        return format_date_pt(self.post_date_iso)
+
+    @property
+    def sell_date(self):
+        return format_date_pt(self.sell_date_iso)
+
+    @property
+    def is_sale(self):
+        """Venda concretizada (entra na tabela de vendas)."""
+        return self.status == "sold" and self.sell_price is not None and self.sell_date_iso is not None
+
+    @property
+    def days_to_sale(self):
+        # Se vendido, dias que demorou a vender (Post -> Sell)
+        if self.status != "sold" or not self.sell_date_iso:
+            return None
+        return calculate_days_diff(self.post_date_iso, self.sell_date_iso)
+
+    @property
+    def days_since_post(self):
+        # Se ativo, dias desde o post até hoje (Post -> Hoje)
+        if self.status == "sold" and self.sell_date_iso:
+            return None
+        return calculate_days_diff(self.post_date_iso, None, self.today)
+
+
+class SaleRow(Row):
+    """Linha da tabela de vendas: uma vista sobre um post vendido (PostRow.is_sale)."""
+
+    KEYS = ("product_info", "brand_name", "size_name", "color_name", "total_gastos", "ad_tax",
+            "sell_price", "lucro", "sell_date", "days_to_sale_total", "tempo_total", "post_id")
+    __slots__ = ("post",)
+
+    def __init__(self, post):
+        self.post = post
+
+    @property
+    def product_info(self):
+        # Simplificado para caber na tabela; os nomes individuais também estão acessíveis
+        return f"{self.post.product_name} / {self.post.brand_name}"
+
+    @property
+    def brand_name(self):
+        return self.post.brand_name
+
+    @property
+    def size_name(self):
+        return self.post.size_name
+
+    @property
+    def color_name(self):
+        return self.post.color_name
+
+    @property
+    def total_gastos(self):
+        # Encomenda + portes + destaques
+        post = self.post
+        return (post.order_price or 0) + (post.order_deliver_tax or 0) + (post.ad_tax or 0)
+
+    @property
+    def ad_tax(self):
+        return self.post.ad_tax or 0
+
+    @property
+    def sell_price(self):
+        return self.post.sell_price
+
+    @property
+    def lucro(self):
+        return (self.post.sell_price or 0) - self.total_gastos
+
+    @property
+    def sell_date(self):
+        return self.post.sell_date
+
+    @property
+    def days_to_sale_total(self):
+        # Tempo total (Encomenda -> Venda)
+        return calculate_days_diff(self.post.order_date, self.post.sell_date_iso)
+
+    tempo_total = days_to_sale_total
+
+    @property
+    def post_id(self):
+        return self.post.post_id
+
+
+def orders_from_dicts(rows, today=None):
+    """Converte as linhas (dicts) de ORDERS_QUERY, ex.: uma página do keyset."""
+    return [OrderRow(*(row[column] for column in OrderRow.COLUMNS), today=today) for row in rows]
+
+
+def posts_from_dicts(rows, today=None):
+    """Converte as linhas (dicts) de POSTS_QUERY/SALES_QUERY, ex.: uma página do keyset."""
+    return [PostRow(*(row[column] for column in PostRow.COLUMNS), today=today) for row in rows]
+
+
+def sales_from_posts(posts):
+    """Tabela de vendas: os posts (PostRow) que são vendas concretizadas."""
+    return [SaleRow(post) for post in posts if post.is_sale]
@@ -0,0 +1,277 @@
+"""
+Pesquisa de texto livre (SQLite FTS5) e por facetas nas encomendas e posts de um utilizador.
+
+Cada venda (linha de `sales`) tem uma linha no índice `search_index`, com o mesmo rowid,
+com os nomes do produto, marca, cor e tamanho da encomenda e um token com o dono
+(`u<user_id>`), para que o MATCH devolva logo só os artigos do utilizador. O índice é
+mantido por triggers (criados pela migração 8, ver migrations.py) em `sales`, `orders` e
+nas tabelas de lookup, pelo que as rotas de escrita, a importação e o gerador sintético o
+mantêm sincronizado sem código adicional. `rebuild()` (e `flask search-rebuild`) volta a
+construí-lo de raiz.
+
+Só as vendas ativas são pesquisáveis: `archive.archive_sold()` apaga as linhas de `sales` e
+o trigger de DELETE tira-as do índice. As vendas arquivadas continuam no histórico completo
+(`history=all`, exportações), mas não aparecem na pesquisa.
+
+Uma pesquisa como "Nike, tamanho 42, preto, por vender" é convertida em termos FTS (com
+prefixo) e em facetas: as palavras de estado (vendido, por vender, stock, ...) filtram
+`sales.status`, e os intervalos de datas filtram a data da encomenda, do post ou da venda.
+Os resultados são paginados por keyset (pagination.py).
+"""
+import re
+
+import pagination
+
+INDEX_COLUMNS = ("owner", "product", "brand", "color", "size")
+
+# Linhas do índice (rowid = sales.id) para as vendas que satisfazem `{where}`.
+INDEX_ROWS = """
+    SELECT sales.id, 'u' || sales.user_id, products.name, brands.name, colors.name, sizes.name
+    FROM sales
+    JOIN orders ON orders.id = sales.order_id
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    WHERE sales.user_id IS NOT NULL {where}
+"""
+
+_INSERT = f"INSERT INTO search_index (rowid, {', '.join(INDEX_COLUMNS)})"
+
+# Tabela de lookup -> coluna de `orders` que a referencia
+LOOKUP_REFERENCES = {
+    "products": "product_id",
+    "brands": "brand_id",
+    "colors": "color_id",
+    "sizes": "size_id",
+}
+
+
+def schema_statements():
+    """Tabela FTS5, triggers de sincronização e carga inicial (usados pela migração 8)."""
+    statements = [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            {', '.join(INDEX_COLUMNS)},
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '1 2 3'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS sales_insert_search_index AFTER INSERT ON sales
+        BEGIN
+            {_INSERT} {INDEX_ROWS.format(where="AND sales.id = NEW.id")};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS sales_update_search_index
+        AFTER UPDATE OF order_id, user_id ON sales
+        BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id;
+            {_INSERT} {INDEX_ROWS.format(where="AND sales.id = NEW.id")};
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS sales_delete_search_index AFTER DELETE ON sales
+        BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS orders_update_search_index
+        AFTER UPDATE OF {', '.join(LOOKUP_REFERENCES.values())} ON orders
+        BEGIN
+            DELETE FROM search_index WHERE rowid IN (SELECT id FROM sales WHERE order_id = NEW.id);
+            {_INSERT} {INDEX_ROWS.format(where="AND sales.order_id = NEW.id")};
+        END
+        """,
+    ]
+    # Renomear um produto, marca, cor ou tamanho reindexa as vendas que o usam.
+    for table, column in LOOKUP_REFERENCES.items():
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_update_search_index AFTER UPDATE OF name ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid IN (
+                    SELECT sales.id FROM sales JOIN orders ON orders.id = sales.order_id
+                    WHERE orders.{column} = NEW.id
+                );
+                {_INSERT} {INDEX_ROWS.format(where=f"AND orders.{column} = NEW.id")};
+            END
+        """)
+    statements.append(f"{_INSERT} {INDEX_ROWS.format(where='')}")
+    return statements
+
+
+def rebuild(db):
+    """Reconstrói o índice de raiz a partir de `sales`. Devolve o número de linhas indexadas."""
+    db.execute("DELETE FROM search_index")
+    db.execute(f"{_INSERT} {INDEX_ROWS.format(where='')}")
+    db.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return db.execute("SELECT COUNT(*) AS n FROM search_index")[0]["n"]
+
+
+# --- Interpretação da pesquisa ---
+
+# Palavras que indicam um estado em vez de um nome
+STATUS_WORDS = {
+    "sold": ("sold",), "vendido": ("sold",), "vendida": ("sold",),
+    "vendidos": ("sold",), "vendidas": ("sold",),
+    "unsold": ("stock", "shipping"), "disponivel": ("stock", "shipping"),
+    "disponiveis": ("stock", "shipping"),
+    "stock": ("stock",),
+    "shipping": ("shipping",), "caminho": ("shipping",), "chegar": ("shipping",),
+}
+# Expressões de várias palavras, procuradas antes das palavras soltas
+STATUS_PHRASES = {
+    "por vender": ("stock", "shipping"),
+    "nao vendido": ("stock", "shipping"),
+    "nao vendida": ("stock", "shipping"),
+    "a caminho": ("shipping",),
+    "em stock": ("stock",),
+}
+# Palavras que só descrevem o campo ("tamanho 42", "cor preto") e não são pesquisadas
+STOPWORDS = {
+    "size", "tamanho", "tam", "color", "colour", "cor", "brand", "marca",
+    "product", "produto", "and", "e", "de", "do", "da",
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_ACCENTS = str.maketrans("áàâãéêíóôõúç", "aaaaeeiooouc")
+
+
+def parse_query(text):
+    """
+    Separa uma pesquisa em (termos de texto, estados). Os estados são um tuplo ordenado ou
+    None se a pesquisa não mencionar nenhum.
+    """
+    text = (text or "").lower().translate(_ACCENTS)
+    statuses = set()
+    for phrase, values in STATUS_PHRASES.items():
+        if re.search(rf"\b{phrase}\b", text):
+            statuses.update(values)
+            text = re.sub(rf"\b{phrase}\b", " ", text)
+
+    terms = []
+    for word in _WORD.findall(text):
+        if word in STATUS_WORDS:
+            statuses.update(STATUS_WORDS[word])
+        elif word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms, (tuple(sorted(statuses)) or None)
+
+
+def match_expression(user_id, terms):
+    """Expressão FTS5: o dono e todos os termos (com prefixo) nos nomes do artigo."""
+    names = " ".join(INDEX_COLUMNS[1:])
+    parts = [f'owner : "u{int(user_id)}"']
+    parts += ['{%s} : "%s"*' % (names, term.replace('"', '""')) for term in terms]
+    return " AND ".join(parts)
+
+
+# --- Consulta ---
+
+SEARCH_QUERY = """
+    SELECT {sort_key}
+        sales.id AS sale_id,
+        sales.status AS status,
+        orders.id AS order_id,
+        orders.order_date,
+        orders.delivery_date,
+        orders.price,
+        orders.deliver_tax,
+        products.name AS product_name,
+        brands.name AS brand_name,
+        colors.name AS color_name,
+        sizes.name AS size_name,
+        posts.id AS post_id,
+        posts.post_date,
+        posts.first_price,
+        posts.sell_date,
+        posts.sell_price
+    FROM {source}
+    JOIN orders ON orders.id = sales.order_id
+    JOIN products ON products.id = orders.product_id
+    JOIN brands ON brands.id = orders.brand_id
+    JOIN colors ON colors.id = orders.color_id
+    JOIN sizes ON sizes.id = orders.size_id
+    LEFT JOIN posts ON posts.id = sales.post_id
+    WHERE sales.user_id = ?
+"""
+
+# Com texto, as vendas vêm do índice FTS; sem texto, do índice (user_id, status) de `sales`.
+# O CROSS JOIN fixa a ordem: sem ele o planeador pode preferir o índice de `sales` e
+# avaliar o MATCH uma vez por venda do utilizador.
+FTS_SOURCE = "search_index CROSS JOIN sales ON sales.id = search_index.rowid"
+FTS_FILTER = " AND search_index MATCH ?"
+
+# Expressões de ordenação (nunca NULL) e campos de data filtráveis
+SORTS = {
+    "order_date": "orders.order_date",
+    "price": "orders.price",
+    "product": "products.name",
+}
+DATE_FIELDS = {
+    "order_date": "orders.order_date",
+    "post_date": "posts.post_date",
+    "sell_date": "posts.sell_date",
+}
+
+
+def _filters(user_id, terms, statuses, date_field, date_from, date_to):
+    """Fonte (FROM), condições extra e parâmetros comuns à página e às facetas."""
+    source = "sales"
+    where = ""
+    params = [user_id]
+    if terms:
+        source = FTS_SOURCE
+        where += FTS_FILTER
+        params.append(match_expression(user_id, terms))
+    if statuses:
+        where += f" AND sales.status IN ({', '.join('?' for _ in statuses)})"
+        params.extend(statuses)
+    column = DATE_FIELDS[date_field]
+    if date_from:
+        where += f" AND {column} >= ?"
+        params.append(date_from)
+    if date_to:
+        where += f" AND {column} <= ?"
+        params.append(date_to)
+    return source, where, params
+
+
+def status_facets(db, user_id, terms, date_field="order_date", date_from=None, date_to=None):
+    """Número de resultados por estado (sem o filtro de estado), para as facetas."""
+    source, where, params = _filters(user_id, terms, None, date_field, date_from, date_to)
+    sql = SEARCH_QUERY.format(sort_key="", source=source) + where
+    sql = "SELECT status, COUNT(*) AS n FROM (" + sql + ") GROUP BY status"
+    return {row["status"]: row["n"] for row in db.execute(sql, *params)}
+
+
+def search(db, user_id, text="", statuses=None, date_field="order_date", date_from=None,
+           date_to=None, sort="order_date", descending=True, after=None, before=None,
+           limit=pagination.PAGE_SIZE):
+    """
+    Pesquisa os artigos de um utilizador. `statuses` (se dado) substitui os estados lidos
+    do texto. Devolve {'rows', 'next_cursor', 'prev_cursor', 'terms', 'statuses', 'facets'}.
+    """
+    terms, text_statuses = parse_query(text)
+    statuses = tuple(statuses) if statuses else text_statuses
+    if date_field not in DATE_FIELDS:
+        raise ValueError(f"Campo de data desconhecido: {date_field!r}")
+    if sort not in SORTS:
+        raise ValueError(f"Ordenação desconhecida: {sort!r}")
+
+    source, where, params = _filters(user_id, terms, statuses, date_field, date_from, date_to)
+    page = pagination.fetch_page(
+        db, SEARCH_QUERY.replace("{source}", source) + where, params,
+        SORTS[sort], "sales.id", "sale_id",
+        descending=descending, after=after, before=before, limit=limit,
+    )
+    for row in page["rows"]:
+        row.pop("sort_key", None)
+    page.update(
+        terms=terms,
+        statuses=list(statuses) if statuses else None,
+        facets={"status": status_facets(db, user_id, terms, date_field, date_from, date_to)},
+    )
+    return page
@@ -0,0 +1,161 @@
+"""
+Sessões do lado do servidor, criadas apenas quando há algo a guardar.
+
+A sessão só transporta as mensagens de `flash()` através do redirect que se segue a cada
+escrita. Um pedido sem cookie de sessão (ex.: as leituras do dashboard) recebe uma sessão
+vazia sem tocar no armazenamento; a sessão só é criada (id aleatório + cookie) quando é
+modificada com dados, e é apagada (linha e cookie) assim que as mensagens são consumidas.
+
+Dois armazenamentos, ambos com expiração e recolha periódica das sessões expiradas:
+    SALES_SESSIONS=sqlite   tabela `sessions` do sales.db (omissão)
+    SALES_SESSIONS=memory   dicionário em memória do processo
+O armazenamento em memória só serve um processo (desenvolvimento): com vários workers, o
+redirect depois de uma escrita pode chegar a outro processo e a mensagem perde-se.
+"""
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+SESSION_TTL = 3600      # segundos até uma sessão não lida expirar
+GC_INTERVAL = 60        # intervalo mínimo (segundos) entre recolhas das sessões expiradas
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    Dicionário da sessão; `sid` é None enquanto a sessão não tiver sido guardada.
+    `stale` indica um cookie com um id expirado ou desconhecido, a limpar na resposta.
+    """
+
+    def __init__(self, initial=None, sid=None, stale=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.stale = stale
+        self.modified = False
+
+
+class MemoryStore:
+    """Sessões num dicionário do processo: sid -> (expira_em, dados)."""
+
+    def __init__(self, gc_interval=GC_INTERVAL):
+        self.gc_interval = gc_interval
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._next_gc = 0
+
+    def load(self, sid, now):
+        with self._lock:
+            entry = self._sessions.get(sid)
+        if entry is None or entry[0] <= now:
+            return None
+        return dict(entry[1])
+
+    def save(self, sid, data, expires_at, now):
+        with self._lock:
+            self._sessions[sid] = (expires_at, dict(data))
+            if now >= self._next_gc:
+                self._next_gc = now + self.gc_interval
+                self._sessions = {k: v for k, v in self._sessions.items() if v[0] > now}
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SqliteStore:
+    """Sessões na tabela `sessions` (criada pela migração 7), partilhada entre processos."""
+
+    def __init__(self, db, gc_interval=GC_INTERVAL):
+        self.db = db
+        self.gc_interval = gc_interval
+        self.serializer = TaggedJSONSerializer()
+        self._next_gc = 0
+
+    def load(self, sid, now):
+        rows = self.db.execute("SELECT data FROM sessions WHERE sid = ? AND expires_at > ?", sid, now)
+        return self.serializer.loads(rows[0]["data"]) if rows else None
+
+    def save(self, sid, data, expires_at, now):
+        self.db.execute(
+            """
+            INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            """,
+            sid, self.serializer.dumps(dict(data)), expires_at,
+        )
+        if now >= self._next_gc:
+            self._next_gc = now + self.gc_interval
+            self.db.execute("DELETE FROM sessions WHERE expires_at <= ?", now)
+
+    def delete(self, sid):
+        self.db.execute("DELETE FROM sessions WHERE sid = ?", sid)
+
+
+class LazySessionInterface(SessionInterface):
+    """Interface de sessão do Flask sobre um MemoryStore ou SqliteStore."""
+
+    def __init__(self, store, ttl=SESSION_TTL):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession()
+        data = self.store.load(sid, time.time())
+        if data is None:
+            # Id expirado ou desconhecido: nunca é reutilizado (um id novo é gerado se
+            # algo for guardado; caso contrário o cookie é apagado).
+            return ServerSession(stale=True)
+        return ServerSession(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+            if session.stale or (session.sid is not None and session.modified):
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+
+        now = time.time()
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, session, now + self.ttl, now)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add("Cookie")
+
+
+def init_app(app, db, backend=None, ttl=SESSION_TTL):
+    """Instala a interface de sessão na app (backend `sqlite`, por omissão, ou `memory`). Devolve o store."""
+    if backend is None:
+        backend = os.environ.get("SALES_SESSIONS", "sqlite")
+    if backend == "sqlite":
+        store = SqliteStore(db)
+    elif backend == "memory":
+        store = MemoryStore()
+    else:
+        raise ValueError(f"Backend de sessões desconhecido: {backend!r}")
+    app.session_interface = LazySessionInterface(store, ttl)
+    return store
@@ -0,0 +1,408 @@
+"""
+Particionamento (sharding) dos dados por utilizador em vários ficheiros SQLite.
+
+Com um único `sales.db`, as escritas de todos os utilizadores disputam o único lock de
+escrita do SQLite. Em modo particionado (SALES_SHARD_DIR), os dados de cada utilizador (as
+suas linhas de `sales`, as encomendas e os posts a que apontam, os modelos de leitura, o
+arquivo e o índice de pesquisa) vivem num de N ficheiros `shard-NNN.db`, escolhido por
+`user_id % N`: cada ficheiro é um balde de utilizadores (com N >= número de utilizadores,
+um ficheiro por utilizador). As escritas de utilizadores em shards diferentes correm em
+paralelo, cada shard com o seu WAL e o seu group commit.
+
+As tabelas de lookup vivem em `catalog.db`, a fonte de verdade (catálogo em memória,
+sessões, novos nomes criados pela importação). Cada shard guarda uma réplica dos produtos,
+marcas, tamanhos e cores, e dos seus próprios utilizadores, para que as junções e as
+chaves estrangeiras das consultas existentes não mudem. A réplica é atualizada quando o
+shard é usado e a versão do catálogo (`lookup_version`) mudou. Os nomes removidos do
+catálogo não são removidos das réplicas.
+
+`ShardRouter` tem a interface de `database.Database`: a app encaminha a thread de cada
+pedido para o shard do utilizador do pedido (`route(user_id)`) e `execute()`, `write()`,
+`transaction()`, ... vão para esse shard; sem encaminhamento levantam ShardingError. As
+vistas de todos os utilizadores (classificação, reconstruções, arquivo) usam `fan_out()`,
+que corre a mesma função em todos os shards em paralelo.
+
+Os ids de orders/posts/sales continuam únicos entre shards: as tabelas dos shards usam
+AUTOINCREMENT, o shard k a partir de `k * ID_STRIDE` (o shard 0 continua a partir do
+maior id da base de dados original).
+
+    python sharding.py split sales.db shards/ --shards 8
+    SALES_SHARD_DIR=shards flask run
+"""
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import click
+
+import database
+import migrations
+from catalog import LOOKUP_TABLES
+
+MANIFEST = "manifest.json"
+CATALOG_FILE = "catalog.db"
+SHARD_FILE = "shard-{:03d}.db"
+
+ID_STRIDE = 2 ** 40     # intervalo de ids de cada shard
+FAN_OUT_WORKERS = 8     # threads das consultas em todos os shards
+
+# Tabelas base (anteriores às migrações), copiadas da base de dados original
+BASE_TABLES = ("users", "products", "brands", "sizes", "colors", "orders", "posts", "sales")
+DATA_TABLES = ("orders", "posts", "sales")
+
+# Réplica de uma tabela de lookup num shard: insere os ids novos e corrige os nomes alterados
+# (o trigger do índice de pesquisa reindexa as vendas de um nome alterado).
+UPSERT_LOOKUP = """
+    INSERT INTO {table} (id, name) VALUES (?, ?)
+    ON CONFLICT (id) DO UPDATE SET name = excluded.name WHERE name IS NOT excluded.name
+"""
+
+
+class ShardingError(Exception):
+    """Consulta sem shard (pedido sem utilizador) ou diretório de shards inválido."""
+
+
+def shard_index(user_id, count):
+    """Shard de um utilizador (as linhas sem utilizador ficam no shard 0)."""
+    return int(user_id or 0) % count
+
+
+def read_manifest(directory):
+    """Lê o manifesto de um diretório criado por `split()`."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ShardingError(f"{directory} não tem {MANIFEST} (crie-o com 'python sharding.py split')") from None
+
+
+def paths(directory):
+    """Ficheiros do catálogo e dos shards (ex.: para aplicar as migrações a todos)."""
+    manifest = read_manifest(directory)
+    return [os.path.join(directory, name) for name in [manifest["catalog"]] + manifest["shards"]]
+
+
+def _catalog_version(db):
+    rows = db.execute("SELECT version FROM lookup_version WHERE id = 1")
+    return rows[0]["version"] if rows else 0
+
+
+class ShardRouter:
+    """Catálogo e shards, com a interface de `Database` sobre o shard encaminhado na thread."""
+
+    def __init__(self, directory, workers=FAN_OUT_WORKERS, **options):
+        manifest = read_manifest(directory)
+        self.directory = directory
+        self.catalog = database.Database(os.path.join(directory, manifest["catalog"]), **options)
+        self.shards = [database.Database(os.path.join(directory, name), **options)
+                       for name in manifest["shards"]]
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._synced = [None] * len(self.shards)    # versão do catálogo replicada em cada shard
+        self._executor = ThreadPoolExecutor(min(workers, len(self.shards)),
+                                            thread_name_prefix="shard-fan-out")
+        self._on_query = None
+
+    @property
+    def databases(self):
+        return [self.catalog] + self.shards
+
+    # --- Encaminhamento ---
+
+    def index_for(self, user_id):
+        try:
+            return shard_index(user_id, len(self.shards))
+        except (TypeError, ValueError):
+            raise ShardingError(f"Utilizador inválido: {user_id!r}") from None
+
+    def route(self, user_id):
+        """Encaminha a thread atual para o shard do utilizador. Devolve o shard."""
+        index = self.index_for(user_id)
+        self._sync(index)
+        self._local.shard = self.shards[index]
+        return self._local.shard
+
+    @contextmanager
+    def using(self, user_id):
+        """Encaminha a thread para o shard do utilizador durante o bloco (ex.: threads de fundo, CLI)."""
+        previous = getattr(self._local, "shard", None)
+        self.route(user_id)
+        try:
+            yield self
+        finally:
+            self._local.shard = previous
+
+    def current(self):
+        """Shard encaminhado na thread atual."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            raise ShardingError("Consulta sem utilizador: não há shard encaminhado para este pedido")
+        return shard
+
+    def _sync(self, index):
+        """Atualiza a réplica das lookups no shard se a versão do catálogo mudou."""
+        version = _catalog_version(self.catalog)
+        if self._synced[index] == version:
+            return
+        with self._sync_lock:
+            if self._synced[index] == version:
+                return
+            shard = self.shards[index]
+            replicas = {}
+            for table in LOOKUP_TABLES:
+                rows = self.catalog.execute(f"SELECT id, name FROM {table}")
+                if table == "users":
+                    rows = [row for row in rows if self.index_for(row["id"]) == index]
+                replicas[table] = [(row["id"], row["name"]) for row in rows]
+            with shard.transaction():
+                for table, rows in replicas.items():
+                    shard.executemany(UPSERT_LOOKUP.format(table=table), rows)
+            self._synced[index] = version
+
+    # --- Interface de Database (shard da thread) ---
+
+    def execute(self, sql, *args):
+        return self.current().execute(sql, *args)
+
+    def execute_as(self, row_class, sql, *args, **extra):
+        return self.current().execute_as(row_class, sql, *args, **extra)
+
+    def executemany(self, sql, seq_of_args):
+        return self.current().executemany(sql, seq_of_args)
+
+    def iterate(self, sql, *args):
+        return self.current().iterate(sql, *args)
+
+    def transaction(self):
+        return self.current().transaction()
+
+    def write(self, fn):
+        """Escrita no shard da thread. `fn` recebe o shard: deve usá-lo em vez do router."""
+        return self.current().write(fn)
+
+    def fan_out(self, fn):
+        """Corre `fn(shard)` em todos os shards em paralelo. Devolve os resultados, pela ordem dos shards."""
+        def run(index):
+            shard = self.shards[index]
+            self._sync(index)
+            try:
+                return fn(shard)
+            finally:
+                shard.release()
+        return list(self._executor.map(run, range(len(self.shards))))
+
+    def release(self):
+        """Devolve as ligações da thread aos pools e termina o encaminhamento (fim do pedido)."""
+        self._local.shard = None
+        for db in self.databases:
+            db.release()
+
+    def close(self):
+        self._executor.shutdown()
+        for db in self.databases:
+            db.close()
+
+    def enable_group_commit(self, max_batch=None):
+        """Liga o group commit em cada shard (cada um com a sua thread de escrita)."""
+        return [shard.enable_group_commit(max_batch) for shard in self.shards]
+
+    @property
+    def on_query(self):
+        return self._on_query
+
+    @on_query.setter
+    def on_query(self, hook):
+        self._on_query = hook
+        for db in self.databases:
+            db.on_query = hook
+
+
+def use(db, user_id):
+    """Encaminha a thread para o shard do utilizador (sem efeito com uma base de dados única)."""
+    return db.using(user_id) if isinstance(db, ShardRouter) else nullcontext(db)
+
+
+# --- Divisão de um sales.db existente ---
+
+def _base_schema(conn):
+    rows = dict(conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'table' "
+        f"AND name IN ({', '.join('?' for _ in BASE_TABLES)})", BASE_TABLES,
+    ).fetchall())
+    missing = [table for table in BASE_TABLES if table not in rows]
+    if missing:
+        raise ShardingError(f"Faltam as tabelas base: {', '.join(missing)}")
+    return rows
+
+
+def _autoincrement(sql):
+    """DDL de orders/posts/sales com AUTOINCREMENT (os ids dos shards partem de offsets diferentes)."""
+    for primary_key in ('PRIMARY KEY("id")', "PRIMARY KEY(id)", "PRIMARY KEY (id)"):
+        if primary_key in sql:
+            return sql.replace(primary_key, 'PRIMARY KEY("id" AUTOINCREMENT)', 1)
+    if "AUTOINCREMENT" not in sql.upper():
+        raise ShardingError(f"Chave primária não reconhecida: {sql}")
+    return sql
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _copy(conn, table, where, replace=False):
+    """Copia as linhas de src.`table` que satisfazem `where` (colunas pelo nome)."""
+    names = ", ".join(f'"{c}"' for c in _columns(conn, "main", table))
+    if replace:
+        conn.execute(f"DELETE FROM main.{table}")
+    return conn.execute(f"INSERT INTO main.{table} ({names}) SELECT {names} FROM src.{table} WHERE {where}").rowcount
+
+
+def _has_table(conn, schema, table):
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+                        (table,)).fetchone() is not None
+
+
+def _max_ids(conn):
+    """Maior id de orders/posts/sales na base de dados original (incluindo o arquivo)."""
+    result = {}
+    for table in DATA_TABLES:
+        sources = [table] + ([f"{table}_archive"] if _has_table(conn, "main", f"{table}_archive") else [])
+        result[table] = max(conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {name}").fetchone()[0]
+                            for name in sources)
+    return result
+
+
+def _fill_shard(conn, index, count, max_ids):
+    """Copia para o shard `index` os dados dos seus utilizadores (src = base de dados original)."""
+    mine = f"COALESCE(user_id, 0) % {count} = {index}"
+    _copy(conn, "sales", mine)
+    # Encomendas sem linha em `sales` ficam no shard 0.
+    orphans = " OR id NOT IN (SELECT order_id FROM src.sales WHERE order_id IS NOT NULL)" if index == 0 else ""
+    _copy(conn, "orders", f"id IN (SELECT order_id FROM main.sales){orphans}")
+    _copy(conn, "posts", "order_id IN (SELECT id FROM main.orders)")
+    for table in LOOKUP_TABLES:
+        _copy(conn, table, f"id % {count} = {index}" if table == "users" else "1")
+    for table, seq in max_ids.items():
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, max(seq, index * ID_STRIDE)))
+
+
+def _fill_read_models(conn, index, count):
+    """Depois das migrações: modelos de leitura, arquivo e histórico de interações do shard."""
+    mine = f"COALESCE(user_id, 0) % {count} = {index}"
+    for table in ("user_metrics", "monthly_rollups", "archived_metrics", "archived_rollups",
+                  "sale_stats", "sale_days"):
+        if _has_table(conn, "src", table):
+            _copy(conn, table, mine, replace=True)
+    if _has_table(conn, "src", "sales_archive"):
+        _copy(conn, "sales_archive", mine)
+        _copy(conn, "orders_archive", "id IN (SELECT order_id FROM main.sales_archive)")
+        _copy(conn, "posts_archive", "order_id IN (SELECT id FROM main.orders_archive)")
+    if _has_table(conn, "src", "engagement_history"):
+        _copy(conn, "engagement_history",
+              "post_id IN (SELECT id FROM main.posts UNION ALL SELECT id FROM main.posts_archive)")
+
+
+def _attached(path, source):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("ATTACH DATABASE ? AS src", (source,))
+    return conn
+
+
+def split(source, directory, count, echo=print):
+    """
+    Divide `source` (um sales.db) em `count` shards e num catálogo, em `directory`.
+    A base de dados original não é alterada (além das migrações pendentes). Devolve o manifesto.
+    """
+    if count < 1:
+        raise ShardingError("O número de shards tem de ser pelo menos 1")
+    if os.path.exists(os.path.join(directory, MANIFEST)):
+        raise ShardingError(f"{directory} já tem shards ({MANIFEST})")
+    os.makedirs(directory, exist_ok=True)
+    migrations.migrate(source)
+
+    conn = sqlite3.connect(source)
+    try:
+        schema = _base_schema(conn)
+        max_ids = _max_ids(conn)
+        total = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+    finally:
+        conn.close()
+    if max(max_ids.values()) >= ID_STRIDE:
+        raise ShardingError(f"Ids acima de {ID_STRIDE}: não cabem no intervalo do shard 0")
+
+    manifest = {"catalog": CATALOG_FILE, "shards": [SHARD_FILE.format(k) for k in range(count)],
+                "id_stride": ID_STRIDE}
+
+    # Catálogo: todas as tabelas base (orders/posts/sales vazias) e as lookups completas.
+    conn = _attached(os.path.join(directory, CATALOG_FILE), source)
+    try:
+        conn.execute("BEGIN")
+        for table in BASE_TABLES:
+            conn.execute(schema[table])
+        for table in LOOKUP_TABLES:
+            _copy(conn, table, "1")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    migrations.migrate(os.path.join(directory, CATALOG_FILE))
+
+    copied = 0
+    for index, name in enumerate(manifest["shards"]):
+        path = os.path.join(directory, name)
+        conn = _attached(path, source)
+        try:
+            conn.execute("BEGIN")
+            for table in BASE_TABLES:
+                conn.execute(_autoincrement(schema[table]) if table in DATA_TABLES else schema[table])
+            _fill_shard(conn, index, count, max_ids)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        # Índices, modelos de leitura (os rollups e a pesquisa são calculados dos dados copiados)...
+        migrations.migrate(path)
+        conn = _attached(path, source)
+        try:
+            conn.execute("BEGIN")
+            _fill_read_models(conn, index, count)
+            conn.execute("COMMIT")
+            sales = conn.execute("SELECT COUNT(*) FROM main.sales").fetchone()[0]
+            users = conn.execute("SELECT COUNT(*) FROM main.users").fetchone()[0]
+        finally:
+            conn.close()
+        copied += sales
+        echo(f"{name}: {users} utilizador(es), {sales} venda(s)")
+
+    if copied < total:
+        raise ShardingError(f"Só {copied} de {total} vendas foram copiadas")
+
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+@click.group()
+def cli():
+    """Ferramentas do modo particionado (SALES_SHARD_DIR)."""
+
+
+@cli.command("split")
+@click.argument("source")
+@click.argument("directory")
+@click.option("--shards", "count", default=8, show_default=True,
+              help="Número de shards (utilizadores distribuídos por user_id % N).")
+def split_command(source, directory, count):
+    """Divide SOURCE (um sales.db) num catálogo e em shards por utilizador em DIRECTORY."""
+    try:
+        manifest = split(source, directory, count, echo=click.echo)
+    except ShardingError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{len(manifest['shards'])} shard(s) em {directory}. Arranque com SALES_SHARD_DIR={directory}.")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,205 @@
+"""
+Gerador de dados sintéticos para testes de desempenho.
+
+Cria um `sales.db` novo com utilizadores, tabelas de lookup, encomendas, vendas e posts a
+uma escala configurável (ex.: 1k utilizadores e 1M encomendas). O gerador é determinístico
+para a mesma semente. A distribuição aproxima o uso real: poucos utilizadores concentram
+a maioria das encomendas, a maior parte dos artigos acaba vendida, e o stock e as
+encomendas a caminho concentram-se nos meses mais recentes.
+
+    python synthetic.py bench.db --users 1000 --orders 1000000 --seed 42
+"""
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+import click
+
+import database
+import migrations
+import read_models
+
+CHUNK_SIZE = 50_000
+
+# Tabelas base (anteriores às migrações): o esquema é copiado de uma base de dados existente.
+BASE_TABLES = ("users", "products", "brands", "sizes", "colors", "orders", "posts", "sales")
+
+PRODUCTS = (
+    "Casaco", "Blusão", "Camisola", "Sweatshirt", "Hoodie", "T-shirt", "Polo", "Camisa",
+    "Calças", "Jeans", "Calções", "Saia", "Vestido", "Ténis", "Botas", "Sapatos", "Sandálias",
+    "Mochila", "Mala", "Boné", "Gorro", "Cachecol", "Cinto", "Óculos", "Relógio", "Fato de treino",
+    "Colete", "Parka", "Corta-vento", "Macacão",
+)
+BRANDS = (
+    "Nike", "Adidas", "Puma", "New Balance", "Reebok", "Asics", "Vans", "Converse", "Levi's",
+    "Zara", "Mango", "Tommy Hilfiger", "Ralph Lauren", "Lacoste", "The North Face", "Patagonia",
+    "Carhartt", "Stüssy", "Supreme", "Salomon", "Columbia", "Guess", "Diesel", "Fila", "Kappa",
+)
+SIZES = (
+    "XS", "S", "M", "L", "XL", "XXL", "36", "37", "38", "39", "40", "41", "42", "43", "44", "45",
+    "28", "30", "32", "34", "Único",
+)
+COLORS = (
+    "Preto", "Branco", "Cinzento", "Azul", "Azul Marinho", "Vermelho", "Verde", "Amarelo",
+    "Laranja", "Rosa", "Roxo", "Castanho", "Bege", "Multicolor", "Caqui",
+)
+
+# Probabilidades (por encomenda entregue) de ter post e de o post já ter sido vendido
+POST_RATE = 0.85
+SOLD_RATE = 0.80
+
+
+def _base_schema(source):
+    conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'table' "
+            f"AND name IN ({', '.join('?' for _ in BASE_TABLES)})",
+            BASE_TABLES,
+        ).fetchall()
+    finally:
+        conn.close()
+    schema = dict(rows)
+    missing = [table for table in BASE_TABLES if table not in schema]
+    if missing:
+        raise click.ClickException(f"{source} não tem as tabelas: {', '.join(missing)}")
+    return [schema[table] for table in BASE_TABLES]
+
+
+def _user_weights(rng, users):
+    # Cauda longa: alguns utilizadores com milhares de encomendas, a maioria com poucas.
+    return [rng.paretovariate(1.2) for _ in range(users)]
+
+
+def _item(rng, order_id, post_id, user_id, today, span_days, counts):
+    """Gera uma encomenda (e eventualmente o post). Devolve (order, post ou None, sale)."""
+    # Mais encomendas recentes do que antigas (o negócio cresce com o tempo).
+    age = int(span_days * (1 - rng.random() ** 0.6))
+    order_date = today - timedelta(days=age)
+    price = round(rng.uniform(4, 90), 2)
+    deliver_tax = rng.choice((0, 0, 2.5, 3.49, 3.99, 4.5, 5.99))
+    delivery_date = order_date + timedelta(days=rng.randint(2, 21))
+
+    order = (
+        order_id, rng.randrange(1, counts["products"] + 1), rng.randrange(1, counts["colors"] + 1),
+        rng.randrange(1, counts["brands"] + 1), rng.randrange(1, counts["sizes"] + 1),
+        price, deliver_tax, order_date.isoformat(),
+        delivery_date.isoformat() if delivery_date <= today else None,
+    )
+    if delivery_date > today:
+        return order, None, (order_id, None, user_id, "shipping")
+    if rng.random() > POST_RATE:
+        return order, None, (order_id, None, user_id, "stock")
+
+    post_date = delivery_date + timedelta(days=rng.randint(0, 10))
+    if post_date > today:
+        return order, None, (order_id, None, user_id, "stock")
+    first_price = round(price * rng.uniform(1.3, 3.0))
+    ad_tax = round(rng.uniform(0.5, 4), 2) if rng.random() < 0.3 else 0
+    sell_date = post_date + timedelta(days=max(1, int(rng.expovariate(1 / 25))))
+    sold = rng.random() < SOLD_RATE and sell_date <= today
+    sell_price = round(first_price * rng.uniform(0.7, 1.0)) if sold else None
+
+    views = int(rng.expovariate(1 / 120))
+    post = (
+        post_id, post_date.isoformat(), sell_date.isoformat() if sold else None,
+        int(views * rng.uniform(0, 0.15)), views, rng.randint(0, 4), ad_tax,
+        first_price, sell_price, order_id,
+    )
+    return order, post, (order_id, post_id, user_id, "sold" if sold else "stock")
+
+
+def generate(path, users=1000, orders=1_000_000, seed=42, years=3, schema_from="sales.db",
+             today=None, build_metrics=True, echo=None):
+    """
+    Cria `path` (que não pode existir) e preenche-o com dados sintéticos.
+    Devolve {tabela: número de linhas}.
+    """
+    if os.path.exists(path):
+        raise click.ClickException(f"{path} já existe.")
+    echo = echo or (lambda message: None)
+    rng = random.Random(seed)
+    today = today or date.today()
+    span_days = 365 * years
+
+    conn = sqlite3.connect(path)
+    for statement in _base_schema(schema_from):
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+    db = database.Database(path)
+    lookups = {"products": PRODUCTS, "brands": BRANDS, "sizes": SIZES, "colors": COLORS}
+    with db.transaction():
+        db.executemany("INSERT INTO users (id, name) VALUES (?, ?)",
+                       ((i, f"Utilizador {i}") for i in range(1, users + 1)))
+        for table, names in lookups.items():
+            db.executemany(f"INSERT INTO {table} (name) VALUES (?)", ((name,) for name in names))
+    counts = {table: len(names) for table, names in lookups.items()}
+
+    # Atribuição das encomendas aos utilizadores, com garantia de pelo menos uma cada.
+    owners = list(range(1, min(users, orders) + 1))
+    owners += rng.choices(range(1, users + 1), weights=_user_weights(rng, users), k=orders - len(owners))
+    rng.shuffle(owners)
+
+    post_id = 0
+    totals = {"orders": 0, "posts": 0, "sales": 0}
+    for start in range(0, orders, CHUNK_SIZE):
+        batch_orders, batch_posts, batch_sales = [], [], []
+        for offset, user_id in enumerate(owners[start:start + CHUNK_SIZE]):
+            order, post, sale = _item(rng, start + offset + 1, post_id + 1, user_id, today, span_days, counts)
+            batch_orders.append(order)
+            if post:
+                post_id += 1
+                batch_posts.append(post)
+            batch_sales.append(sale)
+
+        with db.transaction():
+            db.executemany("""
+                INSERT INTO orders (id, product_id, color_id, brand_id, size_id, price, deliver_tax, order_date, delivery_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch_orders)
+            db.executemany("""
+                INSERT INTO posts (id, post_date, sell_date, likes, views, offers, ad_tax, first_price, sell_price, order_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch_posts)
+            db.executemany("INSERT INTO sales (order_id, post_id, user_id, status) VALUES (?, ?, ?, ?)", batch_sales)
+        totals["orders"] += len(batch_orders)
+        totals["posts"] += len(batch_posts)
+        totals["sales"] += len(batch_sales)
+        echo(f"{totals['orders']}/{orders} encomendas")
+    db.close()
+
+    # Índices, triggers e tabelas derivadas são criados depois da carga (mais rápido).
+    migrations.migrate(path)
+    if build_metrics:
+        echo("A calcular user_metrics...")
+        db = database.Database(path)
+        with db.transaction():
+            read_models.rebuild_all(db)
+        db.close()
+
+    totals["users"] = users
+    totals.update(counts)
+    return totals
+
+
+@click.command()
+@click.argument("path")
+@click.option("--users", default=1000, show_default=True, help="Número de utilizadores.")
+@click.option("--orders", default=1_000_000, show_default=True, help="Número de encomendas.")
+@click.option("--seed", default=42, show_default=True, help="Semente do gerador aleatório.")
+@click.option("--years", default=3, show_default=True, help="Anos de histórico.")
+@click.option("--schema-from", default="sales.db", show_default=True,
+              help="Base de dados de onde copiar o esquema das tabelas base.")
+@click.option("--no-metrics", is_flag=True, help="Não pré-calcular user_metrics (fica para o primeiro acesso).")
+def main(path, users, orders, seed, years, schema_from, no_metrics):
+    """Cria PATH com dados sintéticos para testes de desempenho."""
+    totals = generate(path, users, orders, seed, years, schema_from,
+                      build_metrics=not no_metrics, echo=click.echo)
+    click.echo(", ".join(f"{table}: {count}" for table, count in totals.items()))
+
+
+if __name__ == "__main__":
+    main()
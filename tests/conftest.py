@@ -0,0 +1,26 @@
+"""
+Configuração dos testes: os módulos da app vêm da raiz do repositório e a app corre sobre
+uma base de dados sintética temporária (SALES_DB), criada antes de qualquer `import app`.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+
+_TMP = tempfile.mkdtemp(prefix="sales-tests-")
+os.environ["SALES_DB"] = os.path.join(_TMP, "sales.db")
+os.environ.pop("SALES_SHARD_DIR", None)
+os.environ["SALES_ENGAGEMENT_WINDOW"] = "0"
+
+synthetic.generate(os.environ["SALES_DB"], users=5, orders=500, seed=7,
+                   schema_from=os.path.join(ROOT, "sales.db"), today=date(2026, 1, 1))
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_TMP, ignore_errors=True)
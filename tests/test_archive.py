@@ -0,0 +1,49 @@
+"""Arquivo das vendas antigas: os ids arquivados nunca voltam a ser usados."""
+import app as sales_app
+import archive
+import importer
+
+ORDER = {"user_id": 1, "product_id": 1, "brand_id": 1, "size_id": 1, "color_id": 1, "price": 10}
+
+
+def _ids(db, table):
+    return {row["id"] for row in db.execute(f"SELECT id FROM {table}")}
+
+
+def test_archiving_the_max_id_does_not_free_it():
+    db = sales_app.db
+    client = sales_app.app.test_client()
+
+    # Venda antiga com os maiores ids de orders, posts e sales
+    client.post("/add_order", data=dict(ORDER, order_date="2000-01-01", delivery_date="2000-01-02"))
+    order_id = db.execute("SELECT MAX(id) AS id FROM orders")[0]["id"]
+    client.post("/add_post", data={"user_id": 1, "order_id": order_id, "first_price": 20,
+                                   "post_date": "2000-01-03", "sell_date": "2000-01-10", "sell_price": 30})
+    post_id = db.execute("SELECT MAX(id) AS id FROM posts")[0]["id"]
+    sale_id = db.execute("SELECT id FROM sales WHERE order_id = ?", order_id)[0]["id"]
+    assert db.execute("SELECT status FROM sales WHERE id = ?", sale_id)[0]["status"] == "sold"
+
+    assert archive.archive_sold(db, "2001-01-01") == 1
+    assert order_id in _ids(db, "orders_archive")
+    assert order_id not in _ids(db, "orders")
+
+    client.post("/add_order", data=dict(ORDER, order_date="2026-01-01", delivery_date="2026-01-02"))
+    new_order = db.execute("SELECT MAX(id) AS id FROM orders")[0]["id"]
+    client.post("/add_post", data={"user_id": 1, "order_id": new_order, "first_price": 20,
+                                   "post_date": "2026-01-03"})
+
+    assert new_order > order_id
+    assert db.execute("SELECT MAX(id) AS id FROM posts")[0]["id"] > post_id
+    assert db.execute("SELECT id FROM sales WHERE order_id = ?", new_order)[0]["id"] > sale_id
+    for table in archive.ARCHIVED_TABLES:
+        assert not _ids(db, table) & _ids(db, f"{table}_archive")
+
+    # A importação também reserva ids acima dos arquivados.
+    assert importer._next_id(db, "orders") > order_id
+    assert importer._next_id(db, "posts") > post_id
+
+    # No histórico completo cada encomenda tem uma única linha.
+    rows = db.execute(archive.full_history(
+        "SELECT orders.id FROM orders JOIN sales ON sales.order_id = orders.id"))
+    assert len(rows) == len({row["id"] for row in rows})
+    db.release()
@@ -0,0 +1,125 @@
+"""Group commit: escritas agrupadas, SAVEPOINT por escrita e consultas atribuídas a quem escreveu."""
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import database
+import instrumentation
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = database.Database(str(tmp_path / "group.db"))
+    db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    db.enable_group_commit()
+    yield db
+    db.close()
+
+
+def _names(db):
+    return sorted(row["name"] for row in db.execute("SELECT name FROM items"))
+
+
+def _insert(name, fail=False):
+    def fn(db):
+        row_id = db.execute("INSERT INTO items (name) VALUES (?)", name)
+        if fail:
+            raise ValueError(f"falhou {name}")
+        return row_id
+    return fn
+
+
+def _wait_queued(db, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while db.group_commit._queue.qsize() < count:
+        assert time.monotonic() < deadline, "as escritas não chegaram à fila"
+        time.sleep(0.001)
+
+
+def _submit_while_blocked(db, jobs):
+    """Submete `jobs` ({nome: fn}) enquanto a thread de escrita está ocupada: ficam no mesmo grupo."""
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(db):
+        started.set()
+        release.wait(5)
+        return db.execute("INSERT INTO items (name) VALUES ('blocker')")
+
+    outcomes = {}
+
+    def submit(name, fn):
+        try:
+            outcomes[name] = ("ok", db.write(fn))
+        except Exception as e:
+            outcomes[name] = ("error", e)
+        finally:
+            db.release()
+
+    threads = [threading.Thread(target=submit, args=("blocker", blocker))]
+    threads[0].start()
+    assert started.wait(5)
+    for name, fn in jobs.items():
+        thread = threading.Thread(target=submit, args=(name, fn))
+        thread.start()
+        threads.append(thread)
+    _wait_queued(db, len(jobs))
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_writes_share_one_commit(db):
+    outcomes = _submit_while_blocked(db, {"a": _insert("a"), "b": _insert("b")})
+
+    assert outcomes["a"][0] == outcomes["b"][0] == "ok"
+    assert _names(db) == ["a", "b", "blocker"]
+    # Um COMMIT para a escrita que bloqueou a thread e outro para as duas que esperaram.
+    assert db.group_commit.stats == {"writes": 3, "commits": 2, "failed": 0}
+
+
+def test_failed_write_only_rolls_back_its_savepoint(db):
+    outcomes = _submit_while_blocked(db, {"good": _insert("good"), "bad": _insert("bad", fail=True)})
+
+    assert outcomes["good"][0] == "ok"
+    status, error = outcomes["bad"]
+    assert status == "error"
+    assert isinstance(error, ValueError) and str(error) == "falhou bad"
+    assert _names(db) == ["blocker", "good"]
+    assert db.group_commit.stats["commits"] == 2
+    assert db.group_commit.stats["failed"] == 1
+
+
+def test_exception_reaches_the_caller(db):
+    with pytest.raises(ValueError, match="falhou x"):
+        db.write(_insert("x", fail=True))
+    assert db.write(_insert("y")) is not None
+    assert _names(db) == ["y"]
+
+
+def test_queries_are_recorded_on_the_submitting_thread(db):
+    recorded = []
+    db.on_query = lambda sql, elapsed: recorded.append((threading.get_ident(), sql))
+    db.write(_insert("z"))
+    assert recorded == [(threading.get_ident(), "INSERT INTO items (name) VALUES (?)")]
+
+
+def test_write_queries_count_toward_the_request(db):
+    app = Flask(__name__)
+    instruments = instrumentation.init_app(app, db, enabled=True)
+
+    @app.route("/write", methods=["POST"])
+    def write():
+        def fn(db):
+            db.execute("INSERT INTO items (name) VALUES ('r')")
+            db.execute("UPDATE items SET name = 'r2' WHERE name = 'r'")
+        db.write(fn)
+        db.execute("SELECT COUNT(*) FROM items")
+        return "ok"
+
+    client = app.test_client()
+    client.post("/write")
+    client.post("/write")
+    assert instruments.request_queries["write"] == [6, 2]
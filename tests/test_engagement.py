@@ -0,0 +1,139 @@
+"""Contadores de interação: coalescência por post, escrita em lote, reenvio após falha e compactação."""
+import os
+from datetime import date
+
+import pytest
+
+import app as sales_app
+import database
+import engagement
+import synthetic
+from conftest import ROOT
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "engagement.db")
+    synthetic.generate(path, users=2, orders=40, seed=9, schema_from=os.path.join(ROOT, "sales.db"),
+                       today=date(2026, 1, 1))
+    db = database.Database(path)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def posts(db):
+    ids = [row["id"] for row in db.execute("SELECT id FROM posts ORDER BY id LIMIT 3")]
+    db.execute("UPDATE posts SET views = 10, likes = 5, offers = NULL WHERE id IN (?, ?, ?)", *ids)
+    db.execute("DELETE FROM engagement_history WHERE post_id IN (?, ?, ?)", *ids)
+    return ids
+
+
+def _counters(db, post_id):
+    row = db.execute("SELECT views, likes, offers FROM posts WHERE id = ?", post_id)[0]
+    return row["views"], row["likes"], row["offers"]
+
+
+def _history(db, post_id):
+    return [tuple(row[c] for c in engagement.COUNTERS) for row in engagement.history(db, post_id)]
+
+
+def test_parse_updates():
+    assert engagement.parse_updates({"mode": "set", "updates": [
+        {"post_id": 1, "views": 3, "likes": None}, {"post_id": 2, "mode": "delta", "offers": -1},
+        {"post_id": 3},
+    ]}) == [(1, "set", {"views": 3}), (2, "delta", {"offers": -1})]
+    for payload in (None, {"updates": {}}, {"mode": "x", "updates": []},
+                    {"updates": [{"post_id": "1", "views": 1}]},
+                    {"updates": [{"post_id": 1, "views": True}]},
+                    {"mode": "set", "updates": [{"post_id": 1, "views": -1}]}):
+        with pytest.raises(ValueError):
+            engagement.parse_updates(payload)
+
+
+def test_updates_are_coalesced_into_one_write(db, posts):
+    first, second, third = posts
+    flushed = []
+    buffer = engagement.EngagementBuffer(db, window=3600, on_flush=flushed.append)
+    try:
+        buffer.add([(first, "delta", {"views": 1}), (second, "set", {"views": 100})])
+        buffer.add([(first, "delta", {"views": 2, "likes": -10}), (second, "delta", {"views": 5})])
+        buffer.add([(third, "delta", {"offers": 2}), (third, "set", {"offers": 7}),
+                    (third, "delta", {"offers": 1})])
+        assert buffer.pending() == 3
+        assert _counters(db, first) == (10, 5, None)
+
+        assert buffer.flush() == 3
+    finally:
+        buffer.close()
+
+    assert _counters(db, first) == (13, 0, None)      # incrementos somados, nunca negativos
+    assert _counters(db, second) == (105, 5, None)    # valor absoluto mais os incrementos seguintes
+    assert _counters(db, third) == (10, 5, 8)
+    assert buffer.stats == {"received": 7, "coalesced": 4, "flushes": 1, "written": 3, "failed": 0}
+    # Uma única amostra de histórico por post e por escrita.
+    assert [_history(db, post_id) for post_id in posts] == [
+        [(13, 0, None)], [(105, 5, None)], [(10, 5, 8)]]
+    owners = {row["user_id"] for row in db.execute(
+        "SELECT user_id FROM sales WHERE post_id IN (?, ?, ?)", *posts)}
+    assert len(flushed) == 1 and set(flushed[0]) == owners
+
+
+class FailingOnce:
+    """Base de dados cuja primeira escrita falha (como um shard indisponível)."""
+
+    def __init__(self, db):
+        self.db = db
+        self.failed = False
+
+    def fan_out(self, fn):
+        return [fn(self)]
+
+    def write(self, fn):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("disco cheio")
+        return self.db.write(fn)
+
+
+def test_failed_write_keeps_the_updates_pending(db, posts):
+    post_id = posts[0]
+    buffer = engagement.EngagementBuffer(FailingOnce(db), window=0)
+    with pytest.raises(RuntimeError):
+        buffer.add([(post_id, "delta", {"views": 4})])
+    assert buffer.pending() == 1 and buffer.stats["failed"] == 1
+    assert _counters(db, post_id) == (10, 5, None)
+
+    buffer.add([(post_id, "delta", {"views": 1})])
+    assert buffer.pending() == 0
+    assert _counters(db, post_id) == (15, 5, None)    # cada incremento aplicado uma só vez
+
+
+def test_compact_keeps_the_last_sample_of_each_day(db, posts):
+    post_id = posts[0]
+    db.execute("DELETE FROM engagement_history WHERE post_id = ?", post_id)
+    samples = ["2025-01-01 08:00:00", "2025-01-01 12:00:00", "2025-01-01 23:59:59",
+               "2025-01-02 09:00:00", "2025-01-03 10:00:00", "2025-01-03 11:00:00"]
+    db.executemany("INSERT INTO engagement_history (post_id, recorded_at, views, likes, offers) "
+                   "VALUES (?, ?, ?, 0, 0)", [(post_id, at, i) for i, at in enumerate(samples)])
+
+    assert engagement.compact(db, "2025-01-03") == 2
+    kept = [row["recorded_at"] for row in engagement.history(db, post_id)]
+    assert kept == ["2025-01-01 23:59:59", "2025-01-02 09:00:00",
+                    "2025-01-03 10:00:00", "2025-01-03 11:00:00"]
+    assert engagement.compact(db, "2025-01-03") == 0
+
+
+def test_api_applies_the_counters():
+    client = sales_app.app.test_client()
+    db = sales_app.db
+    post_id = db.execute("SELECT MIN(id) AS id FROM posts")[0]["id"]
+    db.execute("UPDATE posts SET views = 1 WHERE id = ?", post_id)
+
+    assert client.post("/api/engagement", json={"updates": "x"}).status_code == 400
+    response = client.post("/api/engagement?flush=1", json={"mode": "set", "updates": [
+        {"post_id": post_id, "views": 40}, {"post_id": post_id, "mode": "delta", "views": 2}]})
+    assert response.status_code == 202
+    assert response.get_json() == {"accepted": 2, "pending": 0}
+    assert db.execute("SELECT views FROM posts WHERE id = ?", post_id)[0]["views"] == 42
+    db.release()
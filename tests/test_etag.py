@@ -0,0 +1,79 @@
+"""Pedidos condicionais da API: ETag por versão dos dados, 304 e mudanças de versão."""
+from datetime import date, timedelta
+
+import pytest
+
+import app as sales_app
+
+USER_ID, OTHER_USER = 3, 4
+ORDER = {"user_id": USER_ID, "product_id": 1, "brand_id": 1, "size_id": 1, "color_id": 1,
+         "price": 10, "order_date": "2025-05-01"}
+
+
+@pytest.fixture
+def client():
+    yield sales_app.app.test_client()
+    sales_app.db.release()
+
+
+def _etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    return response.headers["ETag"]
+
+
+def _status(client, path, etag):
+    return client.get(path, headers={"If-None-Match": etag}).status_code
+
+
+def test_matching_etag_returns_304_without_building(client, monkeypatch):
+    path = f"/api/users/{USER_ID}/orders"
+    etag = _etag(client, path)
+    assert etag == _etag(client, path)
+
+    def fail(*args):
+        raise AssertionError("a página não devia ser lida")
+
+    monkeypatch.setattr(sales_app, "get_table_page", fail)
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_etag_depends_on_the_request(client):
+    orders = _etag(client, f"/api/users/{USER_ID}/orders")
+    assert _etag(client, f"/api/users/{USER_ID}/orders?sort=price") != orders
+    assert _etag(client, f"/api/users/{USER_ID}/posts") != orders
+    assert _status(client, f"/api/users/{USER_ID}/posts", orders) == 200
+    assert client.get("/api/users/999/orders").status_code == 404
+
+
+def test_write_bumps_only_the_writers_version(client):
+    mine, theirs = f"/api/users/{USER_ID}/metrics", f"/api/users/{OTHER_USER}/metrics"
+    etag, other = _etag(client, mine), _etag(client, theirs)
+
+    client.post("/add_order", data=ORDER)
+    assert _status(client, mine, etag) == 200
+    assert _etag(client, mine) != etag
+    assert _status(client, theirs, other) == 304
+
+
+def test_lookup_change_bumps_every_version(client):
+    paths = [f"/api/users/{user_id}/orders" for user_id in (USER_ID, OTHER_USER)]
+    etags = [_etag(client, path) for path in paths]
+    sales_app.db.execute("INSERT INTO colors (name) VALUES ('Cor de teste ETag')")
+    assert [_status(client, path, etag) for path, etag in zip(paths, etags)] == [200, 200]
+
+
+def test_new_day_changes_the_version(client, monkeypatch):
+    path = f"/api/users/{USER_ID}/orders"
+    etag = _etag(client, path)
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    monkeypatch.setattr(sales_app, "date", Tomorrow)
+    assert _status(client, path, etag) == 200
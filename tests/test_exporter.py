@@ -0,0 +1,84 @@
+"""Exportação: o CSV exportado volta a importar-se sem perder nada (ida e volta)."""
+import csv
+import io
+import json
+import os
+from datetime import date
+
+import pytest
+
+import archive
+import database
+import exporter
+import importer
+import synthetic
+from conftest import ROOT
+
+SOURCE = """product,brand,size,color,price,deliver_tax,order_date,delivery_date,first_price,sell_price,ad_tax,post_date,sell_date,views,likes,offers
+Casaco,Nike,M,Preto,10,1.5,2025-01-01,,,,,,,,,
+Calças,Levi's,"42, largo",Azul,20.25,,2025-02-01,2025-02-03,,,,,,,,
+Sapatilhas,Adidas,43,Branco,30,2,2025-03-01,2025-03-04,45,,0.5,2025-03-05,,7,3,1
+Camisola,Zara,S,Verde,8,0,2025-04-01,2025-04-02,15,14.5,1,2025-04-03,2025-04-20,12,4,2
+"""
+IMPORT_COLUMNS = SOURCE.splitlines()[0].split(",")
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "export.db")
+    synthetic.generate(path, users=3, orders=10, seed=5, schema_from=os.path.join(ROOT, "sales.db"),
+                       today=date(2026, 1, 1))
+    db = database.Database(path)
+    db.executemany("INSERT INTO users (id, name) VALUES (?, ?)", [(4, "Origem"), (5, "Destino")])
+    yield db
+    db.close()
+
+
+def _export(db, kind, user_id, fmt="csv"):
+    return "".join(exporter.stream(db, kind, user_id, fmt))
+
+
+def _as_import_csv(db, user_id):
+    """CSV de importação feito das exportações de encomendas e posts do utilizador."""
+    posts = {row["order_id"]: row for row in csv.DictReader(io.StringIO(_export(db, "posts", user_id)))}
+    out = io.StringIO()
+    writer = csv.DictWriter(out, IMPORT_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for order in csv.DictReader(io.StringIO(_export(db, "orders", user_id))):
+        writer.writerow(dict(order, **posts.get(order["order_id"], {})))
+    return out.getvalue()
+
+
+def _without_ids(text, ids=("order_id", "post_id")):
+    return [{k: v for k, v in row.items() if k not in ids} for row in csv.DictReader(io.StringIO(text))]
+
+
+def test_export_round_trip(db):
+    report = importer.import_csv(db, io.StringIO(SOURCE), 4)
+    assert (report["orders"], report["posts"], report["errors"]) == (4, 2, [])
+
+    report = importer.import_csv(db, io.StringIO(_as_import_csv(db, 4)), 5)
+    assert (report["orders"], report["posts"], report["errors"]) == (4, 2, [])
+
+    for kind in exporter.EXPORTS:
+        original, copy = _export(db, kind, 4), _export(db, kind, 5)
+        assert _without_ids(copy) == _without_ids(original), kind
+    orders = _without_ids(_export(db, "orders", 5))
+    assert [row["status"] for row in orders] == ["shipping", "stock", "stock", "sold"]
+    assert orders[1]["size"] == "42, largo"
+
+    ledger = json.loads(_export(db, "sales", 5, "jsonl"))
+    assert (ledger["sell_price"], ledger["profit"], ledger["days_to_sale"], ledger["days_total"]) == (
+        14.5, 5.5, 17, 19)
+
+
+def test_export_date_filter_and_archive(db):
+    importer.import_csv(db, io.StringIO(SOURCE), 4)
+    rows = list(exporter.iter_rows(db, "orders", 4, date_from="2025-02-01", date_to="2025-03-31"))
+    assert [row["order_date"] for row in rows] == ["2025-02-01", "2025-03-01"]
+    assert list(exporter.iter_rows(db, "orders", 5)) == []
+
+    # As vendas arquivadas continuam na exportação (histórico completo), salvo se pedido o contrário.
+    assert archive.archive_sold(db, "2025-12-31") >= 1
+    assert [row["sell_date"] for row in exporter.iter_rows(db, "sales", 4)] == ["2025-04-20"]
+    assert list(exporter.iter_rows(db, "sales", 4, include_archive=False)) == []
@@ -0,0 +1,56 @@
+"""Respostas X-Fragments das rotas de escrita: só as secções alteradas e as mensagens, em JSON."""
+import re
+
+import pytest
+
+import app as sales_app
+
+USER_ID = 5
+ORDER = {"user_id": USER_ID, "product_id": 1, "brand_id": 1, "size_id": 1, "color_id": 1,
+         "price": 12, "order_date": "2026-06-01", "delivery_date": "2026-06-02"}
+HEADERS = {"X-Fragments": "1"}
+
+
+@pytest.fixture
+def client():
+    yield sales_app.app.test_client()
+    sales_app.db.release()
+
+
+def _section(html, name):
+    match = re.search(rf'<(\w+)[^>]*data-fragment="{name}">.*?</\1>', html, re.S)
+    return match.group(0) if match else None
+
+
+def test_write_returns_the_changed_sections(client):
+    # O formulário envia a query string do dashboard (window.location.search).
+    query = f"?user_id={USER_ID}&orders_sort=price&orders_dir=asc"
+    response = client.post("/add_order" + query, data=ORDER, headers=HEADERS)
+    assert response.status_code == 200 and response.is_json
+    fragments = response.get_json()["fragments"]
+
+    assert set(fragments) == set(sales_app.ORDER_ADDED) | {"messages"}
+    assert "Encomenda adicionada com sucesso!" in fragments["messages"]
+    order_id = sales_app.db.execute("SELECT MAX(id) AS id FROM orders")[0]["id"]
+    assert f'<option value="{order_id}">' in fragments["open_orders"]
+    # Cada secção é a mesma que o dashboard mostra com o mesmo estado das tabelas.
+    page = client.get(f"/{query}").get_data(as_text=True)
+    for name in sales_app.ORDER_ADDED:
+        assert _section(fragments[name], name) == _section(page, name), name
+    # As mensagens já foram entregues no JSON: não ficam para o pedido seguinte nem criam sessão.
+    assert "Encomenda adicionada com sucesso!" not in page
+    assert client.get_cookie(sales_app.app.config["SESSION_COOKIE_NAME"]) is None
+
+
+def test_failed_write_returns_only_the_messages(client):
+    response = client.post("/add_order", data={"user_id": USER_ID}, headers=HEADERS)
+    fragments = response.get_json()["fragments"]
+    assert list(fragments) == ["messages"]
+    assert "alert-warning" in fragments["messages"]
+
+
+def test_without_the_header_writes_redirect(client):
+    response = client.post("/add_order", data=ORDER)
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith(f"/?user_id={USER_ID}")
+    client.get(response.headers["Location"])
@@ -0,0 +1,102 @@
+"""Datas: parse memoizado e 'hoje' fixado comparados com as funções originais (strptime a cada chamada)."""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app as sales_app
+import helpers
+
+TODAY = date(2026, 1, 1)
+
+
+def reference_days_diff(start_date_str, end_date_str=None, now=None):
+    """calculate_days_diff() original, com datetime.now() substituível por `now`."""
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+        if end_date_str:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+        else:
+            end_date = now or datetime.now()
+        return (end_date - start_date).days
+    except Exception:
+        return None
+
+
+def reference_format_date_pt(date_str):
+    """format_date_pt() original."""
+    if not date_str:
+        return None
+    try:
+        dt_obj = datetime.strptime(date_str, '%Y-%m-%d')
+        return dt_obj.strftime('%d/%m/%Y')
+    except Exception:
+        return date_str
+
+
+def _inputs(seed):
+    rng = random.Random(seed)
+    values = [None, "", "ontem", "2025-02-30", "2024-02-29", "2025-13-01", " 2025-01-01",
+              "2025-01-01 ", "2025-01-01T10:00", "2025/01/01", 20250101, date(2025, 1, 1)]
+    start = date(2020, 1, 1)
+    values += [(start + timedelta(days=rng.randint(0, 3000))).isoformat() for _ in range(40)]
+    return values
+
+
+# Únicas diferenças intencionais: sem zeros à esquerda a data é inválida (como date(x) = x no SQLite).
+UNPADDED = ["2025-1-5", "2025-01-5", "2025-1-05"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_days_diff_matches_original(seed):
+    values = _inputs(seed)
+    now = datetime.combine(TODAY, datetime.min.time()).replace(hour=15, minute=30)
+    rng = random.Random(seed)
+    for start in values:
+        for end in rng.sample(values, 10) + [None]:
+            expected = reference_days_diff(start, end, now)
+            assert helpers.calculate_days_diff(start, end, TODAY) == expected, (start, end)
+            assert helpers.calculate_days_diff(start, end, TODAY) == expected, (start, end)
+
+
+def test_format_date_pt_matches_original():
+    for value in _inputs(0) + ["", None]:
+        if isinstance(value, str) or value is None:
+            assert helpers.format_date_pt(value) == reference_format_date_pt(value), value
+
+
+def test_unpadded_dates_are_invalid():
+    for value in UNPADDED:
+        assert reference_days_diff(value, "2025-02-01") is not None
+        assert helpers.calculate_days_diff(value, "2025-02-01") is None
+        assert helpers.calculate_days_diff("2025-01-01", value) is None
+        assert helpers.format_date_pt(value) == value
+
+
+def test_default_today_is_the_current_date():
+    start = (date.today() - timedelta(days=12)).isoformat()
+    assert helpers.calculate_days_diff(start) == reference_days_diff(start) == 12
+
+
+def test_parsing_is_memoized():
+    helpers._parse_date.cache_clear()
+    for _ in range(3):
+        helpers.calculate_days_diff("2019-05-01", "2019-05-31")
+    info = helpers._parse_date.cache_info()
+    assert (info.misses, info.hits) == (2, 4)
+
+
+def test_today_is_fixed_per_request(monkeypatch):
+    days = iter(range(100))
+
+    class MovingDate(date):
+        @classmethod
+        def today(cls):
+            return TODAY + timedelta(days=next(days))
+
+    monkeypatch.setattr(sales_app, "date", MovingDate)
+    with sales_app.app.test_request_context("/"):
+        first = sales_app.request_today()
+        assert sales_app.request_today() == first
+    with sales_app.app.test_request_context("/"):
+        assert sales_app.request_today() > first
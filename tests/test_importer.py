@@ -0,0 +1,92 @@
+"""Importação CSV: validação linha a linha, lotes de BATCH_SIZE e reserva de ids."""
+import io
+import os
+from datetime import date
+
+import pytest
+
+import database
+import importer
+import synthetic
+from conftest import ROOT
+
+HEADER = ("product,brand,size,color,price,deliver_tax,order_date,delivery_date,"
+          "first_price,sell_price,ad_tax,post_date,sell_date,views,likes,offers\n")
+VALID = "Casaco,Nike,M,Preto,10,1,2025-01-01,2025-01-03,20,25,1,2025-01-04,2025-01-10,5,2,1\n"
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "import.db")
+    synthetic.generate(path, users=3, orders=10, seed=3, schema_from=os.path.join(ROOT, "sales.db"),
+                       today=date(2026, 1, 1))
+    db = database.Database(path)
+    yield db
+    db.close()
+
+
+def _import(db, body, user_id=2, **kwargs):
+    return importer.import_csv(db, io.StringIO(HEADER + body), user_id, **kwargs)
+
+
+def test_invalid_rows_are_reported_and_skipped(db):
+    before = db.execute("SELECT COUNT(*) AS n FROM sales WHERE user_id = 2")[0]["n"]
+    report = _import(db, "".join([
+        VALID,
+        "Casaco,Nike,M,Preto,,1,2025-01-01,,,,,,,,,\n",
+        "Casaco,Nike,M,Preto,dez,1,2025-01-01,,,,,,,,,\n",
+        "Casaco,Nike,M,Preto,10,1,2025-1-5,,,,,,,,,\n",
+        "Casaco,Nike,M,Preto,10,1,2025-01-01,,20,,,2025-01-04,,,,\n",
+        "Casaco,Nike,M,Preto,10,1,2025-01-01,2025-01-03,20,,,2025-01-04,2025-01-10,,,\n",
+        "Casaco,Nike,M,Preto,10,1,2025-01-01,2025-01-03,20,,,2025-01-04,,1.5,,\n",
+        "Casaco,Nike,M,Preto,10,1,2025-01-01,2025-01-03,,,,,,,,\n",
+    ]))
+
+    assert report["orders"] == 2 and report["posts"] == 1
+    assert report["errors"] == [
+        (3, "Todos os campos obrigatórios do pedido devem ser preenchidos."),
+        (4, "'price' não é um número: 'dez'"),
+        (5, "'order_date' não é uma data YYYY-MM-DD: '2025-1-5'"),
+        (6, "Não é possível criar um post. A encomenda ainda está 'shipping'."),
+        (7, "Se a Data da Venda for preenchida, o Preço Vendido também é obrigatório."),
+        (8, "'views' tem de ser inteiro: 1.5"),
+    ]
+    statuses = [row["status"] for row in db.execute(
+        "SELECT status FROM sales WHERE user_id = 2 ORDER BY id DESC LIMIT 2")]
+    assert statuses == ["stock", "sold"]
+    assert db.execute("SELECT COUNT(*) AS n FROM sales WHERE user_id = 2")[0]["n"] == before + 2
+
+
+def test_fatal_errors(db):
+    with pytest.raises(importer.CSVImportError):
+        importer.import_csv(db, io.StringIO("price,order_date\n10,2025-01-01\n"), 2)
+    with pytest.raises(importer.CSVImportError):
+        _import(db, VALID, user_id=99)
+
+
+def test_rows_are_written_in_batches(db, monkeypatch):
+    batches = []
+    write_batch = importer._write_batch
+
+    def record(db, user_id, items, *args):
+        batches.append(len(items))
+        return write_batch(db, user_id, items, *args)
+
+    monkeypatch.setattr(importer, "_write_batch", record)
+    rows = 2 * importer.BATCH_SIZE + 1
+    report = _import(db, VALID * rows)
+
+    assert batches == [importer.BATCH_SIZE, importer.BATCH_SIZE, 1]
+    assert (report["orders"], report["posts"], report["errors"]) == (rows, rows, [])
+
+
+def test_next_id_skips_reserved_sequence(db):
+    max_order = db.execute("SELECT MAX(id) AS id FROM orders")[0]["id"]
+    assert importer._next_id(db, "orders") == max_order + 1
+
+    # Ids já usados (ex.: linhas arquivadas ou apagadas) ficam no sqlite_sequence.
+    db.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'orders'", max_order + 100)
+    assert importer._next_id(db, "orders") == max_order + 101
+    _import(db, VALID * 2)
+    ids = [row["id"] for row in db.execute("SELECT id FROM orders WHERE id > ? ORDER BY id", max_order)]
+    assert ids == [max_order + 101, max_order + 102]
@@ -0,0 +1,45 @@
+"""Leaderboard (agregado SQL) e métricas em Python contam as mesmas vendas, incluindo datas não ISO."""
+import app as sales_app
+import read_models
+from helpers import calculate_days_diff
+
+USER_ID = 2
+# post_date/sell_date de cada venda: as datas sem zeros à esquerda não contam para os dias de venda.
+SOLD = [("2025-1-5", "2025-02-01"), ("2025-01-05", "2025-2-1"), ("2025-01-05", "2025-02-01")]
+
+
+def _add_sold(db, post_date, sell_date):
+    order_id = db.execute("""
+        INSERT INTO orders (product_id, brand_id, size_id, color_id, price, deliver_tax, order_date)
+        VALUES (1, 1, 1, 1, 10, 1, '2025-01-01')
+    """)
+    post_id = db.execute("""
+        INSERT INTO posts (order_id, post_date, first_price, sell_date, sell_price)
+        VALUES (?, ?, 30, ?, 25)
+    """, order_id, post_date, sell_date)
+    db.execute("INSERT INTO sales (order_id, user_id, post_id, status) VALUES (?, ?, ?, 'sold')",
+               order_id, USER_ID, post_id)
+
+
+def test_leaderboard_matches_python_metrics_with_unpadded_dates():
+    db = sales_app.db
+    with db.transaction():
+        for post_date, sell_date in SOLD:
+            _add_sold(db, post_date, sell_date)
+        read_models.rebuild_user(db, USER_ID)
+        read_models.rebuild_sale_stats(db, USER_ID)
+
+    assert calculate_days_diff("2025-1-5", "2025-02-01") is None
+    orders, posts, sales_data = sales_app.get_user_data(USER_ID, include_archive=True)
+    expected = sales_app.calculate_user_metrics_from_data(
+        orders, posts, sales_data, stats=read_models.load_sale_stats(db, USER_ID))
+    days = [p.days_to_sale for p in posts if p.status == "sold" and p.days_to_sale]
+
+    entry = next(u for u in sales_app.get_leaderboard()["users"] if u["user_id"] == USER_ID)
+    assert read_models.compare(expected, entry) == []
+    assert entry["tempo_venda_medio"] == sum(days) / len(days)
+    assert read_models.compare(expected, read_models.load_metrics(db, USER_ID)) == []
+
+    vector = read_models.totals_by_user(db)[USER_ID]
+    assert (vector["dias_venda_count"], vector["dias_venda_total"]) == (len(days), sum(days))
+    db.release()
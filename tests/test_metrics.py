@@ -0,0 +1,219 @@
+"""
+calculate_user_metrics_from_data() comparada com a implementação original (antes da
+passagem única): o dicionário tem de ser idêntico, incluindo os valores float e os tipos
+int/float, sobre dados aleatórios (semente fixa) com encomendas sem post ou com vários
+posts e datas em falta ou inválidas. As linhas são as de rows.py (como em get_user_data())
+e os mesmos dados em dicts.
+"""
+import random
+from datetime import date
+
+import pytest
+
+import app as sales_app
+import read_models
+import rows
+
+TODAY = date(2026, 1, 1)
+STATUSES = ("shipping", "stock", "sold", "sold", None, "cancelled")
+DATES = ("2025-03-01", "2025-06-15", "2025-12-31", "2024-02-29", None, "", "2025-02-30", "ontem")
+
+
+def reference_metrics(orders, posts, sales_data):
+    """Implementação original (procura linear do post de cada encomenda)."""
+
+    # 1. CÁLCULOS FINANCEIROS DE VENDAS CONCRETAS
+    faturacao = sum(item['sell_price'] for item in sales_data)
+    gastos_totais = sum(item['total_gastos'] for item in sales_data)
+    lucro_total = faturacao - gastos_totais
+
+    # Multiplicador (ROI)
+    multiplicador = 0.0
+    if gastos_totais > 0:
+        multiplicador = lucro_total / gastos_totais
+
+    # 2. CONTAGEM DE ENCOMENDAS
+    count_stock = sum(1 for o in orders if o['status'] == 'stock')
+    count_chegar = sum(1 for o in orders if o['status'] == 'shipping')
+    count_vendidas = len(sales_data)
+
+    # 3. CÁLCULO DE TEMPO DE STOCK (Projeção)
+    dias_fim_stock = 0
+    stock_atual = count_stock + count_chegar
+
+    if stock_atual > 0:
+        total_dias_venda = 0
+        valid_sales = 0
+
+        for p in posts:
+            if p['status'] == 'sold' and p.get('days_to_sale'):
+                total_dias_venda += p['days_to_sale']
+                valid_sales += 1
+
+        tempo_venda_medio = (total_dias_venda / valid_sales) if valid_sales > 0 else 60
+
+        if tempo_venda_medio > 0:
+            dias_fim_stock = stock_atual * tempo_venda_medio
+        else:
+            dias_fim_stock = 365
+
+    # 4. NOVAS MÉTRICAS DE STOCK E PROJEÇÃO DE LUCRO
+    invested_stock_cost = 0
+    estimated_stock_profit = 0
+
+    for o in orders:
+        if o['status'] in ['shipping', 'stock']:
+
+            cost_initial = (o['price'] or 0) + (o['deliver_tax'] or 0)
+            invested_stock_cost += cost_initial
+
+            if o['status'] == 'shipping':
+                estimated_profit_item = cost_initial * multiplicador
+                estimated_stock_profit += estimated_profit_item
+
+            elif o['status'] == 'stock':
+                post = next((p for p in posts if p['order_id'] == o['order_id']), None)
+
+                if post and post['first_price'] is not None:
+                    announced_price = post['first_price']
+                    ad_tax_cost = (post['ad_tax'] or 0)
+                    total_cost_with_ad = cost_initial + ad_tax_cost
+                    estimated_profit_item = announced_price - total_cost_with_ad
+                    estimated_stock_profit += estimated_profit_item
+                else:
+                    estimated_profit_item = cost_initial * multiplicador
+                    estimated_stock_profit += estimated_profit_item
+
+    return {
+        'faturacao': faturacao,
+        'gastos': gastos_totais,
+        'lucro': lucro_total,
+        'multiplicador': multiplicador,
+        'encomendas_stock': count_stock,
+        'encomendas_chegar': count_chegar,
+        'encomendas_vendidas': count_vendidas,
+        'dias_fim_stock': dias_fim_stock,
+        'invested_stock_cost': invested_stock_cost,
+        'estimated_stock_profit': estimated_stock_profit,
+    }
+
+
+def reference_with_stats(orders, posts, sales_data, stats):
+    """A original com a projeção por grupo: mediana e ROI do grupo com MIN_SAMPLES vendas."""
+    expected = reference_metrics(orders, posts, sales_data)
+    multiplicador = expected['multiplicador']
+    total_dias_venda = valid_sales = 0
+    for p in posts:
+        if p['status'] == 'sold' and p.get('days_to_sale'):
+            total_dias_venda += p['days_to_sale']
+            valid_sales += 1
+    tempo_venda_medio = (total_dias_venda / valid_sales) if valid_sales > 0 else 60
+
+    dias_grupos = sem_mediana = 0
+    estimated_stock_profit = 0
+    for o in orders:
+        if o['status'] not in ['shipping', 'stock']:
+            continue
+        group = stats.get((o['brand_id'], o['product_id'], o['size_id']))
+        if group is not None and group['days_count'] >= read_models.MIN_SAMPLES:
+            dias_grupos += group['days_median']
+        else:
+            sem_mediana += 1
+        roi = multiplicador
+        if group is not None and group['units_sold'] >= read_models.MIN_SAMPLES and group['cost'] > 0:
+            roi = (group['revenue'] - group['cost']) / group['cost']
+
+        cost_initial = (o['price'] or 0) + (o['deliver_tax'] or 0)
+        post = next((p for p in posts if p['order_id'] == o['order_id']), None)
+        if o['status'] == 'stock' and post and post['first_price'] is not None:
+            estimated_stock_profit += post['first_price'] - (cost_initial + (post['ad_tax'] or 0))
+        else:
+            estimated_stock_profit += cost_initial * roi
+
+    if expected['encomendas_stock'] + expected['encomendas_chegar'] > 0:
+        dias_stock = dias_grupos + sem_mediana * tempo_venda_medio
+        expected['dias_fim_stock'] = dias_stock if dias_stock > 0 else 365
+    expected['estimated_stock_profit'] = estimated_stock_profit
+    return expected
+
+
+def _money(rng, nullable=False):
+    choice = rng.random()
+    if nullable and choice < 0.15:
+        return None
+    if choice < 0.5:
+        return rng.randint(0, 300)
+    return round(rng.uniform(0, 300), 2)
+
+
+def random_dataset(seed):
+    """Encomendas e posts (rows.py) de um utilizador: sem post, com um ou com vários por encomenda."""
+    rng = random.Random(seed)
+    orders, posts = [], []
+    for order_id in range(1, rng.randint(0, 40) + 1):
+        status = rng.choice(STATUSES)
+        brand_id, product_id, size_id = rng.randint(1, 3), rng.randint(1, 3), rng.randint(1, 2)
+        price, deliver_tax = _money(rng), _money(rng, nullable=True)
+        order_date, delivery_date = rng.choice(DATES), rng.choice(DATES)
+        orders.append(rows.OrderRow(
+            order_id, "Produto", "Marca", "Cor", "M", order_date, delivery_date, price, deliver_tax,
+            None, order_id, status, None, brand_id, product_id, size_id, today=TODAY))
+        for _ in range(rng.choice((0, 0, 1, 1, 1, 2, 3))):
+            posts.append(rows.PostRow(
+                len(posts) + 1, rng.choice(DATES), _money(rng, nullable=True), _money(rng, nullable=True),
+                _money(rng, nullable=True), rng.choice(DATES), 0, 0, 0, order_id, order_date,
+                delivery_date, price, deliver_tax, "Produto", "Marca", "Cor", "M", status, today=TODAY))
+    rng.shuffle(posts)
+    return orders, posts, rows.sales_from_posts(posts)
+
+
+def random_stats(seed):
+    """Estatísticas (linhas de sale_stats) para parte dos grupos, com e sem vendas suficientes."""
+    rng = random.Random(seed)
+    stats = {}
+    for key in ((b, p, s) for b in range(1, 4) for p in range(1, 4) for s in range(1, 3)):
+        if rng.random() < 0.6:
+            stats[key] = {"units_sold": rng.randint(0, 6), "days_count": rng.randint(0, 6),
+                          "days_median": rng.choice((rng.randint(0, 90), rng.uniform(0, 90), -3)),
+                          "revenue": _money(rng), "cost": rng.choice((0, _money(rng)))}
+    return stats
+
+
+def as_dicts(orders, posts, sales_data):
+    return ([o.to_dict() for o in orders], [p.to_dict() for p in posts], [s.to_dict() for s in sales_data])
+
+
+def assert_identical(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        assert type(actual[key]) is type(value), key
+        assert actual[key] == value, key
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_matches_original_implementation(seed):
+    data = random_dataset(seed)
+    expected = reference_metrics(*as_dicts(*data))
+    assert_identical(sales_app.calculate_user_metrics_from_data(*data), expected)
+    assert_identical(sales_app.calculate_user_metrics_from_data(*as_dicts(*data)), expected)
+    # Estatísticas sem vendas suficientes em nenhum grupo não mudam nada.
+    few = {key: dict(row, units_sold=min(row["units_sold"], 2), days_count=min(row["days_count"], 2))
+           for key, row in random_stats(seed).items()}
+    assert_identical(sales_app.calculate_user_metrics_from_data(*data, stats=few), expected)
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_group_statistics_projection(seed):
+    data = random_dataset(seed)
+    stats = random_stats(seed)
+    expected = reference_with_stats(*as_dicts(*data), stats)
+    assert_identical(sales_app.calculate_user_metrics_from_data(*data, stats=stats), expected)
+
+
+def test_matches_original_on_database_rows():
+    db = sales_app.db
+    for row in db.execute("SELECT id FROM users"):
+        data = sales_app.get_user_data(row["id"], include_archive=True)
+        expected = reference_metrics(*as_dicts(*data))
+        assert_identical(sales_app.calculate_user_metrics_from_data(*data), expected)
+    db.release()
@@ -0,0 +1,76 @@
+"""Migrações: versão registada, planos das consultas críticas sem SCAN e arranque sem escritas."""
+import hashlib
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import migrations
+import synthetic
+from conftest import ROOT
+
+TRACKED_DB = os.path.join(ROOT, "sales.db")
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    """Base de dados vazia só com o esquema base (o do sales.db do repositório)."""
+    path = str(tmp_path / "fresh.db")
+    conn = sqlite3.connect(path)
+    for statement in synthetic._base_schema(TRACKED_DB):
+        conn.execute(statement)
+    conn.close()
+    return path
+
+
+def _hot_query_scans(path):
+    conn = migrations.connect(path)
+    try:
+        return [
+            (migration["version"], detail)
+            for migration in migrations.MIGRATIONS
+            for sql, params, tables in migration["checks"]
+            for detail in migrations.plan_scans(conn, sql, params, tables)
+        ]
+    finally:
+        conn.close()
+
+
+def test_fresh_database_reaches_latest_version(fresh_db):
+    assert migrations.pending(fresh_db) == [m["version"] for m in migrations.MIGRATIONS]
+    assert migrations.migrate(fresh_db) == [m["version"] for m in migrations.MIGRATIONS]
+
+    conn = migrations.connect(fresh_db)
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    conn.close()
+    assert migrations.pending(fresh_db) == []
+    assert migrations.migrate(fresh_db) == []
+
+
+def test_hot_queries_do_not_scan(fresh_db):
+    migrations.migrate(fresh_db)
+    assert _hot_query_scans(fresh_db) == []
+    assert migrations.check(fresh_db) == []
+
+
+def test_hot_queries_do_not_scan_with_data():
+    assert _hot_query_scans(os.environ["SALES_DB"]) == []
+
+
+def test_importing_the_app_does_not_touch_the_database(tmp_path):
+    path = str(tmp_path / "sales.db")
+    shutil.copy(TRACKED_DB, path)
+    with open(path, "rb") as f:
+        before = hashlib.sha256(f.read()).hexdigest()
+
+    env = dict(os.environ, SALES_DB=path)
+    env.pop("SALES_MIGRATE", None)
+    subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, env=env, check=True,
+                   capture_output=True)
+
+    with open(path, "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == before
+    assert migrations.pending(path) == [m["version"] for m in migrations.MIGRATIONS]
@@ -0,0 +1,83 @@
+"""Paginação por keyset: cursores e limites das páginas das tabelas do dashboard."""
+import pytest
+
+import app as sales_app
+import pagination
+
+USER_ID = 1
+
+
+@pytest.mark.parametrize("sort_key, row_id", [
+    ("2025-01-01", 7), (12.5, 1), (0, 2 ** 40 + 3), ("", 4), ("Calças / Nike", 5), (None, 6),
+])
+def test_cursor_round_trip(sort_key, row_id):
+    token = pagination.encode_cursor(sort_key, row_id)
+    assert "=" not in token and "/" not in token and "+" not in token
+    assert pagination.decode_cursor(token) == (sort_key, row_id)
+
+
+@pytest.mark.parametrize("token", [
+    None, "", "abc", "!!!", pagination.encode_cursor([1], 2), pagination.encode_cursor("x", "2"),
+    pagination.encode_cursor("x", 2.5),
+])
+def test_invalid_cursors_are_ignored(token):
+    assert pagination.decode_cursor(token) is None
+
+
+def _page(table, **args):
+    with sales_app.app.test_request_context("/"):
+        return sales_app.get_table_page(table, USER_ID, args)
+
+
+def _ids(page, table):
+    key = sales_app.PAGED_TABLES[table]["id"][1]
+    return [row[key] for row in page["rows"]]
+
+
+def _expected(table, sort, descending):
+    """Todas as linhas pela ordem (chave, id) calculada em Python."""
+    config = sales_app.PAGED_TABLES[table]
+    id_key = config["id"][1]
+    sql = config["query"].format(sort_key=f"{config['sorts'][sort]} AS sort_key,")
+    found = sales_app.db.execute(sql, USER_ID)
+    found.sort(key=lambda row: (row["sort_key"], row[id_key]), reverse=descending)
+    return [row[id_key] for row in found]
+
+
+CASES = [(table, sort, direction)
+         for table, config in sales_app.PAGED_TABLES.items()
+         for sort in config["sorts"] for direction in ("desc", "asc")]
+
+
+@pytest.mark.parametrize("table, sort, direction", CASES)
+def test_pages_cover_every_row_once(table, sort, direction):
+    expected = _expected(table, sort, direction == "desc")
+    assert len(expected) > pagination.PAGE_SIZE
+    args = {f"{table}_sort": sort, f"{table}_dir": direction}
+
+    pages, page = [], _page(table, **args)
+    assert page["prev_cursor"] is None
+    while True:
+        pages.append(_ids(page, table))
+        assert len(pages[-1]) <= pagination.PAGE_SIZE
+        if page["next_cursor"] is None:
+            break
+        page = _page(table, **args, **{f"{table}_after": page["next_cursor"]})
+    assert sum(pages, []) == expected
+    assert all(len(ids) == pagination.PAGE_SIZE for ids in pages[:-1])
+
+    # A recuar a partir da última página voltam as mesmas páginas.
+    back = []
+    while page["prev_cursor"] is not None:
+        page = _page(table, **args, **{f"{table}_before": page["prev_cursor"]})
+        back.append(_ids(page, table))
+        assert page["next_cursor"] is not None
+    assert back == pages[-2::-1]
+    sales_app.db.release()
+
+
+def test_invalid_cursor_returns_the_first_page():
+    first = _page("orders")
+    assert _ids(_page("orders", orders_after="lixo"), "orders") == _ids(first, "orders")
+    assert _page("orders", orders_sort="price; DROP TABLE orders")["sort"] == "order_date"
+    sales_app.db.release()
@@ -0,0 +1,149 @@
+"""
+Linhas compactas (rows.py) comparadas com os dicts que get_user_data() construía antes:
+os mesmos campos, pela mesma ordem, com os mesmos valores e tipos.
+"""
+import random
+from datetime import date
+
+import pytest
+
+import app as sales_app
+import archive
+import rows
+from helpers import calculate_days_diff, format_date_pt
+
+TODAY = date(2026, 1, 1)
+DATES = ("2025-03-01", "2025-06-15", "2025-12-31", "2024-02-29", None, "", "2025-02-30", "ontem")
+STATUSES = ("shipping", "stock", "sold", None, "cancelled")
+
+
+def reference_orders(orders, today):
+    """prepare_orders() original."""
+    for o in orders:
+        if o['delivery_date']:
+            o['days_to_delivery'] = calculate_days_diff(o['order_date'], o['delivery_date'])
+            o['days_since_order'] = None
+        else:
+            o['days_to_delivery'] = None
+            o['days_since_order'] = calculate_days_diff(o['order_date'], None, today)
+        o['order_date'] = format_date_pt(o['order_date'])
+        o['delivery_date'] = format_date_pt(o['delivery_date'])
+        o['total_cost'] = (o['price'] or 0) + (o['deliver_tax'] or 0)
+    return orders
+
+
+def reference_posts(posts, today):
+    """prepare_posts() original."""
+    for p in posts:
+        if p['status'] == 'sold' and p['sell_date']:
+            p['days_to_sale'] = calculate_days_diff(p['post_date'], p['sell_date'])
+            p['days_since_post'] = None
+        else:
+            p['days_to_sale'] = None
+            p['days_since_post'] = calculate_days_diff(p['post_date'], None, today)
+        p['post_date'] = format_date_pt(p['post_date'])
+        p['sell_date'] = format_date_pt(p['sell_date'])
+    return posts
+
+
+def reference_sales(posts):
+    """sales_from_posts() original (posts com as datas ainda em YYYY-MM-DD)."""
+    sales_data = []
+    for p in posts:
+        if p['status'] == 'sold' and p['sell_price'] is not None and p['sell_date'] is not None:
+            total_gastos = (p['order_price'] or 0) + (p['order_deliver_tax'] or 0) + (p['ad_tax'] or 0)
+            lucro = (p['sell_price'] or 0) - total_gastos
+            tempo_total = calculate_days_diff(p['order_date'], p['sell_date'])
+            sales_data.append({
+                'product_info': f"{p['product_name']} / {p['brand_name']}",
+                'brand_name': p['brand_name'],
+                'size_name': p['size_name'],
+                'color_name': p['color_name'],
+                'total_gastos': total_gastos,
+                'ad_tax': p['ad_tax'] or 0,
+                'sell_price': p['sell_price'],
+                'lucro': lucro,
+                'sell_date': format_date_pt(p['sell_date']),
+                'days_to_sale_total': tempo_total,
+                'tempo_total': tempo_total,
+                'post_id': p['post_id'],
+            })
+    return sales_data
+
+
+def reference(order_dicts, post_dicts, today):
+    orders = reference_orders([dict(o) for o in order_dicts], today)
+    posts = [dict(p) for p in post_dicts]
+    sales_data = reference_sales(posts)
+    return orders, reference_posts(posts, today), sales_data
+
+
+def _money(rng):
+    return rng.choice((None, 0, rng.randint(1, 300), round(rng.uniform(0, 300), 2)))
+
+
+def random_rows(seed):
+    """Linhas (dicts) com as colunas de ORDERS_QUERY e POSTS_QUERY, com datas e valores em falta."""
+    rng = random.Random(seed)
+    orders, posts = [], []
+    for order_id in range(1, 30):
+        order = dict(zip(rows.OrderRow.COLUMNS, (
+            order_id, "Produto", "Marca", "Cor", "M", rng.choice(DATES), rng.choice(DATES),
+            _money(rng), _money(rng), None, order_id, rng.choice(STATUSES), None, 1, 2, 3)))
+        orders.append(order)
+        for post_id in range(rng.randint(0, 2)):
+            posts.append(dict(zip(rows.PostRow.COLUMNS, (
+                len(posts) + 1, rng.choice(DATES), _money(rng), _money(rng), _money(rng),
+                rng.choice(DATES), 1, 2, 3, order_id, order["order_date"], order["delivery_date"],
+                order["price"], order["deliver_tax"], "Produto", "Marca", "Cor", "M", order["status"]))))
+    return orders, posts
+
+
+def assert_same(row_objects, dicts):
+    assert len(row_objects) == len(dicts)
+    for row, expected in zip(row_objects, dicts):
+        actual = row.to_dict()
+        assert list(actual) == list(expected)
+        for key, value in expected.items():
+            assert type(actual[key]) is type(value), key
+            assert actual[key] == value, key
+            assert row[key] == row.get(key) == getattr(row, key) == value, key
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_rows_match_dict_pipeline(seed):
+    order_dicts, post_dicts = random_rows(seed)
+    orders = rows.orders_from_dicts(order_dicts, today=TODAY)
+    posts = rows.posts_from_dicts(post_dicts, today=TODAY)
+    expected = reference(order_dicts, post_dicts, TODAY)
+    assert_same(orders, expected[0])
+    assert_same(posts, expected[1])
+    assert_same(rows.sales_from_posts(posts), expected[2])
+
+
+def test_rows_match_dict_pipeline_on_database():
+    db = sales_app.db
+    for user in db.execute("SELECT id FROM users"):
+        orders_sql = archive.full_history(
+            sales_app.ORDERS_QUERY.format(sort_key="") + " ORDER BY orders.order_date DESC")
+        posts_sql = archive.full_history(
+            sales_app.POSTS_QUERY.format(sort_key="") + " ORDER BY posts.post_date DESC")
+        expected = reference(db.execute(orders_sql, user["id"]), db.execute(posts_sql, user["id"]), TODAY)
+        with sales_app.app.test_request_context("/"):
+            sales_app.g.today = TODAY
+            actual = sales_app.get_user_data(user["id"], include_archive=True)
+        for row_objects, dicts in zip(actual, expected):
+            assert_same(row_objects, dicts)
+    db.release()
+
+
+def test_rows_behave_like_read_only_dicts():
+    order = rows.OrderRow(1, "Produto", "Marca", "Cor", "M", "2025-01-01", None, 10, None, None,
+                          5, "shipping", None, today=TODAY)
+    assert "days_since_order" in order and "nome" not in order
+    assert order.get("nome", "x") == "x"
+    assert list(order.keys()) == list(rows.OrderRow.KEYS)
+    with pytest.raises(KeyError):
+        order["nome"]
+    assert not hasattr(order, "__dict__")
+    assert order["days_since_order"] == 365
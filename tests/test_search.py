@@ -0,0 +1,127 @@
+"""Pesquisa: interpretação do texto, índice FTS5 mantido por triggers, keyset, facetas e arquivo."""
+import pytest
+
+import app as sales_app
+import archive
+import search
+
+USER_ID = 4
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Nike, tamanho 42, preto, por vender", (["nike", "42", "preto"], ("shipping", "stock"))),
+    ("Vendidos Adidas", (["adidas"], ("sold",))),
+    ("casaco a caminho", (["casaco"], ("shipping",))),
+    ("Não vendida em stock", ([], ("shipping", "stock"))),
+    ('"Air Max" "air" vendido', (["air", "max"], ("sold",))),
+    ("cor preto e marca Nike", (["preto", "nike"], None)),
+    ("", ([], None)),
+    (None, ([], None)),
+])
+def test_parse_query(text, expected):
+    assert search.parse_query(text) == expected
+
+
+def test_match_expression_quotes_terms():
+    assert search.match_expression(3, ['a"b']) == (
+        'owner : "u3" AND {product brand color size} : "a""b"*')
+
+
+def _product(db, name):
+    return db.execute("INSERT INTO products (name) VALUES (?)", name)
+
+
+def _add_sale(db, product_id, status="stock", order_date="2025-06-01"):
+    order_id = db.execute("""
+        INSERT INTO orders (product_id, brand_id, size_id, color_id, price, deliver_tax, order_date)
+        VALUES (?, 1, 1, 1, 10, 0, ?)
+    """, product_id, order_date)
+    return db.execute("INSERT INTO sales (order_id, user_id, status) VALUES (?, ?, ?)",
+                      order_id, USER_ID, status)
+
+
+def _found(db, text, **kwargs):
+    return [row["sale_id"] for row in search.search(db, USER_ID, text, **kwargs)["rows"]]
+
+
+def test_triggers_keep_the_index_in_sync():
+    db = sales_app.db
+    with db.transaction():
+        product_id = _product(db, "Zorblax")
+        sale_id = _add_sale(db, product_id)
+    assert _found(db, "zorb") == [sale_id]
+    assert search.search(db, USER_ID + 1, "zorblax")["rows"] == []
+
+    # Renomear o produto reindexa a venda.
+    db.execute("UPDATE products SET name = 'Quimbix' WHERE id = ?", product_id)
+    assert _found(db, "zorblax") == []
+    assert _found(db, "quimbix") == [sale_id]
+
+    # Trocar o produto da encomenda e o dono da venda também.
+    other = _product(db, "Wexlor")
+    db.execute("UPDATE orders SET product_id = ? WHERE id = (SELECT order_id FROM sales WHERE id = ?)",
+               other, sale_id)
+    assert _found(db, "quimbix") == [] and _found(db, "wexlor") == [sale_id]
+    db.execute("UPDATE sales SET user_id = ? WHERE id = ?", USER_ID + 1, sale_id)
+    assert _found(db, "wexlor") == []
+    assert [row["sale_id"] for row in search.search(db, USER_ID + 1, "wexlor")["rows"]] == [sale_id]
+
+    db.execute("DELETE FROM sales WHERE id = ?", sale_id)
+    assert db.execute("SELECT COUNT(*) AS n FROM search_index WHERE rowid = ?", sale_id)[0]["n"] == 0
+    db.release()
+
+
+def test_keyset_pages_and_facets():
+    db = sales_app.db
+    with db.transaction():
+        product_id = _product(db, "Plumbus")
+        for day, status in enumerate(["stock", "sold", "shipping", "stock", "sold", "stock", "stock"], 1):
+            _add_sale(db, product_id, status, f"2025-07-0{day}")
+
+    everything = search.search(db, USER_ID, "plumbus", limit=100)
+    assert len(everything["rows"]) == 7 and everything["next_cursor"] is None
+    assert everything["facets"] == {"status": {"sold": 2, "shipping": 1, "stock": 4}}
+
+    pages, cursor = [], None
+    while True:
+        page = search.search(db, USER_ID, "plumbus", limit=3, after=cursor)
+        pages.append([row["sale_id"] for row in page["rows"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert [len(ids) for ids in pages] == [3, 3, 1]
+    assert sum(pages, []) == [row["sale_id"] for row in everything["rows"]]
+    back = search.search(db, USER_ID, "plumbus", limit=3, before=page["prev_cursor"])
+    assert [row["sale_id"] for row in back["rows"]] == pages[1]
+
+    # O estado filtra as linhas mas não as facetas; o texto "por vender" equivale a stock+shipping.
+    unsold = search.search(db, USER_ID, "plumbus por vender", limit=100)
+    assert unsold["statuses"] == ["shipping", "stock"] and len(unsold["rows"]) == 5
+    assert unsold["facets"] == everything["facets"]
+    dated = search.search(db, USER_ID, "plumbus", date_from="2025-07-03", date_to="2025-07-05", limit=100)
+    assert [row["order_date"] for row in dated["rows"]] == ["2025-07-05", "2025-07-04", "2025-07-03"]
+    with pytest.raises(ValueError):
+        search.search(db, USER_ID, "plumbus", sort="likes")
+    db.release()
+
+
+def test_archived_sales_are_not_searchable():
+    db = sales_app.db
+    client = sales_app.app.test_client()
+    with db.transaction():
+        product_id = _product(db, "Fleeb")
+    client.post("/add_order", data={"user_id": USER_ID, "product_id": product_id, "brand_id": 1,
+                                    "size_id": 1, "color_id": 1, "price": 10,
+                                    "order_date": "2000-02-01", "delivery_date": "2000-02-02"})
+    order_id = db.execute("SELECT MAX(id) AS id FROM orders")[0]["id"]
+    client.post("/add_post", data={"user_id": USER_ID, "order_id": order_id, "first_price": 20,
+                                   "post_date": "2000-02-03", "sell_date": "2000-02-10", "sell_price": 30})
+    sale_id = db.execute("SELECT id FROM sales WHERE order_id = ?", order_id)[0]["id"]
+    assert _found(db, "fleeb") == [sale_id]
+
+    assert archive.archive_sold(db, "2001-01-01") >= 1
+    assert _found(db, "fleeb") == []
+    assert db.execute("SELECT COUNT(*) AS n FROM search_index WHERE rowid = ?", sale_id)[0]["n"] == 0
+    # A venda continua no histórico completo.
+    assert db.execute(archive.full_history("SELECT id FROM sales WHERE id = ?"), sale_id)
+    db.release()
@@ -0,0 +1,65 @@
+"""Sessões preguiçosas: nenhuma sessão para leituras anónimas, só para as mensagens de flash."""
+import pytest
+
+import app as sales_app
+import sessions
+
+COOKIE = sales_app.app.config["SESSION_COOKIE_NAME"]
+
+
+@pytest.fixture
+def client():
+    yield sales_app.app.test_client()
+    sales_app.db.release()
+
+
+def _stored():
+    return sales_app.catalog_db.execute("SELECT COUNT(*) AS n FROM sessions")[0]["n"]
+
+
+def test_anonymous_reads_do_not_create_sessions(client):
+    before = _stored()
+    for path in ("/", "/?user_id=1", "/leaderboard", "/api/users/1/orders"):
+        response = client.get(path)
+        assert response.status_code == 200, path
+        assert "Set-Cookie" not in response.headers, path
+    assert client.get_cookie(COOKIE) is None
+    assert _stored() == before
+
+
+def test_flash_creates_and_then_drops_the_session(client):
+    before = _stored()
+    response = client.post("/add_order", data={"user_id": 1})
+    assert response.status_code == 302
+    assert client.get_cookie(COOKIE) is not None
+    assert _stored() == before + 1
+
+    page = client.get(response.headers["Location"])
+    assert "Todos os campos obrigatórios do pedido".encode() in page.data
+    assert client.get_cookie(COOKIE) is None
+    assert _stored() == before
+
+    # A mensagem foi consumida: o pedido seguinte já não a mostra nem cria sessão.
+    again = client.get(response.headers["Location"])
+    assert "Todos os campos obrigatórios do pedido".encode() not in again.data
+    assert "Set-Cookie" not in again.headers
+
+
+def test_unknown_session_cookie_is_cleared_without_storing(client):
+    before = _stored()
+    client.set_cookie(COOKIE, "desconhecida")
+    response = client.get("/")
+    assert COOKIE in response.headers["Set-Cookie"]
+    assert client.get_cookie(COOKIE) is None
+    assert _stored() == before
+
+
+def test_memory_store_expires_sessions():
+    store = sessions.MemoryStore(gc_interval=10)
+    store.save("a", {"x": 1}, expires_at=100, now=0)
+    assert store.load("a", now=50) == {"x": 1}
+    assert store.load("a", now=100) is None
+    store.save("b", {"y": 2}, expires_at=300, now=200)
+    assert "a" not in store._sessions and store.load("b", now=250) == {"y": 2}
+    store.delete("b")
+    assert store.load("b", now=250) is None
@@ -0,0 +1,120 @@
+"""Modo particionado: divisão em shards, encaminhamento por utilizador, ids e réplicas das lookups."""
+import os
+import sqlite3
+from datetime import date
+
+import pytest
+from click.testing import CliRunner
+
+import sharding
+import synthetic
+from conftest import ROOT
+
+USERS = 4
+
+
+@pytest.fixture(scope="module")
+def shard_dir(tmp_path_factory):
+    base = tmp_path_factory.mktemp("shards")
+    source = str(base / "source.db")
+    synthetic.generate(source, users=USERS, orders=200, seed=11,
+                       schema_from=os.path.join(ROOT, "sales.db"), today=date(2026, 1, 1))
+    directory = str(base / "shards")
+    result = CliRunner().invoke(sharding.cli, ["split", source, directory, "--shards", "2"])
+    assert result.exit_code == 0, result.output
+    return source, directory
+
+
+@pytest.fixture
+def router(shard_dir):
+    router = sharding.ShardRouter(shard_dir[1])
+    yield router
+    router.close()
+
+
+def _count(path, sql, *args):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql, args).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_split_moves_each_user_to_its_shard(shard_dir):
+    source, directory = shard_dir
+    paths = sharding.paths(directory)
+    assert [os.path.basename(p) for p in paths] == ["catalog.db", "shard-000.db", "shard-001.db"]
+    for index, path in enumerate(paths[1:]):
+        assert _count(path, "SELECT COUNT(*) FROM sales WHERE user_id % 2 <> ?", index) == 0
+        assert _count(path, "SELECT COUNT(*) FROM users WHERE id % 2 <> ?", index) == 0
+    total = sum(_count(path, "SELECT COUNT(*) FROM sales") for path in paths[1:])
+    assert total == _count(source, "SELECT COUNT(*) FROM sales")
+
+
+def _add_order(user_id):
+    def fn(db):
+        order_id = db.execute("""
+            INSERT INTO orders (product_id, brand_id, size_id, color_id, price, deliver_tax, order_date)
+            VALUES (1, 1, 1, 1, 10, 0, '2026-01-01')
+        """)
+        sale_id = db.execute("INSERT INTO sales (order_id, user_id, status) VALUES (?, ?, 'shipping')",
+                             order_id, user_id)
+        return order_id, sale_id
+    return fn
+
+
+def test_writes_on_each_shard_never_collide(shard_dir, router):
+    source = shard_dir[0]
+    ids = {}
+    for user_id in (1, 2, 3, 4):
+        with router.using(user_id):
+            ids[user_id] = [router.write(_add_order(user_id)) for _ in range(3)]
+        router.release()
+
+    orders = [order_id for pairs in ids.values() for order_id, _ in pairs]
+    sales = [sale_id for pairs in ids.values() for _, sale_id in pairs]
+    assert len(set(orders)) == len(orders) and len(set(sales)) == len(sales)
+    # Shard 0 continua depois do maior id original; o shard 1 parte de ID_STRIDE.
+    source_max = _count(source, "SELECT MAX(id) FROM orders")
+    for user_id, pairs in ids.items():
+        for order_id, _ in pairs:
+            if user_id % 2:
+                assert order_id > sharding.ID_STRIDE
+            else:
+                assert source_max < order_id < sharding.ID_STRIDE
+
+    # Leituras encaminhadas: cada utilizador vê as suas encomendas no seu shard e só lá.
+    paths = sharding.paths(shard_dir[1])[1:]
+    for user_id, pairs in ids.items():
+        with router.using(user_id):
+            found = {row["order_id"] for row in router.execute(
+                "SELECT order_id FROM sales WHERE user_id = ?", user_id)}
+        router.release()
+        assert {order_id for order_id, _ in pairs} <= found
+        other = paths[1 - user_id % 2]
+        assert _count(other, "SELECT COUNT(*) FROM sales WHERE user_id = ?", user_id) == 0
+
+
+def test_queries_need_a_routed_user(router):
+    with pytest.raises(sharding.ShardingError):
+        router.execute("SELECT 1")
+    with pytest.raises(sharding.ShardingError):
+        router.route("abc")
+
+
+def test_lookup_change_reaches_every_replica(shard_dir, router):
+    # Réplicas sincronizadas antes da alteração: a mudança de lookup_version força nova cópia.
+    for user_id in (1, 2):
+        router.route(user_id)
+    router.release()
+    router.catalog.execute("UPDATE brands SET name = 'Marca renomeada' WHERE id = 1")
+    brand_id = router.catalog.execute("INSERT INTO brands (name) VALUES ('Marca nova')")
+
+    for user_id in (1, 2):
+        with router.using(user_id):
+            names = {row["id"]: row["name"] for row in router.execute("SELECT id, name FROM brands")}
+        router.release()
+        assert names[1] == "Marca renomeada"
+        assert names[brand_id] == "Marca nova"
+    for path in sharding.paths(shard_dir[1])[1:]:
+        assert _count(path, "SELECT COUNT(*) FROM brands WHERE name = 'Marca nova'") == 1